@@ -61,6 +61,6 @@ setuptools.setup(
         ]
     },
     package_data={
-        "sparv": ["core/Snakefile", "resources/config/*", "resources/config/presets/*"]
+        "sparv": ["core/Snakefile", "resources/config/*", "resources/config/presets/*", "util/tagsets/*.json"]
     }
 )
@@ -1,8 +1,8 @@
 """Main Sparv package."""
 from sparv.core.registry import annotator, exporter, importer, installer, modelbuilder, wizard
 from sparv.util.classes import (AllDocuments, Annotation, AnnotationAllDocs, AnnotationCommonData, AnnotationData,
-                                AnnotationDataAllDocs, Binary, BinaryDir, Config, Corpus, Document, Export,
-                                ExportAnnotations, ExportInput, Headers, Language, Model, ModelOutput, Output,
+                                AnnotationDataAllDocs, Binary, BinaryDir, Config, Corpus, Document, DocumentChunks,
+                                Export, ExportAnnotations, ExportInput, Headers, Language, Model, ModelOutput, Output,
                                 OutputAllDocs, OutputCommonData, OutputData, OutputDataAllDocs, Source,
                                 SourceAnnotations, SourceStructure, SourceStructureParser, Text, Wildcard)
 
@@ -27,6 +27,7 @@ __all__ = [
     "Config",
     "Corpus",
     "Document",
+    "DocumentChunks",
     "Export",
     "ExportAnnotations",
     "ExportInput",
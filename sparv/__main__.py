@@ -1,6 +1,7 @@
 """Main Sparv executable."""
 
 import argparse
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -8,7 +9,7 @@ import snakemake
 from snakemake.logging import logger
 
 from sparv import __version__
-from sparv.core import log_handler, paths, setup
+from sparv.core import log_handler, paths, planner, setup
 from sparv.core.paths import sparv_path
 
 # Check Python version
@@ -89,6 +90,7 @@ def main():
         "   run-rule         Run specified rule(s) for creating annotations",
         "   create-file      Create specified file(s)",
         "   run-module       Run annotator module independently",
+        "   profile-report   Summarize profiles created with the '--profile' option",
         "",
         "See 'sparv <command> -h' for help with a specific command",
         "For full documentation, visit https://spraakbanken.gu.se/sparv/docs/"
@@ -101,6 +103,9 @@ def main():
     run_parser = subparsers.add_parser("run", description="Annotate a corpus and generate export files.")
     run_parser.add_argument("output", nargs="*", default=[], help="The type of output format to generate")
     run_parser.add_argument("-l", "--list", action="store_true", help="List available output formats")
+    run_parser.add_argument("--gc", action="store_true",
+                            help="Remove intermediate annotations as soon as they are no longer needed, keeping only "
+                                 "the ones used by exporters and installers")
 
     install_parser = subparsers.add_parser("install", description="Install a corpus.")
     install_parser.add_argument("type", nargs="*", default=[], help="The type of installation to perform")
@@ -111,6 +116,9 @@ def main():
     clean_parser.add_argument("--export", action="store_true", help="Remove export directory")
     clean_parser.add_argument("--logs", action="store_true", help="Remove logs directory")
     clean_parser.add_argument("--all", action="store_true", help="Remove workdir, export and logs directories")
+    clean_parser.add_argument("--intermediate", action="store_true",
+                              help="Only remove intermediate annotations from the workdir, i.e. the ones not used by "
+                                   "any exporter or installer")
 
     # Inspect
     config_parser = subparsers.add_parser("config", description="Display the corpus configuration.")
@@ -162,13 +170,34 @@ def main():
     createfile_parser.add_argument("targets", nargs="*", default=["list"], help="File(s) to create")
     createfile_parser.add_argument("-l", "--list", action="store_true", help="List available files that can be created")
 
+    profilereport_parser = subparsers.add_parser("profile-report",
+                                                 description="Merge the profiles created with the '--profile' option "
+                                                             "and print the top functions per rule.")
+    profilereport_parser.add_argument("rules", nargs="*", default=[],
+                                      help="Only report specified rule(s) or module(s)")
+    profilereport_parser.add_argument("--top", type=int, metavar="N", default=20,
+                                      help="Number of functions to show per rule (default: 20)")
+    profilereport_parser.add_argument("--sort", default="cumulative", choices=["cumulative", "tottime", "ncalls"],
+                                      help="Sort order for cProfile profiles (default: 'cumulative')")
+
     # Add common arguments
     for subparser in [run_parser, install_parser, models_parser, runrule_parser, createfile_parser]:
         subparser.add_argument("-n", "--dry-run", action="store_true", help="Only dry-run the workflow")
         subparser.add_argument("-j", "--cores", type=int, metavar="N", help="Use at most N cores in parallel",
                                default=1)
+        subparser.add_argument("--memory", metavar="SIZE",
+                               help="Limit the total memory used by jobs running in parallel, e.g. '64G'")
     for subparser in [run_parser, runrule_parser]:
         subparser.add_argument("-d", "--doc", nargs="+", default=[], help="Only annotate specified input document(s)")
+    for subparser in [run_parser, runrule_parser, createfile_parser]:
+        subparser.add_argument("--profile", nargs="+", default=[], metavar="RULE",
+                               help="Profile specified rule(s) or module(s), or 'all'. Profiles are saved in the "
+                                    "logs directory")
+        subparser.add_argument("--profile-doc", nargs="+", default=[], metavar="DOC",
+                               help="Only profile specified input document(s)")
+        subparser.add_argument("--profiler", default="cprofile", choices=["cprofile", "sampling"],
+                               help="Use cProfile (default) or a sampling profiler producing collapsed stacks "
+                                    "for flame graphs")
     for subparser in [run_parser, runrule_parser, createfile_parser, models_parser, install_parser]:
         subparser.add_argument("--log", metavar="LOGLEVEL", const="info", help="Set the log level (default: 'warning')",
                                nargs="?", choices=["debug", "info", "warning", "error", "critical"])
@@ -176,6 +205,8 @@ def main():
                                help="Set log level for logging to file (default: 'warning')",
                                nargs="?", choices=["debug", "info", "warning", "error", "critical"])
         subparser.add_argument("--debug", action="store_true", help="Show debug messages")
+        subparser.add_argument("--stats", action="store_true",
+                               help="Show a summary of time and memory usage per rule when finished")
 
     # Backward compatibility
     if len(sys.argv) > 1 and sys.argv[1] == "make":
@@ -193,7 +224,7 @@ def main():
     else:
         args = parser.parse_args()
 
-    if args.command not in ("setup",):
+    if args.command not in ("setup", "profile-report"):
         # Make sure that Sparv data dir is set
         if not paths.get_data_path():
             print(f"The path to Sparv's data directory needs to be configured, either by running 'sparv setup' or by "
@@ -214,6 +245,10 @@ def main():
     if args.command == "setup":
         setup.run(args.dir)
         sys.exit(0)
+    elif args.command == "profile-report":
+        from sparv.core import profiler
+        profiler.report(Path(args.dir or Path.cwd(), paths.log_dir), args.rules, top=args.top, sort=args.sort)
+        sys.exit(0)
     elif args.command == "wizard":
         from sparv.core.wizard import Wizard
         wizard = Wizard()
@@ -231,6 +266,7 @@ def main():
     simple_target = False
     log_level = ""
     log_file_level = ""
+    show_stats = False
 
     if args.command in ("modules", "config", "files", "clean", "presets", "classes"):
         snakemake_args["targets"] = [args.command]
@@ -239,6 +275,7 @@ def main():
             config["export"] = args.export
             config["logs"] = args.logs
             config["all"] = args.all
+            config["intermediate"] = args.intermediate
         if args.command == "config" and args.options:
             config["options"] = args.options
         if args.command == "modules":
@@ -280,6 +317,7 @@ def main():
                 snakemake_args["targets"] = args.output
             else:
                 snakemake_args["targets"] = ["export_corpus"]
+            config["gc"] = args.gc
         # Command: install
         elif args.command == "install":
             if args.list:
@@ -301,7 +339,16 @@ def main():
         if args.command in ("run", "run-rule", "create-file", "build-models", "install"):
             log_level = args.log or "warning"
             log_file_level = args.log_to_file or "warning"
+            show_stats = args.stats
+            if vars(args).get("profile"):
+                config.update({"profile": args.profile,
+                               "profile_docs": args.profile_doc,
+                               "profiler": args.profiler})
+                # Make sure that explicitly named rules are run, even if their output is up to date
+                snakemake_args["forcerun"] = [r.replace("::", ":").replace(":", "::") for r in args.profile
+                                              if ":" in r]
             config.update({"debug": args.debug,
+                           "memory": args.memory,
                            "doc": vars(args).get("doc", []),
                            "log_level": log_level,
                            "log_file_level": log_file_level,
@@ -311,9 +358,19 @@ def main():
         # Force Snakemake to use threads to prevent unnecessary processes for simple targets
         snakemake_args["force_use_threads"] = True
 
+    # Split large source files into chunks first, since the documents to process depend on the result
+    if args.command in ("run", "run-rule", "create-file", "install") and not simple_target and not args.dry_run:
+        process = multiprocessing.Process(target=split_sources,
+                                          args=(args.dir, args.cores, config, log_level, log_file_level))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            sys.exit(1)
+
     # Disable Snakemake's default log handler and use our own
     logger.log_handler = []
-    progress = log_handler.LogHandler(progressbar=not simple_target, log_level=log_level, log_file_level=log_file_level)
+    progress = log_handler.LogHandler(progressbar=not simple_target, log_level=log_level, log_file_level=log_file_level,
+                                      show_stats=show_stats)
     snakemake_args["log_handler"] = [progress.log_handler]
 
     config["log_server"] = progress.log_server
@@ -321,11 +378,41 @@ def main():
     # Run Snakemake
     success = snakemake.snakemake(sparv_path / "core" / "Snakefile", config=config, **snakemake_args)
 
+    # Remember which documents are now complete, to leave them out of the workflow next time
+    if success and planner.current and not snakemake_args.get("dryrun"):
+        planner.current.save()
+
     progress.stop()
     progress.cleanup()
 
     sys.exit(0 if success else 1)
 
 
+def split_sources(corpus_dir, cores, config, log_level, log_file_level):
+    """Split source files larger than import.split_size into chunks, exiting with status 1 if it fails.
+
+    This is done by a Snakemake run of its own, as the rules of the actual run are created for the resulting documents.
+    Modules and config can only be loaded once per process, so it is meant to be run in a separate process.
+    """
+    from sparv.core import config as sparv_config
+    try:
+        sparv_config.load_config(Path(corpus_dir or Path.cwd(), paths.config_file))
+    except Exception:
+        # Leave it to the actual run to report problems with the config
+        sys.exit(0)
+    if not sparv_config.get("import.split_size"):
+        sys.exit(0)
+
+    logger.log_handler = []
+    progress = log_handler.LogHandler(progressbar=False, log_level=log_level, log_file_level=log_file_level)
+    config = dict(config, split_sources=True, log_server=progress.log_server)
+    success = snakemake.snakemake(sparv_path / "core" / "Snakefile", workdir=corpus_dir, cores=cores,
+                                  targets=["split_sources"], config=config, log_handler=[progress.log_handler],
+                                  force_use_threads=True)
+    progress.stop()
+    progress.cleanup()
+    sys.exit(0 if success else 1)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+"""Content-based up-to-date checks for Sparv jobs.
+
+Snakemake decides what to run by comparing modification times, so a job that rewrites an annotation file with identical
+contents makes every downstream job run again. For every finished job we therefore save a record with a content hash of
+each input file, together with a hash of the parameters and code of the job, and keep hard links to its outputs. When
+the job is scheduled again and none of these have changed, the actual work is skipped and the saved outputs are
+restored, cutting off the re-run at the first job whose output didn't change.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Optional
+
+from sparv import __version__
+from sparv.core import paths
+
+HASHES_DIR = "@hashes"
+SHARED_DIR = "@files"
+ALL_DOCS = "@all"
+
+
+def get_record_path(rule: str, doc: Optional[str] = None) -> Path:
+    """Get path to the file with saved hashes for a rule and document."""
+    return paths.work_dir / HASHES_DIR / (doc or ALL_DOCS) / f"{rule.replace('::', '.')}.json"
+
+
+def hash_file(path: str) -> str:
+    """Compute a hash of the contents of a file, or of the names and contents of all files in a directory."""
+    h = hashlib.blake2b(digest_size=16)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                file_path = os.path.join(root, filename)
+                h.update(os.path.relpath(file_path, path).encode("UTF-8"))
+                h.update(hash_file(file_path).encode("ascii"))
+    else:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def hash_shared_file(path: str, stat: list) -> str:
+    """Get hash of a file used by many jobs (like a model), computing it only once per version of the file.
+
+    The hash is saved in the hashes directory, keyed on the path, size and modification time of the file.
+    """
+    cache_path = paths.work_dir / HASHES_DIR / SHARED_DIR / hashlib.blake2b(
+        os.path.abspath(path).encode("UTF-8"), digest_size=16).hexdigest()
+    try:
+        size, mtime, file_hash = cache_path.read_text().split()
+        if [int(size), int(mtime)] == stat:
+            return file_hash
+    except (OSError, ValueError):
+        pass
+    file_hash = hash_file(path)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(f"{stat[0]} {stat[1]} {file_hash}")
+    os.replace(tmp_path, cache_path)
+    return file_hash
+
+
+def hash_job(rule: str, function, parameters: dict) -> str:
+    """Compute a hash identifying the parameters and code of a job."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{__version__}\n{rule}\n".encode("UTF-8"))
+    # Remove memory addresses from the string representations of objects
+    h.update(re.sub(r" at 0x[0-9a-fA-F]+", "", repr(sorted(parameters.items()))).encode("UTF-8"))
+    try:
+        h.update(hash_file(inspect.getsourcefile(function)).encode("ascii"))
+    except (TypeError, OSError):
+        pass
+    return h.hexdigest()
+
+
+def _stat(path: str) -> list:
+    """Get size and modification time of a file."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class JobRecord:
+    """Hashes of the inputs of a job, used for deciding whether the job needs to be run."""
+
+    def __init__(self, rule: str, doc: Optional[str], inputs: Iterable[str], outputs: Iterable[str], job_hash: str):
+        """Initialize record for a job.
+
+        Args:
+            rule: Name of the Snakemake rule.
+            doc: The document the job is run on, or None.
+            inputs: Paths to the input files of the job.
+            outputs: Paths to the output files of the job.
+            job_hash: Hash of parameters and code of the job, as computed by hash_job().
+        """
+        self.path = get_record_path(rule, doc)
+        self.outputs_dir = self.path.with_suffix("")
+        self.inputs = sorted(set(map(str, inputs)))
+        self.outputs = sorted(set(map(str, outputs)))
+        self.job_hash = job_hash
+        self.input_hashes = {}
+        try:
+            with open(self.path) as f:
+                self.previous = json.load(f)
+        except (OSError, ValueError):
+            self.previous = None
+
+    def _input_hash(self, path: str) -> str:
+        """Get hash of input file, avoiding reading the file if its size and modification time are unchanged."""
+        if path not in self.input_hashes:
+            stat = _stat(path)
+            previous = self.previous["inputs"].get(path) if self.previous else None
+            if previous and previous[:2] == stat:
+                self.input_hashes[path] = previous
+            elif paths.work_dir in Path(path).parents:
+                self.input_hashes[path] = stat + [hash_file(path)]
+            else:
+                # Files outside the work dir, like models, are often used by many jobs
+                self.input_hashes[path] = stat + [hash_shared_file(path, stat)]
+        return self.input_hashes[path][2]
+
+    def is_unchanged(self) -> bool:
+        """Check if the job was previously run with identical inputs and parameters, and its output was saved."""
+        if not self.previous or self.previous["job"] != self.job_hash or not self.inputs:
+            return False
+        if sorted(self.previous["inputs"]) != self.inputs or sorted(self.previous["outputs"]) != self.outputs:
+            return False
+        try:
+            for i, path in enumerate(self.outputs):
+                if os.path.getsize(self.outputs_dir / str(i)) != self.previous["outputs"][path]:
+                    return False
+            for path in self.inputs:
+                if self._input_hash(path) != self.previous["inputs"][path][2]:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def restore_outputs(self):
+        """Restore the outputs saved when the job was last run.
+
+        Snakemake removes the outputs of a job before running it, so they are kept as hard links in the hashes
+        directory, which takes no extra disk space. The restored outputs are touched, since Snakemake would otherwise
+        find them older than their inputs and run the job again on the next run.
+        """
+        for i, path in enumerate(self.outputs):
+            if os.path.lexists(path):
+                os.remove(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            os.link(self.outputs_dir / str(i), path)
+            os.utime(path)
+
+    def save(self):
+        """Save hashes of inputs, and hard links to the outputs so they can be restored if the job is run again."""
+        try:
+            record = {
+                "job": self.job_hash,
+                "inputs": {path: [*_stat(path), self._input_hash(path)] for path in self.inputs},
+                "outputs": {path: os.path.getsize(path) for path in self.outputs}
+            }
+        except OSError:
+            return
+        os.makedirs(self.outputs_dir, exist_ok=True)
+        try:
+            for i, path in enumerate(self.outputs):
+                saved_path = self.outputs_dir / str(i)
+                if os.path.lexists(saved_path):
+                    os.remove(saved_path)
+                os.link(path, saved_path)
+        except OSError:
+            # Hard links are not supported (or output is a directory), so the job can't be skipped next time
+            record["outputs"] = {}
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.path)
@@ -1,13 +1,32 @@
 """Corpus-related util functions like reading and writing annotations."""
 
+import atexit
+import contextlib
+import gzip
+import hashlib
 import heapq
+import json
 import logging
 import os
 import re
+import sqlite3
+from io import BytesIO, StringIO, TextIOWrapper
+from pathlib import Path
+from typing import List, Optional
 
 from sparv.core import paths
 from sparv.util.classes import BaseAnnotation, Annotation
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 _log = logging.getLogger(__name__)
 
 DOC_CHUNK_DELIM = ":"
@@ -16,18 +35,62 @@ SPAN_ANNOTATION = "@span"
 TEXT_FILE = "@text"
 STRUCTURE_FILE = "@structure"
 HEADERS_FILE = "@headers"
+CHUNKS_DIR = "@chunks"
+# Prefix of the names of chunks created by splitting large source files. A chunk is a document named 'doc/@00001',
+# stored in the work dir as if the source file 'doc' was a directory.
+CHUNK_PREFIX = "@"
+# File touched by every job of a document, letting the planner find out if anything in the document has changed
+CHANGED_FILE = "@changed"
+PACKED_FILE = "@packed.db"
+PACKED_MARKER = "\0sparv-packed\0"
+_PACKED_MARKER_BYTES = PACKED_MARKER.encode("UTF-8")
+
+# Layout of the work dir: "files" stores every annotation in a file of its own, while "packed" stores the contents of
+# all files belonging to a document in one SQLite file. Snakemake still needs a path per annotation, so "packed" leaves
+# the paths in place as links to a small marker file, and reading a packed file means reading the marker and then the
+# SQLite file. Set from the corpus config when running jobs. Both layouts can always be read.
+STORAGE_FILES = "files"
+STORAGE_PACKED = "packed"
+storage = STORAGE_FILES
+
+_packed_connections = {}
+
+# Seconds to wait for other jobs writing to the packed file of the same document. Writes are short, so running out of
+# time usually means that the file system doesn't support the locking SQLite relies on.
+PACKED_LOCK_TIMEOUT = 60
+
+# Marker file and hash of the packed files written so far, per document. Every job is run in a process of its own, so
+# all files a job writes for a document share one marker file (the other paths are hard links to it).
+_packed_markers = {}
+
+# Compression of files in the work dir, set from the corpus config when running jobs. Compressed files are recognized
+# by their magic bytes when read, so files can always be read regardless of this setting. zstd and lz4 need optional
+# packages; see get_available_compression().
+COMPRESSION_NONE = "none"
+COMPRESSIONS = (COMPRESSION_NONE, "gzip", "lz4", "zstd")
+compression = COMPRESSION_NONE
+
+_MAGIC_BYTES = {
+    b"\x1f\x8b": "gzip",
+    b"\x04\x22\x4d\x18": "lz4",
+    b"\x28\xb5\x2f\xfd": "zstd"
+}
+
+# Data appended to packed or compressed files, which can't be appended to directly. Kept in memory per file path as
+# (doc, list of strings) and written once by flush_writes(), instead of rewriting the whole file for every append.
+_pending_appends = {}
 
 
 def annotation_exists(doc, annotation):
     """Check if an annotation file exists."""
     annotation_path = get_annotation_path(doc, annotation)
-    return os.path.exists(annotation_path)
+    return annotation_path in _pending_appends or os.path.exists(annotation_path)
 
 
 def data_exists(doc, name):
     """Check if an annotation data file exists."""
     annotation_path = get_annotation_path(doc, name, data=True)
-    return os.path.isfile(annotation_path)
+    return annotation_path in _pending_appends or os.path.isfile(annotation_path)
 
 
 def write_annotation(doc, annotation, values, append=False, allow_newlines=False):
@@ -68,34 +131,29 @@ def _write_single_annotation(doc, annotation, values, append, allow_newlines=Fal
         # Make sure that spans are sorted
         assert all(values[i] <= values[i + 1] for i in range(len(values) - 1)), "Annotation spans must be sorted."
     file_path = get_annotation_path(doc, annotation)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    mode = "a" if append else "w"
-    with open(file_path, mode) as f:
-        ctr = 0
-        for value in values:
-            if value is None:
-                value = ""
-            elif is_span:
-                start, end = value
-                start_subpos, end_subpos = None, None
-                if isinstance(start, tuple):
-                    start, start_subpos = start
-                if isinstance(end, tuple):
-                    end, end_subpos = end
-                start_subpos = ".{}".format(start_subpos) if start_subpos is not None else ""
-                end_subpos = ".{}".format(end_subpos) if end_subpos is not None else ""
-                value = "{}{}-{}{}".format(start, start_subpos, end, end_subpos)
-            elif allow_newlines:
-                # Replace line breaks with "\n"
-                value = value.replace("\\", r"\\").replace("\n", r"\n").replace("\r", "")
-            else:
-                # Remove line breaks entirely
-                value = value.replace("\n", "").replace("\r", "")
-            print(value, file=f)
-            ctr += 1
-    # Update file modification time even if nothing was written
-    os.utime(file_path, None)
-    _log.info(f"Wrote {ctr} items: {doc + '/' if doc else ''}{annotation}")
+    lines = []
+    for value in values:
+        if value is None:
+            value = ""
+        elif is_span:
+            start, end = value
+            start_subpos, end_subpos = None, None
+            if isinstance(start, tuple):
+                start, start_subpos = start
+            if isinstance(end, tuple):
+                end, end_subpos = end
+            start_subpos = ".{}".format(start_subpos) if start_subpos is not None else ""
+            end_subpos = ".{}".format(end_subpos) if end_subpos is not None else ""
+            value = "{}{}-{}{}".format(start, start_subpos, end, end_subpos)
+        elif allow_newlines:
+            # Replace line breaks with "\n"
+            value = value.replace("\\", r"\\").replace("\n", r"\n").replace("\r", "")
+        else:
+            # Remove line breaks entirely
+            value = value.replace("\n", "").replace("\r", "")
+        lines.append(value + "\n")
+    _write_file(doc, file_path, "".join(lines), append)
+    _log.info(f"Wrote {len(lines)} items: {doc + '/' if doc else ''}{annotation}")
 
 
 def create_empty_attribute(annotation):
@@ -176,43 +234,224 @@ def _read_single_annotation(doc, annotation, with_annotation_name, allow_newline
     """Read a single annotation file."""
     ann_file = get_annotation_path(doc, annotation)
 
-    with open(ann_file) as f:
-        ctr = 0
-        for line in f:
-            value = line.rstrip("\n\r")
-            if not split_annotation(annotation)[1]:  # If this is a span annotation
-                value = tuple(tuple(map(int, pos.split("."))) for pos in value.split("-"))
-            elif allow_newlines:
-                # Replace literal "\n" with line break (if we allow "\n" in values)
-                value = re.sub(r"((?<!\\)(?:\\\\)*)\\n", r"\1\n", value).replace(r"\\", "\\")
-            yield value if not with_annotation_name else (value, annotation)
-            ctr += 1
+    ctr = 0
+    for line in _read_file_lines(doc, ann_file):
+        value = line.rstrip("\n\r")
+        if not split_annotation(annotation)[1]:  # If this is a span annotation
+            value = tuple(tuple(map(int, pos.split("."))) for pos in value.split("-"))
+        elif allow_newlines:
+            # Replace literal "\n" with line break (if we allow "\n" in values)
+            value = re.sub(r"((?<!\\)(?:\\\\)*)\\n", r"\1\n", value).replace(r"\\", "\\")
+        yield value if not with_annotation_name else (value, annotation)
+        ctr += 1
     _log.debug(f"Read {ctr} items: {doc + '/' if doc else ''}{annotation}")
 
 
 def write_data(doc, name, value, append=False):
     """Write arbitrary string data to file in workdir directory."""
     file_path = get_annotation_path(doc, name, data=True)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    mode = "a" if append else "w"
-
-    with open(file_path, mode) as f:
-        f.write(value)
-    # Update file modification time even if nothing was written
-    os.utime(file_path, None)
+    _write_file(doc, file_path, value, append)
     _log.info(f"Wrote {len(value)} bytes: {doc + '/' if doc else ''}{name}")
 
 
 def read_data(doc, name):
     """Read arbitrary string data from file in workdir directory."""
     file_path = get_annotation_path(doc, name, data=True)
-
-    with open(file_path) as f:
-        data = f.read()
+    data = _read_file(doc, file_path)
     _log.debug(f"Read {len(data)} bytes: {doc + '/' if doc else ''}{name}")
     return data
 
 
+def get_available_compression(method: str) -> str:
+    """Get the compression method to use, falling back to gzip if the chosen one isn't installed."""
+    if (method == "zstd" and zstandard is None) or (method == "lz4" and lz4 is None):
+        _log.warning("The Python package needed for '%s' compression is not installed. Using gzip instead.", method)
+        return "gzip"
+    return method
+
+
+def _get_compression_of(head: bytes) -> Optional[str]:
+    """Get the compression method used for some data from its first bytes, or None if it is not compressed."""
+    return _MAGIC_BYTES.get(head[:2]) or _MAGIC_BYTES.get(head[:4])
+
+
+def _encode(data: str) -> bytes:
+    """Encode and compress data using the compression configured for the corpus."""
+    data = data.encode("UTF-8")
+    if compression == "gzip":
+        # Write gzip data without a timestamp, so that equal data always gives equal files
+        buffer = BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=1, mtime=0) as f:
+            f.write(data)
+        return buffer.getvalue()
+    elif compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    elif compression == "lz4":
+        return lz4.frame.compress(data)
+    return data
+
+
+def _decode(data: bytes) -> str:
+    """Decompress (if compressed) and decode data."""
+    method = _get_compression_of(data)
+    if method == "gzip":
+        data = gzip.decompress(data)
+    elif method in ("zstd", "lz4"):
+        if (zstandard if method == "zstd" else lz4) is None:
+            from sparv.util import SparvErrorMessage
+            raise SparvErrorMessage(f"The work dir contains files compressed with {method}, but the Python package "
+                                    f"needed for reading them is not installed.")
+        data = zstandard.ZstdDecompressor().decompress(data) if method == "zstd" else lz4.frame.decompress(data)
+    return data.decode("UTF-8")
+
+
+def _get_packed_db(doc: str) -> sqlite3.Connection:
+    """Get connection to the SQLite file holding the packed files of a document."""
+    if doc not in _packed_connections:
+        db_path = os.path.join(paths.work_dir, doc, PACKED_FILE)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Several jobs may write to the same document at the same time, so wait for locks to be released
+        connection = sqlite3.connect(db_path, timeout=PACKED_LOCK_TIMEOUT)
+        with _packed_errors(doc):
+            connection.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, data BLOB)")
+        _packed_connections[doc] = connection
+    return _packed_connections[doc]
+
+
+@contextlib.contextmanager
+def _packed_errors(doc: str):
+    """Turn SQLite errors from the packed file of a document into error messages the user can act on."""
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        from sparv.util import SparvErrorMessage
+        raise SparvErrorMessage(f"Could not access the packed work dir file of document '{doc}' ({e}). The 'packed' "
+                                f"storage needs a file system with working file locks, which network file systems "
+                                f"often lack. Set 'workdir.storage' to 'files' to avoid this.")
+
+
+def _packed_name(doc: str, file_path: str) -> str:
+    """Get the name of a file inside the packed file of a document."""
+    return Path(os.path.relpath(file_path, os.path.join(paths.work_dir, doc))).as_posix()
+
+
+def _read_packed(doc: str, file_path: str) -> Optional[str]:
+    """Read file from the packed file of a document, or return None if it isn't there."""
+    if doc not in _packed_connections and not os.path.isfile(os.path.join(paths.work_dir, doc, PACKED_FILE)):
+        return None
+    with _packed_errors(doc):
+        row = _get_packed_db(doc).execute("SELECT data FROM files WHERE name = ?",
+                                          (_packed_name(doc, file_path),)).fetchone()
+    return _decode(row[0]) if row else None
+
+
+def _is_plain_file(file_path: str) -> bool:
+    """Check if a file is neither compressed nor a marker for a packed file."""
+    with open(file_path, "rb") as f:
+        head = f.read(len(_PACKED_MARKER_BYTES))
+    return not head.startswith(_PACKED_MARKER_BYTES) and not _get_compression_of(head)
+
+
+def _write_file(doc: Optional[str], file_path: str, data: str, append: bool = False):
+    """Write data to a file in the work dir, using the storage layout and compression configured for the corpus."""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    packed = storage == STORAGE_PACKED and doc
+    if append and (file_path in _pending_appends or packed or compression != COMPRESSION_NONE
+                   or (os.path.exists(file_path) and not _is_plain_file(file_path))):
+        # Only uncompressed files can be appended to directly, so keep the data until the annotation is complete
+        if file_path not in _pending_appends:
+            _pending_appends[file_path] = (doc, [_read_file(doc, file_path)] if os.path.exists(file_path) else [])
+        _pending_appends[file_path][1].append(data)
+        return
+    _pending_appends.pop(file_path, None)
+
+    if packed:
+        data_bytes = _encode(data)
+        connection = _get_packed_db(doc)
+        with _packed_errors(doc), connection:
+            connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?)",
+                               (_packed_name(doc, file_path), data_bytes))
+        _write_packed_marker(doc, file_path, data_bytes)
+    elif compression != COMPRESSION_NONE:
+        with open(file_path, "wb") as f:
+            f.write(_encode(data))
+    else:
+        with open(file_path, "a" if append else "w") as f:
+            f.write(data)
+    # Update file modification time even if nothing was written
+    os.utime(file_path, None)
+
+
+def _write_packed_marker(doc: str, file_path: str, data_bytes: bytes):
+    """Leave a marker for Snakemake in place of a packed file.
+
+    The marker holds a hash of everything written to the document by the current job, making it change whenever the
+    contents do. The first file written for a document gets a new marker file, and the following ones are hard links
+    to it.
+    """
+    marker_path, marker_hash = _packed_markers.get(doc, (None, None))
+    if marker_path is None or not os.path.isfile(marker_path):
+        marker_path, marker_hash = file_path, hashlib.blake2b(digest_size=16)
+        _packed_markers[doc] = (marker_path, marker_hash)
+        # Remove any old file first, since it may be linked to other files
+        if os.path.lexists(file_path):
+            os.remove(file_path)
+    marker_hash.update(_packed_name(doc, file_path).encode("UTF-8") + b"\0" + data_bytes)
+    with open(marker_path, "w") as f:
+        f.write(PACKED_MARKER + marker_hash.hexdigest())
+
+    if file_path != marker_path and not (os.path.exists(file_path) and os.path.samefile(file_path, marker_path)):
+        if os.path.lexists(file_path):
+            os.remove(file_path)
+        try:
+            os.link(marker_path, file_path)
+        except OSError:
+            # Hard links are not supported by the file system, so copy the marker instead
+            with open(file_path, "w") as f:
+                f.write(PACKED_MARKER + marker_hash.hexdigest())
+
+
+@atexit.register
+def flush_writes():
+    """Write all data appended to packed or compressed files that is still kept in memory."""
+    while _pending_appends:
+        file_path, (doc, data) = _pending_appends.popitem()
+        _write_file(doc, file_path, "".join(data))
+
+
+def _flush_file(file_path: str):
+    """Write data appended to a file that is still kept in memory."""
+    if file_path in _pending_appends:
+        doc, data = _pending_appends.pop(file_path)
+        _write_file(doc, file_path, "".join(data))
+
+
+def _open_file(doc: Optional[str], file_path: str):
+    """Open a file in the work dir for reading as text, regardless of storage layout and compression."""
+    _flush_file(file_path)
+    f = open(file_path, "rb")
+    head = f.peek(len(_PACKED_MARKER_BYTES))[:len(_PACKED_MARKER_BYTES)]
+    if doc and head.startswith(_PACKED_MARKER_BYTES):
+        f.close()
+        return StringIO(_read_packed(doc, file_path) or "", newline=None)
+    if _get_compression_of(head):
+        with f:
+            return StringIO(_decode(f.read()), newline=None)
+    return TextIOWrapper(f)
+
+
+def _read_file(doc: Optional[str], file_path: str) -> str:
+    """Read the contents of a file in the work dir."""
+    with _open_file(doc, file_path) as f:
+        return f.read()
+
+
+def _read_file_lines(doc: Optional[str], file_path: str):
+    """Iterate over the lines of a file in the work dir."""
+    with _open_file(doc, file_path) as f:
+        yield from f
+
+
 def split_annotation(annotation):
     """Split annotation into annotation name and attribute."""
     if isinstance(annotation, BaseAnnotation):
@@ -228,6 +467,7 @@ def join_annotation(name, attribute):
 
 def get_annotation_path(doc, annotation, data=False):
     """Construct a path to an annotation file given a doc and annotation."""
+    chunk = ""
     if doc:
         doc, _, chunk = doc.partition(DOC_CHUNK_DELIM)
     elem, attr = split_annotation(annotation)
@@ -242,3 +482,67 @@ def get_annotation_path(doc, annotation, data=False):
             attr = SPAN_ANNOTATION
         path = os.path.join(paths.work_dir, doc, chunk, elem, attr)
     return path
+
+
+def get_chunk_name(index: int) -> str:
+    """Get the name of the chunk with the given index (counting from 0)."""
+    return "{}{:05d}".format(CHUNK_PREFIX, index + 1)
+
+
+def get_chunk_dir(doc: str) -> Path:
+    """Get the directory where the chunks of a split source document are stored."""
+    return Path(paths.work_dir, CHUNKS_DIR, doc)
+
+
+def get_chunk_manifest_path(doc: str) -> Path:
+    """Get the path to the file describing how a source document was split into chunks."""
+    return Path(paths.work_dir, CHUNKS_DIR, doc + ".json")
+
+
+def read_chunk_manifest(doc: str) -> Optional[dict]:
+    """Read information about how a source document was split into chunks, or return None if it wasn't split."""
+    manifest_path = get_chunk_manifest_path(doc)
+    if not manifest_path.is_file():
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def get_doc_chunks(doc: str) -> List[str]:
+    """Get the names of all the documents that a source document was split into, in order.
+
+    A source document that wasn't split consists of just one document with the same name as the source.
+    """
+    manifest = read_chunk_manifest(doc)
+    if not manifest or not manifest["chunks"]:
+        return [doc]
+    return [f"{doc}/{chunk['name']}" for chunk in manifest["chunks"]]
+
+
+def get_source_file(source_dir, doc: str, file_extension: str) -> Path:
+    """Get the path to the source file for a document.
+
+    Documents named 'doc/@chunk' refer to a chunk of the source file 'doc', stored in the work dir. Documents named
+    'doc:chunk' refer to the source file 'doc/chunk', split manually.
+    """
+    source_doc, _, chunk = doc.rpartition("/")
+    if source_doc and chunk.startswith(CHUNK_PREFIX):
+        return get_chunk_dir(source_doc) / f"{chunk}.{file_extension}"
+    return Path(source_dir, f"{doc.replace(DOC_CHUNK_DELIM, '/')}.{file_extension}")
+
+
+def get_changed_marker_path(doc: str) -> Path:
+    """Get the path to the file marking the latest change to the work dir files of a document."""
+    return Path(get_annotation_path(doc, CHANGED_FILE, data=True))
+
+
+def touch_changed_marker(doc: str) -> None:
+    """Mark that files of a document are about to change, including the source document that a chunk belongs to."""
+    docs = [doc]
+    source_doc, _, chunk = doc.rpartition("/")
+    if source_doc and chunk.startswith(CHUNK_PREFIX):
+        docs.append(source_doc)
+    for d in docs:
+        path = get_changed_marker_path(d)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
@@ -1,12 +1,19 @@
 """Handler for log messages, both from the logging library and from Snakemake."""
+import atexit
+import csv
 import datetime
+import json
 import logging
 import logging.handlers
 import os
 import pickle
+import queue
 import re
+import shutil
+import socket
 import socketserver
 import struct
+import tempfile
 import threading
 import time
 from collections import defaultdict
@@ -16,10 +23,11 @@ from typing import Optional
 
 import rich.progress as progress
 from rich.logging import RichHandler
+from rich.table import Table
 from rich.text import Text
 from snakemake import logger
 
-from sparv.core import paths
+from sparv.core import paths, stats
 from sparv.core.console import console
 from sparv.util.misc import SparvErrorMessage
 
@@ -39,9 +47,17 @@ def export_dirs(self, dirs):
         self._log(INTERNAL, "export_dirs", (), extra={"export_dirs": dirs})
 
 
-# Add log function to logger
+def job_stats(self, stats_dict):
+    """Send resource usage statistics for a job to log handler."""
+    if self.isEnabledFor(INTERNAL):
+        self._log(INTERNAL, "job_stats", (), extra={"job_stats": stats_dict})
+
+
+# Add log functions to logger
 logging.export_dirs = export_dirs
 logging.Logger.export_dirs = export_dirs
+logging.job_stats = job_stats
+logging.Logger.job_stats = job_stats
 
 # Messages from the Sparv core
 messages = {
@@ -55,7 +71,7 @@ class LogRecordStreamHandler(socketserver.StreamRequestHandler):
     """Handler for streaming logging requests."""
 
     def handle(self):
-        """Handle multiple requests - each expected to be a 4-byte length followed by the LogRecord in pickle format."""
+        """Handle multiple requests - each expected to be a 4-byte length followed by a pickled list of LogRecords."""
         while True:
             chunk = self.connection.recv(4)
             if len(chunk) < 4:
@@ -64,9 +80,9 @@ class LogRecordStreamHandler(socketserver.StreamRequestHandler):
             chunk = self.connection.recv(slen)
             while len(chunk) < slen:
                 chunk = chunk + self.connection.recv(slen - len(chunk))
-            obj = pickle.loads(chunk)
-            record = logging.makeLogRecord(obj)
-            self.handle_log_record(record)
+            for obj in pickle.loads(chunk):
+                record = logging.makeLogRecord(obj)
+                self.handle_log_record(record)
 
     @staticmethod
     def handle_log_record(record):
@@ -75,6 +91,105 @@ class LogRecordStreamHandler(socketserver.StreamRequestHandler):
         sparv_logger.handle(record)
 
 
+class BatchedSocketHandler(logging.handlers.QueueHandler):
+    """Handler sending log records to the log server in batches.
+
+    Records are put on a bounded queue and sent by a background thread, at regular intervals and when the handler is
+    closed, so that jobs don't have to wait for the log server. If the queue is full, records below warning level are
+    dropped instead of slowing down the job, while more important records wait for room on the queue.
+    """
+
+    def __init__(self, log_server, capacity: int = 10000, interval: float = 0.2, batch_size: int = 1000):
+        """Initialize handler.
+
+        Args:
+            log_server: Path to a Unix domain socket, or host and port of a TCP socket.
+            capacity: Maximum number of records waiting to be sent.
+            interval: Maximum time in seconds between batches.
+            batch_size: Maximum number of records in one batch.
+        """
+        super().__init__(queue.Queue(capacity))
+        self.log_server = log_server
+        self.interval = interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.sock = None
+        self.sender = threading.Thread(target=self.send_batches, daemon=True)
+        self.sender.start()
+
+    def prepare(self, record):
+        """Merge arguments and exception info into the message, so that the record can be pickled.
+
+        Unlike the parent method, the record is changed in place instead of being copied, since it is not used by any
+        other handler.
+        """
+        msg = self.format(record)
+        record.message = msg
+        record.msg = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        """Put record on the queue, dropping it if the queue is full and the record is not important."""
+        if record.levelno < logging.WARNING:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            self.queue.put(record)
+
+    def send_batches(self):
+        """Send queued records in batches until a None sentinel is received."""
+        done = False
+        while not done:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    done = True
+                    break
+                batch.append(record)
+            if batch:
+                self.send(batch)
+
+    def send(self, batch):
+        """Pickle a batch of records and send it to the log server."""
+        data = pickle.dumps([dict(record.__dict__) for record in batch], 1)
+        try:
+            if self.sock is None:
+                if isinstance(self.log_server, str):
+                    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.sock.connect(self.log_server)
+                else:
+                    self.sock = socket.create_connection(tuple(self.log_server))
+            self.sock.sendall(struct.pack(">L", len(data)) + data)
+        except OSError:
+            # The log server is gone, so there is nowhere to send the records
+            self.sock = None
+
+    def close(self):
+        """Send all remaining records and stop the background thread."""
+        if self.sender.is_alive():
+            if self.dropped:
+                self.enqueue(logging.makeLogRecord({
+                    "name": "sparv", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"{self.dropped} log messages were dropped since they were produced faster than they could "
+                           f"be handled"}))
+            self.queue.put(None)
+            self.sender.join()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        super().close()
+
+
 class LogLevelCounterHandler(logging.Handler):
     """Handler that counts the number of log messages per log level."""
 
@@ -109,14 +224,17 @@ class InternalFilter(logging.Filter):
 class InternalLogHandler(logging.Handler):
     """Handler for internal log messages."""
 
-    def __init__(self, export_dirs_list):
+    def __init__(self, export_dirs_list, job_stats_list):
         self.export_dirs_list = export_dirs_list
+        self.job_stats_list = job_stats_list
         super().__init__()
 
     def emit(self, record):
         """Handle log record."""
         if record.msg == "export_dirs":
             self.export_dirs_list.update(record.export_dirs)
+        elif record.msg == "job_stats":
+            self.job_stats_list.append(record.job_stats)
 
 
 class ModifiedRichHandler(RichHandler):
@@ -134,7 +252,7 @@ class LogHandler:
 
     icon = "\U0001f426"
 
-    def __init__(self, progressbar=True, summary=False, log_level=None, log_file_level=None):
+    def __init__(self, progressbar=True, summary=False, log_level=None, log_file_level=None, show_stats=False):
         """Initialize log handler.
 
         Args:
@@ -142,9 +260,11 @@ class LogHandler:
             summary: Set to True to write a final summary (elapsed time). Disabled by default.
             log_level: Log level for logging to stdout.
             log_file_level: Log level for logging to file.
+            show_stats: Set to True to print a per-rule summary of resource usage. Disabled by default.
         """
         self.use_progressbar = progressbar
         self.show_summary = summary
+        self.show_stats = show_stats
         self.log_level = log_level
         self.log_file_level = log_file_level
         self.log_filename = None
@@ -156,7 +276,9 @@ class LogHandler:
         self.missing_binaries_re = None
         self.missing_classes_re = None
         self.export_dirs = set()
+        self.job_stats = []
         self.start_time = time.time()
+        self.start_timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H.%M.%S.%f")
         self.jobs = {}
 
         # Progress bar related variables
@@ -166,12 +288,18 @@ class LogHandler:
         self.bar: Optional[progress.TaskID] = None
         self.last_percentage = 0
 
-        # Create a simple TCP socket-based logging receiver
-        tcpserver = socketserver.ThreadingTCPServer(("localhost", 0), RequestHandlerClass=LogRecordStreamHandler)
-        self.log_server = tcpserver.server_address
+        # Create a socket-based logging receiver, using a Unix domain socket where available
+        self.socket_dir = None
+        if hasattr(socketserver, "ThreadingUnixStreamServer"):
+            self.socket_dir = tempfile.mkdtemp(prefix="sparv-")
+            server = socketserver.ThreadingUnixStreamServer(os.path.join(self.socket_dir, "log.sock"),
+                                                            RequestHandlerClass=LogRecordStreamHandler)
+        else:
+            server = socketserver.ThreadingTCPServer(("localhost", 0), RequestHandlerClass=LogRecordStreamHandler)
+        self.log_server = server.server_address
 
         # Start a thread with the server
-        server_thread = threading.Thread(target=tcpserver.serve_forever)
+        server_thread = threading.Thread(target=server.serve_forever)
         server_thread.daemon = True  # Exit the server thread when the main thread terminates
         server_thread.start()
 
@@ -195,7 +323,7 @@ class LogHandler:
         sparv_logger.addHandler(stream_handler)
 
         # File logger
-        self.log_filename = "{}.log".format(datetime.datetime.now().strftime("%Y-%m-%d_%H.%M.%S.%f"))
+        self.log_filename = f"{self.start_timestamp}.log"
         file_handler = FileHandlerWithDirCreation(os.path.join(paths.log_dir, self.log_filename), mode="w",
                                                   encoding="UTF-8", delay=True)
         file_handler.setLevel(self.log_file_level.upper())
@@ -210,7 +338,7 @@ class LogHandler:
         sparv_logger.addHandler(levelcount_handler)
 
         # Internal log handler
-        internal_handler = InternalLogHandler(self.export_dirs)
+        internal_handler = InternalLogHandler(self.export_dirs, self.job_stats)
         internal_handler.setLevel(INTERNAL)
         sparv_logger.addHandler(internal_handler)
 
@@ -446,15 +574,80 @@ class LogHandler:
                     "Job execution finished but {} occured. See log messages above or {} for details.".format(
                         " and ".join(problems), os.path.join(paths.log_dir, self.log_filename)))
 
+            if self.job_stats:
+                self.write_stats_report()
+                if self.show_stats:
+                    self.print_stats_summary()
+
             if self.show_summary:
                 if self.messages:
                     print()
                 elapsed = round(time.time() - self.start_time)
                 self.info("Time elapsed: {}".format(timedelta(seconds=elapsed)))
 
-    @staticmethod
-    def cleanup():
-        """Remove Snakemake log files."""
+    def summarize_stats(self) -> dict:
+        """Aggregate job statistics per rule."""
+        summary = {}
+        for job in self.job_stats:
+            rule = summary.setdefault(job["rule"], {"jobs": 0, "errors": 0, "skipped": 0, "wall_time": 0.0,
+                                                    "cpu_time": 0.0, "max_rss": None, "bytes_read": None,
+                                                    "bytes_written": None, "model_load_time": 0.0})
+            rule["jobs"] += 1
+            if job["status"] == "error":
+                rule["errors"] += 1
+            elif job["status"] == "skipped":
+                rule["skipped"] += 1
+            for key in ("wall_time", "cpu_time", "model_load_time"):
+                rule[key] += job[key]
+            for key in ("bytes_read", "bytes_written"):
+                if job[key] is not None:
+                    rule[key] = (rule[key] or 0) + job[key]
+            if job["max_rss"] is not None:
+                rule["max_rss"] = max(rule["max_rss"] or 0, job["max_rss"])
+        return summary
+
+    def write_stats_report(self):
+        """Write statistics for every job and a per-rule summary to JSON and CSV files in the log directory."""
+        os.makedirs(paths.log_dir, exist_ok=True)
+        with open(Path(paths.log_dir, f"{self.start_timestamp}.stats.json"), "w", encoding="UTF-8") as f:
+            json.dump({"jobs": self.job_stats, "rules": self.summarize_stats()}, f, indent=2)
+        with open(Path(paths.log_dir, f"{self.start_timestamp}.stats.csv"), "w", encoding="UTF-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=stats.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.job_stats)
+
+    def print_stats_summary(self):
+        """Print a table with resource usage per rule, sorted by total wall time."""
+        def size(n):
+            if n is None:
+                return "-"
+            for unit in ("B", "KB", "MB", "GB"):
+                if n < 1024:
+                    break
+                n /= 1024
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+
+        table = Table(title="Resource usage per rule")
+        table.add_column("Rule", no_wrap=True)
+        for column in ("Jobs", "Wall", "Mean", "CPU", "Models", "Peak RSS", "Read", "Written"):
+            table.add_column(column, justify="right")
+
+        summary = self.summarize_stats()
+        for rule_name, rule in sorted(summary.items(), key=lambda x: x[1]["wall_time"], reverse=True):
+            jobs = str(rule["jobs"]) + "".join(f" ({rule[key]} {label})" for key, label in
+                                               (("skipped", "skipped"), ("errors", "failed")) if rule[key])
+            table.add_row(rule_name, jobs, f"{rule['wall_time']:.2f} s", f"{rule['wall_time'] / rule['jobs']:.2f} s",
+                          f"{rule['cpu_time']:.2f} s", f"{rule['model_load_time']:.2f} s", size(rule["max_rss"]),
+                          size(rule["bytes_read"]), size(rule["bytes_written"]))
+        print()
+        console.print(table)
+        self.info("Statistics for all jobs have been saved to {}".format(
+            os.path.join(paths.log_dir, f"{self.start_timestamp}.stats.json")))
+
+    def cleanup(self):
+        """Remove Snakemake log files and the log server socket."""
+        if self.socket_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
         snakemake_log_file = logger.get_logfile()
         if snakemake_log_file is not None:
             log_file = Path(snakemake_log_file)
@@ -467,9 +660,12 @@ class LogHandler:
 
 def setup_logging(log_server, log_level: Optional[str] = "warning", log_file_level: Optional[str] = "warning"):
     """Set up logging with socket handler."""
-    # Use the lowest log level, but never higher than warning
+    # Use the lowest log level, but never higher than warning. Records below this level are discarded by the logger
+    # before they are formatted and sent.
     log_level = min(logging.WARNING, getattr(logging, log_level.upper()), getattr(logging, log_file_level.upper()))
     socket_logger = logging.getLogger("sparv")
     socket_logger.setLevel(log_level)
-    socket_handler = logging.handlers.SocketHandler(*log_server)
+    socket_handler = BatchedSocketHandler(log_server)
     socket_logger.addHandler(socket_handler)
+    # Make sure remaining records are sent before the process exits
+    atexit.register(socket_handler.close)
@@ -0,0 +1,181 @@
+"""Plan which documents need to be processed before handing targets over to Snakemake.
+
+Snakemake builds a DAG with one node per rule and document for every target it is given, which for large corpora takes
+a long time and a lot of memory even when almost everything is up to date. For every rule requested as a target we
+therefore save a completeness marker per document once a run has finished. The marker holds a signature of the
+rule's dependency graph (the rule templates it depends on, and the files they share between all documents, like
+models), together with a hash of the size and modification time of the document's source file, its target files and
+its change marker, a file in the work dir touched by every job run for the document. On the next run, documents with a
+valid marker are left out of the targets, so Snakemake only sees the documents that need work. Checking a document
+thus takes a few stats, no matter how many annotation files it has. Any job run for the document since the marker was
+saved (e.g. by 'sparv run-rule') invalidates it, but annotation files changed or removed by hand are not noticed.
+"""
+
+import hashlib
+import json
+import os
+from typing import List, Optional, Set
+
+from snakemake.io import expand
+
+from sparv import __version__
+from sparv.core import io, paths
+
+PLAN_FILE = "@plan.json"
+ALL_DOCS = "@all"
+
+# The planner used by the current Snakemake workflow, saved so that markers can be written after a successful run
+current: Optional["Planner"] = None
+
+
+def _stat(path) -> Optional[list]:
+    """Get size and modification time of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+
+class Planner:
+    """Filter target documents using completeness markers from previous runs."""
+
+    def __init__(self, snake_storage, source_dir: str):
+        """Initialize planner.
+
+        Args:
+            snake_storage: SnakeStorage object with all rules.
+            source_dir: Path to the corpus source files.
+        """
+        self.storage = snake_storage
+        self.source_dir = source_dir
+        self.path = paths.work_dir / PLAN_FILE
+        self.planned = {}  # Rule name -> (rule, target patterns, list of docs handed to Snakemake)
+        self._signatures = {}
+        self._closures = {}
+
+        # Map output patterns to the rules producing them
+        self.rules = snake_storage.all_rules
+        self.producers = {}
+        for rule in self.rules:
+            for output in rule.outputs:
+                self.producers.setdefault(self._normalize(output, rule), rule)
+
+        try:
+            with open(self.path) as f:
+                self.markers = json.load(f)
+            if self.markers.get("version") != __version__:
+                self.markers = {}
+        except (OSError, ValueError):
+            self.markers = {}
+        self.markers.setdefault("version", __version__)
+        self.markers.setdefault("docs", {})
+
+    @staticmethod
+    def _normalize(path, rule) -> str:
+        """Get path pattern relative to the corpus dir (annotators have the work dir included in the {doc} wildcard)."""
+        path = str(path)
+        if rule.annotator and path.startswith("{doc}"):
+            path = str(paths.work_dir / path)
+        return path
+
+    def _closure(self, rule) -> Set:
+        """Get the set of rules that a rule depends on, including itself."""
+        if rule.rule_name not in self._closures:
+            closure = set()
+            stack = [rule]
+            while stack:
+                r = stack.pop()
+                if r in closure:
+                    continue
+                closure.add(r)
+                for i in r.inputs:
+                    if not callable(i):
+                        producer = self.producers.get(self._normalize(i, r))
+                        if producer is not None:
+                            stack.append(producer)
+            self._closures[rule.rule_name] = closure
+        return self._closures[rule.rule_name]
+
+    def signature(self, rule, patterns: List[str]) -> str:
+        """Compute a signature of the dependency graph of a rule, including files shared between documents."""
+        key = (rule.rule_name, tuple(patterns))
+        if key not in self._signatures:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(f"{__version__}\n{patterns}\n".encode("UTF-8"))
+            for r in sorted(self._closure(rule), key=lambda x: x.rule_name):
+                h.update(f"{r.rule_name}\n{sorted(map(str, r.outputs))}\n".encode("UTF-8"))
+                for i in sorted(str(i) for i in r.inputs if not callable(i)):
+                    h.update(f"{i}\n".encode("UTF-8"))
+                    # Files not belonging to a single document (like models) are included with size and mtime
+                    if "{doc}" not in i:
+                        h.update(f"{_stat(i)}\n".encode("UTF-8"))
+            self._signatures[key] = h.hexdigest()
+        return self._signatures[key]
+
+    def _source_stat(self, doc: str) -> Optional[list]:
+        """Get size and modification time of the source file (or chunk) of a document."""
+        if doc == ALL_DOCS or not self.storage.source_file_extension:
+            return None
+        return _stat(io.get_source_file(self.source_dir, doc, self.storage.source_file_extension))
+
+    def _doc_state(self, patterns: List[str], doc: str) -> str:
+        """Get a hash of the size and modification time of the source file, target files and change marker of a doc."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self._source_stat(doc)}\n".encode("UTF-8"))
+        if doc != ALL_DOCS:
+            for path in expand(patterns, doc=doc):
+                h.update(f"{path}\n{_stat(path)}\n".encode("UTF-8"))
+            h.update(f"{_stat(io.get_changed_marker_path(doc))}\n".encode("UTF-8"))
+        else:
+            for path in patterns:
+                h.update(f"{path}\n{_stat(path)}\n".encode("UTF-8"))
+        return h.hexdigest()
+
+    def _is_complete(self, rule, patterns: List[str], doc: str, signature: str) -> bool:
+        """Check if a document has a valid marker for a rule, with all its target files existing and unchanged."""
+        marker = self.markers["docs"].get(doc, {}).get(rule.rule_name)
+        if marker is None or marker[0] != signature:
+            return False
+        targets = expand(patterns, doc=doc) if doc != ALL_DOCS else patterns
+        if not all(os.path.exists(t) for t in targets):
+            return False
+        return marker[1] == self._doc_state(patterns, doc)
+
+    def filter_docs(self, rule, patterns: List, docs: List[str]) -> List[str]:
+        """Return the documents for which the target patterns of a rule need to be handed over to Snakemake.
+
+        Args:
+            rule: The RuleStorage object of the target rule.
+            patterns: The target file patterns, with {doc} wildcards.
+            docs: All documents that the targets should be created for.
+        """
+        patterns = [str(p) for p in patterns if not callable(p)]
+        if any("{" in p.replace("{doc}", "") for p in patterns):
+            # Other wildcards than {doc} can't be checked without help from Snakemake
+            return docs
+        docless = not any("{doc}" in p for p in patterns)
+        signature = self.signature(rule, patterns)
+        stale = [doc for doc in ([ALL_DOCS] if docless else docs)
+                 if not self._is_complete(rule, patterns, doc, signature)]
+        self.planned[rule.rule_name] = (rule, patterns, stale)
+        if docless:
+            # Patterns without {doc} are either needed as they are, or not at all
+            return docs if stale else []
+        return stale
+
+    def save(self):
+        """Save completeness markers for all documents that have been processed."""
+        self._signatures = {}
+        for rule_name, (rule, patterns, docs) in self.planned.items():
+            signature = self.signature(rule, patterns)
+            for doc in docs:
+                targets = expand(patterns, doc=doc) if doc != ALL_DOCS else patterns
+                if all(os.path.exists(t) for t in targets):
+                    self.markers["docs"].setdefault(doc, {})[rule_name] = [signature,
+                                                                           self._doc_state(patterns, doc)]
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.markers, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,179 @@
+"""Profiling of Sparv jobs and reporting of the collected profiles."""
+
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from sparv.core import paths
+from sparv.core.console import console
+
+PROFILES_DIR = "profiles"
+PROFILERS = ("cprofile", "sampling")
+ALL_DOCS = "_all"
+
+
+def get_profiles_dir(log_dir=None) -> Path:
+    """Get path to directory where profiles are saved."""
+    return Path(log_dir or paths.log_dir) / PROFILES_DIR
+
+
+def _safe_name(name: str) -> str:
+    """Turn document name into something usable as a file name."""
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+def _rule_dir_name(rule: str) -> str:
+    """Get name of directory for profiles of a rule ('module:function' becomes 'module.function')."""
+    return _safe_name(rule.replace("::", ":").replace(":", "."))
+
+
+def should_profile(rule: str, doc: Optional[str], rules: List[str], docs: List[str]) -> bool:
+    """Check whether a job should be profiled.
+
+    Args:
+        rule: Name of the rule, in the format 'module:function'.
+        doc: The document the job is run on, or None.
+        rules: Rules (or modules) selected for profiling.
+        docs: Documents selected for profiling. All documents are profiled if empty.
+    """
+    module = rule.split(":")[0]
+    if not any(r.replace("::", ":") in (rule, module, "all") for r in rules):
+        return False
+    if docs and doc is not None:
+        # Chunks of a source document are profiled when the source document is selected
+        return doc in docs or doc.split(":")[0] in docs
+    return True
+
+
+class SamplingProfiler:
+    """Simple statistical profiler collecting call stacks from the calling thread at a regular interval."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        """Sample the stack of the profiled thread until stopped."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump_stats(self, filename):
+        """Save stacks in collapsed-stack format, usable by flamegraph tools."""
+        with open(filename, "w", encoding="UTF-8") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+
+
+def profile_call(function: Callable, parameters: dict, rule: str, doc: Optional[str], profiler: str = "cprofile"):
+    """Run function with profiling and save the result to the profiles directory.
+
+    Args:
+        function: The function to profile.
+        parameters: Keyword arguments for the function.
+        rule: Name of the rule being run, used for naming the output.
+        doc: Name of the document being processed, used for naming the output.
+        profiler: 'cprofile' for deterministic profiling saved as .prof, or 'sampling' for statistical profiling
+            saved as collapsed stacks.
+    """
+    out_dir = get_profiles_dir() / _rule_dir_name(rule)
+    os.makedirs(out_dir, exist_ok=True)
+    out_name = _safe_name(doc or ALL_DOCS)
+
+    if profiler == "sampling":
+        sampler = SamplingProfiler()
+        try:
+            with sampler:
+                function(**parameters)
+        finally:
+            sampler.dump_stats(out_dir / f"{out_name}.collapsed")
+    else:
+        profile = cProfile.Profile()
+        try:
+            profile.runcall(function, **parameters)
+        finally:
+            profile.dump_stats(out_dir / f"{out_name}.prof")
+
+
+def report(log_dir: Path, rules: List[str], top: int = 20, sort: str = "cumulative"):
+    """Merge profiles of all documents per rule, save the merged profiles and print the top functions.
+
+    Args:
+        log_dir: Path to the log directory of the corpus.
+        rules: Only report these rules. All profiled rules are reported if empty.
+        top: Number of functions to print per rule.
+        sort: Sort key for cProfile profiles ('cumulative', 'tottime' or 'ncalls').
+    """
+    profiles_dir = get_profiles_dir(log_dir)
+    rule_dirs = sorted(d for d in profiles_dir.glob("*") if d.is_dir()) if profiles_dir.is_dir() else []
+    if rules:
+        selected = set(_rule_dir_name(r) for r in rules)
+        rule_dirs = [d for d in rule_dirs if d.name in selected or d.name.split(".")[0] in selected]
+    if not rule_dirs:
+        console.print("No profiles found. Use the '--profile' option with 'sparv run' to create profiles.")
+        return
+
+    for rule_dir in rule_dirs:
+        prof_files = sorted(rule_dir.glob("*.prof"))
+        collapsed_files = sorted(rule_dir.glob("*.collapsed"))
+
+        if prof_files:
+            console.print(f"[b]{rule_dir.name}[/b] ({len(prof_files)} profile{'s' if len(prof_files) > 1 else ''})")
+            merged_stats = pstats.Stats(*map(str, prof_files), stream=sys.stdout)
+            merged_stats.dump_stats(profiles_dir / f"{rule_dir.name}.prof")
+            merged_stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+        if collapsed_files:
+            console.print(f"[b]{rule_dir.name}[/b] ({len(collapsed_files)} sampled "
+                          f"profile{'s' if len(collapsed_files) > 1 else ''})")
+            stacks = Counter()
+            for collapsed_file in collapsed_files:
+                with open(collapsed_file, encoding="UTF-8") as f:
+                    for line in f:
+                        stack, _, count = line.rstrip("\n").rpartition(" ")
+                        stacks[stack] += int(count)
+            with open(profiles_dir / f"{rule_dir.name}.collapsed", "w", encoding="UTF-8") as f:
+                for stack, count in stacks.items():
+                    f.write(f"{stack} {count}\n")
+
+            # Count samples per function, both as the innermost frame (self) and anywhere in the stack (total)
+            total_samples = sum(stacks.values()) or 1
+            self_samples = Counter()
+            total_function_samples = Counter()
+            for stack, count in stacks.items():
+                functions = stack.split(";")
+                self_samples[functions[-1]] += count
+                for function in set(functions):
+                    total_function_samples[function] += count
+            print(f"{sum(stacks.values())} samples\n")
+            print(f"{'self %':>8} {'total %':>8}  function")
+            for function, count in self_samples.most_common(top):
+                self_percent = 100 * count / total_samples
+                total_percent = 100 * total_function_samples[function] / total_samples
+                print(f"{self_percent:>8.1f} {total_percent:>8.1f}  {function}")
+            print()
+
+    console.print(f"Merged profiles have been saved to {profiles_dir}")
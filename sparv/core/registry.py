@@ -5,7 +5,7 @@ import pkgutil
 import re
 from collections import defaultdict
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Type, TypeVar
+from typing import Callable, Dict, List, Optional, Tuple, Type, TypeVar
 
 import typing_inspect
 from pkg_resources import iter_entry_points
@@ -156,9 +156,10 @@ def _get_module_name(module_string: str) -> str:
 
 
 def _annotator(description: str, a_type: Annotator, name: Optional[str] = None, file_extension: Optional[str] = None,
-               outputs=(), document_annotation=None, structure=None, language: Optional[List[str]] = None,
-               config: Optional[List[Config]] = None, order: Optional[int] = None, abstract: bool = False,
-               wildcards: Optional[List[Wildcard]] = None):
+               outputs=(), document_annotation=None, structure=None, splitter: Optional[Callable] = None,
+               language: Optional[List[str]] = None, config: Optional[List[Config]] = None,
+               order: Optional[int] = None, abstract: bool = False, wildcards: Optional[List[Wildcard]] = None,
+               memory: Optional[str] = None, threads: int = 1):
     """Return a decorator for annotator functions, adding them to annotator registry."""
     def decorator(f):
         """Add wrapped function to registry."""
@@ -173,11 +174,14 @@ def _annotator(description: str, a_type: Annotator, name: Optional[str] = None,
             "outputs": outputs,
             "document_annotation": document_annotation,
             "structure": structure,
+            "splitter": splitter,
             "language": language,
             "config": config,
             "order": order,
             "abstract": abstract,
-            "wildcards": wildcards
+            "wildcards": wildcards,
+            "memory": memory,
+            "threads": threads
         })
         return f
 
@@ -186,15 +190,30 @@ def _annotator(description: str, a_type: Annotator, name: Optional[str] = None,
 
 def annotator(description: str, name: Optional[str] = None, language: Optional[List[str]] = None,
               config: Optional[List[Config]] = None, order: Optional[int] = None,
-              wildcards: Optional[List[Wildcard]] = None):
-    """Return a decorator for annotator functions, adding them to the annotator registry."""
+              wildcards: Optional[List[Wildcard]] = None, memory: Optional[str] = None, threads: int = 1):
+    """Return a decorator for annotator functions, adding them to the annotator registry.
+
+    Args:
+        description: Description of annotator.
+        name: Optional name to use instead of the function name.
+        language: List of supported languages.
+        config: List of Config instances defining config options for the annotator.
+        order: If several annotators have the same output, this integer value will help decide which to use first.
+        wildcards: List of wildcards used in the annotator function's arguments.
+        memory: Approximate peak memory usage of one job, e.g. '500M' or '6G', used for scheduling jobs when running
+            Sparv with a memory limit. Replaced by the memory usage measured in previous runs when available.
+        threads: Number of cores used by one job.
+
+    Returns:
+        A decorator
+    """
     return _annotator(description=description, a_type=Annotator.annotator, name=name, language=language,
-                      config=config, order=order, wildcards=wildcards)
+                      config=config, order=order, wildcards=wildcards, memory=memory, threads=threads)
 
 
 def importer(description: str, file_extension: str, name: Optional[str] = None, outputs=None,
              document_annotation: Optional[str] = None, structure: Optional[Type[SourceStructureParser]] = None,
-             config: Optional[List[Config]] = None):
+             splitter: Optional[Callable] = None, config: Optional[List[Config]] = None):
     """Return a decorator for importer functions.
 
     Args:
@@ -208,13 +227,18 @@ def importer(description: str, file_extension: str, name: Optional[str] = None,
         document_annotation: An annotation from 'outputs' that should be used as the value for the
             import.document_annotation config variable, unless it or classes.text has been set manually.
         structure: A class used to parse and return the structure of source documents.
+        splitter: A function used to split large source files into chunks, which are then imported and annotated as
+            separate documents. It is called with the source file, the approximate chunk size in bytes, the name of
+            the element to split on (or None), the source encoding, and a function which opens the next chunk file
+            for writing in binary mode, given a list of the elements repeated at the start of that chunk.
         config: List of Config instances defining config options for the importer.
 
     Returns:
         A decorator
     """
     return _annotator(description=description, a_type=Annotator.importer, name=name, file_extension=file_extension,
-                      outputs=outputs, document_annotation=document_annotation, structure=structure, config=config)
+                      outputs=outputs, document_annotation=document_annotation, structure=structure, splitter=splitter,
+                      config=config)
 
 
 def exporter(description: str, name: Optional[str] = None, config: Optional[List[Config]] = None,
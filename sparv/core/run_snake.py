@@ -2,11 +2,12 @@
 
 import importlib.util
 import logging
+import os
 import sys
 
 from pkg_resources import iter_entry_points
 
-from sparv.core import log_handler, paths
+from sparv.core import content_hash, io, log_handler, paths, profiler, services, stats
 from sparv.core import registry
 from sparv.util import SparvErrorMessage
 
@@ -64,6 +65,13 @@ else:
                 f"Couldn't load plugin '{module_name}'. Please make sure it was installed correctly.", "sparv")
 
 
+# Use the work dir storage layout and compression configured for the corpus
+io.storage = snakemake.config.get("storage") or io.STORAGE_FILES
+io.compression = snakemake.config.get("compression") or io.COMPRESSION_NONE
+
+# Address of the service started for this rule, if any
+services.address = (snakemake.config.get("services") or {}).get(snakemake.rule)
+
 # Get function name and parameters
 f_name = snakemake.params.f_name
 parameters = snakemake.params.parameters
@@ -83,16 +91,48 @@ sys.stdout = StreamToLogger(module_logger)
 sys.stderr = StreamToLogger(module_logger, logging.WARNING)
 
 # Execute function
+# Annotators have the work dir included in the {doc} wildcard
+doc = snakemake.wildcards.get("doc")
+if doc and doc.startswith(str(paths.work_dir) + os.sep):
+    doc = doc[len(str(paths.work_dir)) + 1:]
+rule_name = f"{module_name}:{f_name}"
+job_stats = stats.JobStats(rule_name, doc)
 try:
-    registry.modules[module_name].functions[f_name]["function"](**parameters)
+    function = registry.modules[module_name].functions[f_name]["function"]
+    profile = profiler.should_profile(rule_name, doc, snakemake.config.get("profile", []),
+                                      snakemake.config.get("profile_docs", []))
+    job_record = None
+    if snakemake.config.get("content_hash"):
+        job_record = content_hash.JobRecord(snakemake.rule, doc, snakemake.input, snakemake.output,
+                                            content_hash.hash_job(rule_name, function, parameters))
+    if doc:
+        io.touch_changed_marker(doc)
+    if job_record and not profile and job_record.is_unchanged():
+        # Inputs are identical to last time the job was run, so the existing output is still valid
+        logger.info("SKIP: %s%s (inputs unchanged)", rule_name, f" ({doc})" if doc else "")
+        job_stats.status = "skipped"
+        job_record.restore_outputs()
+    elif profile:
+        profiler.profile_call(function, parameters, rule_name, doc, snakemake.config.get("profiler", "cprofile"))
+    else:
+        function(**parameters)
+    io.flush_writes()
+    if job_record:
+        job_record.save()
     if snakemake.params.export_dirs:
         logger.export_dirs(snakemake.params.export_dirs)
 except SparvErrorMessage as e:
     # Any exception raised here would be printed directly to the terminal, due to how Snakemake runs the script.
     # Instead we log the error message and exit with a non-zero status to signal to Snakemake that
     # something went wrong.
+    job_stats.status = "error"
     exit_with_error_message(e.message, "sparv.modules." + module_name)
+except BaseException:
+    job_stats.status = "error"
+    raise
 finally:
+    # Send resource usage statistics to log handler
+    logger.job_stats(job_stats.finish())
     # Restore printing to stdout and stderr
     sys.stdout = old_stdout
     sys.stderr = old_stderr
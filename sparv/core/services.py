@@ -0,0 +1,71 @@
+"""Long-lived processes shared by all jobs of a Sparv run.
+
+Every job is run in a process of its own, so tools that are slow to start (e.g. because they load large models) would
+otherwise be started once per document. A module can register a service for one of its annotators with the @service
+decorator. Before the first job is run, the services of all annotators with scheduled jobs are started in the main
+Sparv process, and they are stopped when the run has finished. The address of a service is handed to the jobs through
+the Snakemake config, and the annotator gets it with get_service_address().
+"""
+
+import atexit
+import inspect
+import logging
+from typing import Callable, Dict, Optional
+
+_log = logging.getLogger(__name__)
+
+# Functions starting services, keyed by the annotator function they are used by
+_services: Dict[Callable, Callable] = {}
+
+# Functions stopping the services started in the main process
+_stop_functions = []
+
+# Address of the service for the annotator of the current job, set from the Snakemake config when running jobs
+address: Optional[str] = None
+
+
+def service(annotator_function: Callable):
+    """Register a function starting a service for the jobs of an annotator.
+
+    The decorated function is called with the parameters of the annotator that it accepts (matched by name), and should
+    return a tuple (address, stop), where address is a string handed to the jobs and stop is a function stopping the
+    service.
+    """
+    def decorator(f):
+        _services[annotator_function] = f
+        return f
+    return decorator
+
+
+def has_service(annotator_function: Callable) -> bool:
+    """Check if a service is registered for an annotator."""
+    return annotator_function in _services
+
+
+def start(annotator_function: Callable, parameters: dict) -> Optional[str]:
+    """Start the service registered for an annotator and return its address, or None if it could not be started."""
+    start_function = _services[annotator_function]
+    accepted = inspect.signature(start_function).parameters
+    try:
+        service_address, stop_function = start_function(**{k: v for k, v in parameters.items() if k in accepted})
+    except Exception as e:
+        _log.warning("Could not start the service for '%s' (%s). Every job will start its own process instead.",
+                     annotator_function.__name__, e)
+        return None
+    _stop_functions.append(stop_function)
+    return service_address
+
+
+@atexit.register
+def stop_all():
+    """Stop all services started in this process."""
+    while _stop_functions:
+        try:
+            _stop_functions.pop()()
+        except Exception as e:
+            _log.warning("Could not stop service: %s", e)
+
+
+def get_service_address() -> Optional[str]:
+    """Get the address of the service for the annotator of the current job, or None if there is no running service."""
+    return address
@@ -2,23 +2,26 @@
 
 import copy
 import inspect
+import json
+import os
 import re
+import shutil
 from collections import OrderedDict, defaultdict
 from itertools import combinations
 from pathlib import Path
-from typing import Any, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import snakemake
 from snakemake.io import expand
 
 from sparv import util
 from sparv.core import config as sparv_config
-from sparv.core import io, log_handler, paths, registry
+from sparv.core import content_hash, io, log_handler, paths, planner, registry, services
 from sparv.core.console import console
 from sparv.util.classes import (AllDocuments, Annotation, AnnotationAllDocs, AnnotationData, Base, BaseAnnotation,
-                                BaseOutput, Binary, BinaryDir, Config, Corpus, Document, Export, ExportAnnotations,
-                                ExportAnnotationsAllDocs, ExportInput, Language, Model, ModelOutput, Output, OutputData,
-                                Source, SourceAnnotations, Text)
+                                BaseOutput, Binary, BinaryDir, Config, Corpus, Document, DocumentChunks, Export,
+                                ExportAnnotations, ExportAnnotationsAllDocs, ExportInput, Language, Model, ModelOutput,
+                                Output, OutputData, Source, SourceAnnotations, Text)
 
 
 class SnakeStorage:
@@ -42,7 +45,9 @@ class SnakeStorage:
 
         self.model_outputs = []  # Outputs from modelbuilders, used in build_models
         self.install_outputs = defaultdict(list)  # Outputs from all installers, used in rule install_corpus
-        self.source_files = []  # List which will contain all source files
+        self.source_files = []  # List which will contain all documents, with split source files replaced by chunks
+        self.source_chunks = {}  # Dictionary mapping source files to the documents they were split into
+        self.source_file_extension = None  # File extension of the source files used by the selected importer
         self.all_rules: List[RuleStorage] = []  # List containing all rules created
         self.ordered_rules = []  # List of rules containing rule order
 
@@ -62,6 +67,8 @@ class RuleStorage:
         self.outputs = []
         self.parameters = {}
         self.docs = []  # List of parameters referring to Document
+        self.doc_chunks = []  # List of parameters referring to DocumentChunks
+        self.source_docs = False  # True if the {doc} wildcard refers to source files instead of (chunked) documents
         self.doc_annotations = []  # List of parameters containing the {doc} wildcard
         self.wildcard_annotations = []  # List of parameters containing other wildcards
         self.configs = set()  # Set of config variables used
@@ -82,6 +89,8 @@ class RuleStorage:
         self.order = annotator_info["order"]
         self.abstract = annotator_info["abstract"]
         self.wildcards = annotator_info["wildcards"]  # Information about the wildcards used
+        self.memory = annotator_info["memory"]  # Approximate peak memory usage of one job, e.g. "6G"
+        self.threads = annotator_info["threads"]
 
 
 def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_missing: bool = False,
@@ -112,7 +121,7 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
     param_dict = make_param_dict(params)
 
     if rule.importer:
-        rule.inputs.append(Path(get_source_path(), "{doc}." + rule.file_extension))
+        rule.inputs.append(get_source_input(rule.file_extension))
         storage.all_importers.setdefault(rule.module_name, {}).setdefault(rule.f_name,
                                                                           {"description": rule.description,
                                                                            "params": param_dict})
@@ -209,7 +218,7 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
             ann_path = get_annotation_path(param_value, data=param_type.data, common=param_type.common)
             if param_type.all_docs:
                 rule.outputs.extend(map(Path, expand(escape_wildcards(paths.work_dir / ann_path),
-                                                     doc=get_source_files(storage.source_files))))
+                                                     doc=get_source_files(storage))))
             elif param_type.common:
                 rule.outputs.append(paths.work_dir / ann_path)
                 if rule.installer:
@@ -251,7 +260,7 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
             ann_path = get_annotation_path(param_value, data=param_type.data, common=param_type.common)
             if param_type.all_docs:
                 rule.inputs.extend(expand(escape_wildcards(paths.work_dir / ann_path),
-                                          doc=get_source_files(storage.source_files)))
+                                          doc=get_source_files(storage)))
             elif rule.exporter or rule.installer or param_type.common:
                 rule.inputs.append(paths.work_dir / ann_path)
             else:
@@ -296,7 +305,7 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
                     if param_type == ExportAnnotationsAllDocs:
                         rule.inputs.extend(
                             expand(escape_wildcards(paths.work_dir / get_annotation_path(annotation.name)),
-                                   doc=get_source_files(storage.source_files)))
+                                   doc=get_source_files(storage)))
                     else:
                         rule.inputs.append(paths.work_dir / get_annotation_path(annotation.name))
                 rule.parameters[param_name].append((annotation, export_name))
@@ -312,9 +321,13 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
         # Document
         elif param.annotation == Document:
             rule.docs.append(param_name)
+        # DocumentChunks (all documents a source document was split into)
+        elif param_type == DocumentChunks:
+            rule.doc_chunks.append(param_name)
+            rule.source_docs = True
         # AllDocuments (all source documents)
         elif param_type == AllDocuments:
-            rule.parameters[param_name] = AllDocuments(get_source_files(storage.source_files))
+            rule.parameters[param_name] = AllDocuments(get_source_files(storage))
         # Text
         elif param_type == Text:
             text_path = Path("{doc}") / io.TEXT_FILE
@@ -388,7 +401,10 @@ def rule_helper(rule: RuleStorage, config: dict, storage: SnakeStorage, config_m
                 rule.parameters[param_name] = ExportInput(paths.export_dir / param_value)
             if param.default.all_docs:
                 rule.inputs.extend(expand(escape_wildcards(rule.parameters[param_name]),
-                                          doc=get_source_files(storage.source_files)))
+                                          doc=get_source_files(storage)))
+            elif param.default.all_chunks:
+                rule.inputs.append(get_chunk_inputs(rule.parameters[param_name]))
+                rule.source_docs = True
             else:
                 rule.inputs.append(Path(rule.parameters[param_name]))
             if "{" in rule.parameters[param_name]:
@@ -511,6 +527,7 @@ def get_parameters(rule_params):
         # We need to make a copy of the parameters, since the rule might be used for multiple documents
         _parameters = copy.deepcopy(rule_params.parameters)
         _parameters.update({name: Document(doc) for name in rule_params.docs})
+        _parameters.update({name: DocumentChunks(io.get_doc_chunks(doc), doc=doc) for name in rule_params.doc_chunks})
 
         # Add document name to annotation and output parameters
         for param in _parameters:
@@ -577,26 +594,159 @@ def get_annotation_path(annotation, data=False, common=False):
     return path
 
 
-def get_source_files(source_files) -> List[str]:
-    """Get list of all available source files."""
-    if not source_files:
-        if not sparv_config.get("import.importer"):
-            raise util.SparvErrorMessage("The config variable 'import.importer' must not be empty.", "sparv")
-        try:
-            importer_module, _, importer_function = sparv_config.get("import.importer").partition(":")
-            file_extension = registry.modules[importer_module].functions[importer_function]["file_extension"]
-        except KeyError:
-            raise util.SparvErrorMessage(
-                "Could not find the importer '{}'. Make sure the 'import.importer' config value refers to an "
-                "existing importer.".format(sparv_config.get("import.importer")), "sparv")
-        source_files = [f[1][0] for f in snakemake.utils.listfiles(
-            Path(get_source_path(), "{file}." + file_extension))]
-    return source_files
+def get_importer_info() -> dict:
+    """Get the registry information about the importer set in import.importer."""
+    if not sparv_config.get("import.importer"):
+        raise util.SparvErrorMessage("The config variable 'import.importer' must not be empty.", "sparv")
+    try:
+        importer_module, _, importer_function = sparv_config.get("import.importer").partition(":")
+        return registry.modules[importer_module].functions[importer_function]
+    except KeyError:
+        raise util.SparvErrorMessage(
+            "Could not find the importer '{}'. Make sure the 'import.importer' config value refers to an "
+            "existing importer.".format(sparv_config.get("import.importer")), "sparv")
 
 
-def get_doc_values(config, snake_storage):
-    """Get a list of files represented by the doc wildcard."""
-    return config.get("doc") or get_source_files(snake_storage.source_files)
+def get_source_files(storage: SnakeStorage) -> List[str]:
+    """Get list of all available documents, with source files that have been split replaced by their chunks.
+
+    Source files are never split here, but by the split_source rule, which Sparv runs before annotating (see
+    get_split_targets()). Source files that should be split but haven't been yet are represented by themselves.
+    """
+    if not storage.source_files:
+        importer_info = get_importer_info()
+        file_extension = importer_info["file_extension"]
+        storage.source_file_extension = file_extension
+        split_size = parse_size(sparv_config.get("import.split_size")) if importer_info["splitter"] else 0
+        for f in snakemake.utils.listfiles(Path(get_source_path(), "{file}." + file_extension)):
+            doc = f[1][0]
+            storage.source_chunks[doc] = get_source_chunks(doc, Path(f[0]), split_size) if split_size else [doc]
+            storage.source_files.extend(storage.source_chunks[doc])
+    return storage.source_files
+
+
+def _get_split_settings(source_file: Path, split_size: int) -> Optional[dict]:
+    """Get the settings that a source file is split with, or None if it is too small to be split."""
+    source_stat = source_file.stat()
+    if source_stat.st_size <= split_size:
+        return None
+    return {
+        "size": source_stat.st_size,
+        "mtime": source_stat.st_mtime_ns,
+        "split_size": split_size,
+        "split_on": sparv_config.get("import.split_on")
+    }
+
+
+def get_source_chunks(doc: str, source_file: Path, split_size: int) -> List[str]:
+    """Get the names of the documents that a source file was split into, if it was split with the current settings."""
+    settings = _get_split_settings(source_file, split_size)
+    if settings is None:
+        return [doc]
+    manifest = io.read_chunk_manifest(doc)
+    if not manifest or manifest["source"] != settings:
+        return [doc]
+    return io.get_doc_chunks(doc)
+
+
+def get_split_targets(storage: SnakeStorage) -> List[Path]:
+    """Get the chunk manifests of all source files larger than import.split_size, for the split_sources rule.
+
+    Manifests of files split with other settings are removed, so that Snakemake splits them again.
+    """
+    importer_info = get_importer_info()
+    split_size = parse_size(sparv_config.get("import.split_size"))
+    if not split_size or not importer_info["splitter"]:
+        return []
+    targets = []
+    for f in snakemake.utils.listfiles(Path(get_source_path(), "{file}." + importer_info["file_extension"])):
+        doc = f[1][0]
+        settings = _get_split_settings(Path(f[0]), split_size)
+        if settings is None:
+            continue
+        manifest = io.read_chunk_manifest(doc)
+        if manifest and manifest["source"] != settings:
+            io.get_chunk_manifest_path(doc).unlink()
+        targets.append(io.get_chunk_manifest_path(doc))
+    return targets
+
+
+def split_source(doc: str, source_file: Path) -> None:
+    """Split a source file into chunks and save a manifest describing the chunks."""
+    importer_info = get_importer_info()
+    file_extension = importer_info["file_extension"]
+    settings = _get_split_settings(source_file, parse_size(sparv_config.get("import.split_size")))
+    manifest_path = io.get_chunk_manifest_path(doc)
+    chunk_dir = io.get_chunk_dir(doc)
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    chunk_dir.mkdir(parents=True)
+    chunks = []
+
+    def new_chunk(repeated: List[str]):
+        """Open the next chunk file for writing."""
+        chunks.append({"name": io.get_chunk_name(len(chunks)), "repeated": repeated})
+        return open(chunk_dir / f"{chunks[-1]['name']}.{file_extension}", "wb")
+
+    importer_info["splitter"](source_file, settings["split_size"], settings["split_on"],
+                              sparv_config.get("import.encoding"), new_chunk)
+    # Nothing gained from a single chunk, so remember to use the source file as is
+    if len(chunks) == 1:
+        shutil.rmtree(chunk_dir)
+        chunks = []
+    manifest = {"source": settings, "chunks": chunks}
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def get_source_input(file_extension: str):
+    """Return an input function giving the source file (or chunk) of the {doc} wildcard, for use by importers."""
+    def source_input(wildcards):
+        return str(io.get_source_file(get_source_path(), wildcards.doc, file_extension))
+    return source_input
+
+
+def get_chunk_inputs(pattern: str):
+    """Return an input function expanding {doc} in pattern to all documents the source document was split into."""
+    def chunk_inputs(wildcards):
+        return expand(escape_wildcards(pattern), doc=io.get_doc_chunks(wildcards.doc))
+    return chunk_inputs
+
+
+def parse_size(size) -> int:
+    """Convert a size given as a number of bytes or as a string like '100M' or '2G' to a number of bytes."""
+    if not size:
+        return 0
+    if isinstance(size, str):
+        size = size.strip().upper().rstrip("B")
+        if size and size[-1] in "KMGT":
+            return int(float(size[:-1]) * 1024 ** ("KMGT".index(size[-1]) + 1))
+    return int(size)
+
+
+def get_rule_resources(rule: RuleStorage, measured_memory: dict) -> dict:
+    """Get Snakemake resources for a rule, preferring memory usage measured in previous runs over declared usage."""
+    memory = measured_memory.get(rule.full_name)
+    if memory:
+        # Leave some margin, since memory usage varies between documents
+        memory = int(memory * 1.2)
+    else:
+        memory = parse_size(rule.memory)
+    return {"mem_mb": -(-memory // 1024 ** 2)} if memory else {}
+
+
+def get_doc_values(config, snake_storage, source_docs: bool = False):
+    """Get a list of files represented by the doc wildcard.
+
+    Unless source_docs is True, source files that were split are represented by their chunks.
+    """
+    get_source_files(snake_storage)
+    if source_docs:
+        return config.get("doc") or list(snake_storage.source_chunks)
+    if config.get("doc"):
+        return [chunk for doc in config["doc"] for chunk in snake_storage.source_chunks.get(doc, [doc])]
+    return snake_storage.source_files
 
 
 def get_wildcard_values(config):
@@ -650,7 +800,81 @@ def get_install_outputs(snake_storage: SnakeStorage, install_types: Optional[Lis
     return install_inputs
 
 
-def get_export_targets(snake_storage, rules, doc, wildcards):
+def get_intermediate_outputs(snake_storage: SnakeStorage) -> Set[str]:
+    """Get output patterns of annotators that are not used directly by any exporter or installer.
+
+    These annotations are only needed as input to other annotators, and can be removed once those have been run.
+    """
+    doc_prefix = "{doc}" + os.sep  # Annotators have the work dir included in the {doc} wildcard
+    candidates = {}
+    for rule in snake_storage.all_rules:
+        if rule.annotator:
+            for output in map(str, rule.outputs):
+                if output.startswith(doc_prefix):
+                    # Outputs may contain other wildcards, like {annotation}, so compare using regular expressions
+                    candidates[output] = re.compile(snakemake.io.regex(output[len(doc_prefix):]))
+
+    intermediate_outputs = set(candidates)
+    for rule in snake_storage.all_rules:
+        if rule.exporter or rule.installer:
+            for i in rule.inputs:
+                if callable(i):
+                    continue
+                i = str(i)
+                for output in list(intermediate_outputs):
+                    if "{doc}" in i:
+                        needed = candidates[output].match(i.split(doc_prefix, 1)[-1])
+                    else:
+                        # Inputs of exporters using all documents are already expanded
+                        needed = any(candidates[output].match(i[m.end():]) for m in re.finditer(re.escape(os.sep), i))
+                    if needed:
+                        intermediate_outputs.discard(output)
+    return intermediate_outputs
+
+
+def start_services(snake_storage: SnakeStorage, scheduled_rules: Set[str]) -> Dict[str, str]:
+    """Start the services needed by the scheduled rules, and return their addresses keyed by rule name."""
+    addresses = {}
+    for rule in snake_storage.all_rules:
+        function = rule.annotator_info["function"]
+        if rule.rule_name in scheduled_rules and services.has_service(function):
+            address = services.start(function, rule.parameters)
+            if address is not None:
+                addresses[rule.rule_name] = address
+    return addresses
+
+
+def remove_intermediate_outputs(snake_storage: SnakeStorage) -> int:
+    """Remove annotation files not used by any exporter or installer from the work dir, for all documents.
+
+    Content hash records of the rules creating them are removed as well, since they keep links to the files.
+    Return the number of removed files.
+    """
+    intermediate_outputs = get_intermediate_outputs(snake_storage)
+    removed_files = 0
+    for output in intermediate_outputs:
+        # Annotators have the work dir included in the {doc} wildcard, but only the work dir should be searched
+        pattern = str(paths.work_dir / "{doc}" / output[len("{doc}") + 1:])
+        # The pattern may have other wildcards than {doc}, like {annotation}
+        wildcards = snakemake.io.glob_wildcards(pattern)
+        files = {snakemake.io.apply_wildcards(pattern, dict(zip(wildcards._fields, values)))
+                 for values in zip(*wildcards)}
+        for file in files:
+            os.remove(file)
+            removed_files += 1
+
+    hashes_dir = paths.work_dir / content_hash.HASHES_DIR
+    if hashes_dir.is_dir():
+        for rule in snake_storage.all_rules:
+            if rule.annotator and intermediate_outputs.intersection(map(str, rule.outputs)):
+                record_name = content_hash.get_record_path(rule.rule_name).name
+                for record_path in hashes_dir.rglob(record_name):
+                    shutil.rmtree(record_path.with_suffix(""), ignore_errors=True)
+                    record_path.unlink()
+    return removed_files
+
+
+def get_export_targets(snake_storage, rules, config, wildcards):
     """Get export targets from sparv_config."""
     all_outputs = []
 
@@ -658,8 +882,12 @@ def get_export_targets(snake_storage, rules, doc, wildcards):
         if rule.type == "exporter" and rule.target_name in sparv_config.get("export.default", []):
             # Get Snakemake rule object
             sm_rule = getattr(rules, rule.rule_name).rule
-            # Get all output files for all documents
-            rule_outputs = expand(rule.outputs if not rule.abstract else rule.inputs, doc=doc, **wildcards)
+            # Get all output files for all documents (or only the ones that are not up to date)
+            targets = rule.outputs if not rule.abstract else rule.inputs
+            docs = get_doc_values(config, snake_storage, rule.source_docs)
+            if planner.current:
+                docs = planner.current.filter_docs(rule, targets, docs)
+            rule_outputs = expand(targets, doc=docs, **wildcards)
             # Convert paths to IOFile objects so Snakemake knows which rule they come from (in case of ambiguity)
             all_outputs.extend([snakemake.io.IOFile(f, rule=sm_rule) for f in rule_outputs])
 
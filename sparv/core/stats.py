@@ -0,0 +1,110 @@
+"""Collect resource usage statistics for Sparv jobs."""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Fields reported for every job, in the order used for the summary table and CSV report
+FIELDS = ["rule", "doc", "status", "wall_time", "cpu_time", "max_rss", "bytes_read", "bytes_written", "model_load_time"]
+
+# Total time spent loading models in the current process
+_model_load_time = 0.0
+
+
+@contextmanager
+def model_loading():
+    """Context manager for measuring time spent loading models.
+
+    Time spent inside the context is added to the model load time reported for the current job.
+    """
+    global _model_load_time
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _model_load_time += time.perf_counter() - start
+
+
+def _get_io_counters() -> Optional[dict]:
+    """Get number of bytes read and written by the current process, if supported by the OS."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return {"read": int(counters["rchar"]), "written": int(counters["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _get_cpu_time() -> float:
+    """Get user and system CPU time used by the current process and its finished child processes."""
+    if resource is None:
+        return time.process_time()
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return self_usage.ru_utime + self_usage.ru_stime + children_usage.ru_utime + children_usage.ru_stime
+
+
+def get_max_rss() -> Optional[int]:
+    """Get peak resident set size in bytes of the current process or its largest child process."""
+    if resource is None:
+        return None
+    max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class JobStats:
+    """Measure resource usage of a single job."""
+
+    def __init__(self, rule: str, doc: Optional[str] = None):
+        self.rule = rule
+        self.doc = doc
+        self.status = "ok"
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _get_cpu_time()
+        self._start_io = _get_io_counters()
+        self._start_model_load = _model_load_time
+
+    def finish(self) -> dict:
+        """Stop measuring and return the collected statistics."""
+        end_io = _get_io_counters()
+        if self._start_io is not None and end_io is not None:
+            bytes_read = end_io["read"] - self._start_io["read"]
+            bytes_written = end_io["written"] - self._start_io["written"]
+        else:
+            bytes_read = bytes_written = None
+        return {
+            "rule": self.rule,
+            "doc": self.doc,
+            "status": self.status,
+            "wall_time": time.perf_counter() - self._start_wall,
+            "cpu_time": _get_cpu_time() - self._start_cpu,
+            "max_rss": get_max_rss(),
+            "bytes_read": bytes_read,
+            "bytes_written": bytes_written,
+            "model_load_time": _model_load_time - self._start_model_load
+        }
+
+
+def get_peak_memory(log_dir: Path, max_reports: int = 5) -> Dict[str, int]:
+    """Get the highest peak memory usage per rule in the most recent statistics reports in the log dir."""
+    peak_memory = {}
+    for report in sorted(Path(log_dir).glob("*.stats.json"))[-max_reports:]:
+        try:
+            with open(report, encoding="UTF-8") as f:
+                rules = json.load(f)["rules"]
+        except (OSError, ValueError, KeyError):
+            continue
+        for rule, rule_stats in rules.items():
+            if rule_stats.get("max_rss"):
+                peak_memory[rule] = max(peak_memory.get(rule, 0), rule_stats["max_rss"])
+    return peak_memory
@@ -11,6 +11,11 @@ __config__ = [
     Config("import.normalize", "NFC", description="Normalize input using any of the following forms: "
                                                   "'NFC', 'NFKC', 'NFD', and 'NFKD'"),
     Config("import.encoding", "UTF-8", description="Encoding of source documents"),
+    Config("import.split_size", 0,
+           description="Split source files larger than this into chunks of roughly this size, which are annotated as "
+                       "separate documents. Either a number of bytes or a string like '100M'. 0 disables splitting"),
+    Config("import.split_on", description="Name of element to split source files on when 'split_size' is set, for "
+                                          "importers that support it. Defaults to the children of the root element"),
 ]
 
 
@@ -0,0 +1,19 @@
+"""Settings for the Sparv work directory."""
+
+from sparv import Config
+
+__config__ = [
+    Config("workdir.content_hash", False,
+           description="Skip jobs whose input files, parameters and code are unchanged since they were last run, "
+                       "comparing file contents instead of modification times"),
+    Config("workdir.planner", False,
+           description="Leave out documents that were completely processed in an earlier run when building the "
+                       "Snakemake workflow, making start-up time depend on the amount of work instead of corpus size"),
+    Config("workdir.storage", "files",
+           description="How annotations are stored in the work dir: 'files' for one file per annotation, or 'packed' "
+                       "for storing the data in one SQLite file per document (the paths are kept as links to small "
+                       "marker files for Snakemake; for local disks only)"),
+    Config("workdir.compression", "none",
+           description="Compression of annotation files in the work dir: 'none', 'gzip', 'lz4' or 'zstd' (lz4 and "
+                       "zstd need the Python packages 'lz4' and 'zstandard', and fall back to gzip when missing)")
+]
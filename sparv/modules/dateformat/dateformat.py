@@ -148,195 +148,228 @@ def resolution(out_resolution: OutputCommonData = OutputCommonData("dateformat.r
 def _formatter(in_from: Annotation, in_to: Optional[Annotation], out_from: Output, out_to: Output,
                informat: str, outformat: str, splitter: str, regex: str):
     """Take existing dates/times and input formats and convert to specified output format."""
-    def get_smallest_unit(informat):
-        smallest_unit = 0  # No date
-
-        if "%y" not in informat and "%Y" not in informat:
-            pass
-        elif "%b" not in informat and "%B" not in informat and "%m" not in informat:
-            smallest_unit = 1  # year
-        elif "%d" not in informat:
-            smallest_unit = 2  # month
-        elif "%H" not in informat and "%I" not in informat:
-            smallest_unit = 3  # day
-        elif "%M" not in informat:
-            smallest_unit = 4  # hour
-        elif "%S" not in informat:
-            smallest_unit = 5  # minute
-        else:
-            smallest_unit = 6  # second
-
-        return smallest_unit
-
-    def get_date_length(informat):
-        parts = informat.split("%")
-        length = len(parts[0])  # First value is either blank or not part of date
-
-        lengths = {"Y": 4,
-                   "3Y": 3,
-                   "y": 2,
-                   "m": 2,
-                   "b": None,
-                   "B": None,
-                   "d": 2,
-                   "H": None,
-                   "I": None,
-                   "M": 2,
-                   "S": 2}
-
-        for part in parts[1:]:
-            add = lengths.get(part[0], None)
-            if add:
-                length += add + len(part[1:])
-            else:
-                return None
-
-        return length
-
     if not in_to:
         in_to = in_from
 
-    informat = informat.split("|")
-    outformat = outformat.split("|")
-    if splitter:
-        splitter = splitter
+    parser = _DateParser(informat, outformat, splitter, regex)
 
-    assert len(outformat) == 1 or (len(outformat) == len(informat)), "The number of out-formats must be equal to one " \
-                                                                     "or the number of in-formats."
-
-    ifrom = list(in_from.read())
-    ofrom = in_from.create_empty_attribute()
+    def format_from(dates, outformat, _inf):
+        if len(dates) == 1 or out_to:
+            return dates[0].strftime(outformat)
+        else:
+            outstrings = [fromdate.strftime(outformat) for fromdate in dates]
+            return outstrings[0] + splitter + outstrings[1]
 
-    for index, val in enumerate(ifrom):
-        val = val.strip()
-        if not val:
-            ofrom[index] = None
-            continue
+    out_from.write(parser.format_values(in_from, format_from))
 
+    if out_to:
+        def format_to(dates, outformat, inf):
+            return (dates[-1] + inf.to_offset).strftime(outformat)
+
+        out_to.write(parser.format_values(in_to, format_to))
+
+
+def get_smallest_unit(informat: str) -> relativedelta:
+    """Get the smallest unit of a date/time format, as a relativedelta to be added to a to-date."""
+    if "%y" not in informat and "%Y" not in informat:
+        # No year, so use the smallest unit present in the format
+        if "%S" in informat:
+            return relativedelta(seconds=1)
+        elif "%M" in informat:
+            return relativedelta(minutes=1)
+        elif "%H" in informat or "%I" in informat:
+            return relativedelta(hours=1)
+        elif "%d" in informat:
+            return relativedelta(days=1)
+        elif "%b" in informat or "%B" in informat or "%m" in informat:
+            return relativedelta(months=1)
+        return relativedelta(seconds=1)
+    elif "%b" not in informat and "%B" not in informat and "%m" not in informat:
+        return relativedelta(years=1)
+    elif "%d" not in informat:
+        return relativedelta(months=1)
+    elif "%H" not in informat and "%I" not in informat:
+        return relativedelta(days=1)
+    elif "%M" not in informat:
+        return relativedelta(hours=1)
+    elif "%S" not in informat:
+        return relativedelta(minutes=1)
+    else:
+        return relativedelta(seconds=1)
+
+
+def get_date_length(informat: str) -> Optional[int]:
+    """Get the length of dates with the given format, or None if the length may vary."""
+    parts = informat.split("%")
+    length = len(parts[0])  # First value is either blank or not part of date
+
+    lengths = {"Y": 4,
+               "3Y": 3,
+               "y": 2,
+               "m": 2,
+               "b": None,
+               "B": None,
+               "d": 2,
+               "H": None,
+               "I": None,
+               "M": 2,
+               "S": 2}
+
+    for part in parts[1:]:
+        add = lengths.get(part[0], None)
+        if add:
+            length += add + len(part[1:])
+        else:
+            return None
+
+    return length
+
+
+# Regular expressions used by datetime.strptime for numeric directives, used for parsing common formats directly
+_NUMERIC_DIRECTIVES = {
+    "Y": r"(?P<Y>\d\d\d\d)",
+    "y": r"(?P<y>\d\d)",
+    "m": r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    "d": r"(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])",
+    "H": r"(?P<H>2[0-3]|[0-1]\d|\d)",
+    "M": r"(?P<M>[0-5]\d|\d)",
+    "S": r"(?P<S>6[0-1]|[0-5]\d|\d)"
+}
+
+
+class _FormatPart:
+    """A single date/time format, compiled for parsing values."""
+
+    def __init__(self, informat: str):
+        # Dates with three-digit years are zero-padded before parsing
+        self.padded_year = "%3Y" in informat
+        if self.padded_year:
+            self.padded_year_length = get_date_length(informat)
+            informat = informat.replace("%3Y", "%Y")
+        # %0m and %0d are %m and %d with a required leading zero
+        self.zero_padded_length = None
+        if "%0m" in informat or "%0d" in informat:
+            informat = informat.replace("%0m", "%m").replace("%0d", "%d")
+            self.zero_padded_length = get_date_length(informat)
+        self.informat = informat
+        self.regex = self._compile(informat)
+
+    @staticmethod
+    def _compile(informat: str):
+        """Compile format to a regular expression if it only has numeric directives, otherwise return None."""
+        parts = re.split(r"(%.)", informat)
+        directives = parts[1::2]
+        if len(set(directives)) < len(directives) or any(d[1] not in _NUMERIC_DIRECTIVES for d in directives) or \
+                any(c.isspace() or "%" in c for c in parts[::2]):
+            return None
+        pattern = "".join(_NUMERIC_DIRECTIVES[part[1]] if i % 2 else re.escape(part) for i, part in enumerate(parts))
+        return re.compile(pattern, re.IGNORECASE)
+
+    def parse(self, value: str) -> datetime.datetime:
+        """Parse value, raising ValueError if it doesn't match the format."""
+        if self.padded_year:
+            if self.padded_year_length and not self.padded_year_length == len(value):
+                raise ValueError
+            value = "0" + value
+        if self.zero_padded_length and not self.zero_padded_length == len(value):
+            raise ValueError
+        if self.regex is None:
+            return datetime.datetime.strptime(value, self.informat)
+
+        # Same as datetime.strptime, for formats with only numeric directives
+        match = self.regex.match(value)
+        if not match or match.end() != len(value):
+            raise ValueError("time data %r does not match format %r" % (value, self.informat))
+        found = match.groupdict()
+        if "y" in found:
+            year = int(found["y"])
+            year += 2000 if year <= 68 else 1900
+        else:
+            year = int(found.get("Y", 1900))
+        return datetime.datetime(year, int(found.get("m", 1)), int(found.get("d", 1)), int(found.get("H", 0)),
+                                 int(found.get("M", 0)), int(found.get("S", 0)))
+
+
+class _InFormat:
+    """An in-format, compiled once and used for all values."""
+
+    def __init__(self, informat: str, splitter: Optional[str]):
+        # Formats with repeated directives and a splitter contain both a from-date and a to-date
+        self.split = False
+        if splitter and splitter in informat:
+            values = re.findall("%[YybBmdHMS]", informat)
+            self.split = len(set(values)) < len(values)
+        self.parts = [_FormatPart(inf) for inf in (informat.split(splitter) if self.split else [informat])]
+        # To-dates are moved to the last second of the smallest unit of the format
+        self.to_offset = get_smallest_unit(self.parts[0].informat) - relativedelta(seconds=1)
+
+
+class _DateParser:
+    """Parse date/time values using a list of in-formats, remembering the result for values already seen."""
+
+    def __init__(self, informat: str, outformat: str, splitter: Optional[str], regex: Optional[str]):
+        self.informats = [_InFormat(inf, splitter) for inf in informat.split("|")]
+        self.outformats = outformat.split("|")
+        assert len(self.outformats) == 1 or (len(self.outformats) == len(self.informats)), \
+            "The number of out-formats must be equal to one or the number of in-formats."
+        self.splitter = splitter
+        self.regex = re.compile(regex) if regex else None
+        self._parsed = {}
+
+    def parse(self, val: str):
+        """Parse value and return a tuple with a list of dates, the out-format and the in-format, or None."""
+        if val in self._parsed:
+            return self._parsed[val]
+
+        result = None
         tries = 0
-        for inf in informat:
-            if splitter and splitter in inf:
-                values = re.findall("%[YybBmdHMS]", inf)
-                if len(set(values)) < len(values):
-                    vals = val.split(splitter)
-                    inf = inf.split(splitter)
-            else:
-                vals = [val]
-                inf = [inf]
-
-            if regex:
+        for inf in self.informats:
+            vals = val.split(self.splitter) if inf.split else [val]
+
+            if self.regex:
                 temp = []
                 for v in vals:
-                    matches = re.search(regex, v)
+                    matches = self.regex.search(v)
                     if matches:
                         temp.append([x for x in matches.groups() if x][0])
                 if not temp:
                     # If the regex doesn't match, treat as no date
-                    ofrom[index] = None
                     continue
                 vals = temp
 
             tries += 1
             try:
-                fromdates = []
-                for i, v in enumerate(vals):
-                    if "%3Y" in inf[i]:
-                        datelen = get_date_length(inf[i])
-                        if datelen and not datelen == len(v):
-                            raise ValueError
-                        inf[i] = inf[i].replace("%3Y", "%Y")
-                        v = "0" + v
-                    if "%0m" in inf[i] or "%0d" in inf[i]:
-                        inf[i] = inf[i].replace("%0m", "%m").replace("%0d", "%d")
-                        datelen = get_date_length(inf[i])
-                        if datelen and not datelen == len(v):
-                            raise ValueError
-                    fromdates.append(datetime.datetime.strptime(v, inf[i]))
-                if len(fromdates) == 1 or out_to:
-                    ofrom[index] = fromdates[0].strftime(outformat[0] if len(outformat) == 1 else outformat[tries - 1])
-                else:
-                    outstrings = [fromdate.strftime(outformat[0] if len(outformat) == 1 else outformat[tries - 1])
-                                  for fromdate in fromdates]
-                    ofrom[index] = outstrings[0] + splitter + outstrings[1]
+                dates = [inf.parts[i].parse(v) for i, v in enumerate(vals)]
+                result = dates, self.outformats[0] if len(self.outformats) == 1 else self.outformats[tries - 1], inf
                 break
             except ValueError:
-                if tries == len(informat):
+                if tries == len(self.informats):
                     log.error("Could not parse: %s", str(vals))
                     raise
                 continue
 
-    out_from.write(ofrom)
-    del ofrom
-
-    if out_to:
-        ito = list(in_to.read())
-        oto = in_to.create_empty_attribute()
-
-        for index, val in enumerate(ito):
+        self._parsed[val] = result
+        return result
+
+    def format_values(self, annotation: Annotation, format_dates) -> list:
+        """Parse and format all values of an annotation.
+
+        Args:
+            annotation: Annotation with the values to format.
+            format_dates: Function taking a list of dates, the out-format and the in-format, and returning the
+                formatted value.
+        """
+        out = annotation.create_empty_attribute()
+        formatted = {}
+        for index, val in enumerate(annotation.read()):
+            val = val.strip()
             if not val:
-                oto[index] = None
                 continue
-
-            tries = 0
-            for inf in informat:
-                if splitter and splitter in inf:
-                    values = re.findall("%[YybBmdHMS]", inf)
-                    if len(set(values)) < len(values):
-                        vals = val.split(splitter)
-                        inf = inf.split(splitter)
+            if val not in formatted:
+                result = self.parse(val)
+                if result is None:
+                    formatted[val] = None
                 else:
-                    vals = [val]
-                    inf = [inf]
-
-                if regex:
-                    temp = []
-                    for v in vals:
-                        matches = re.search(regex, v)
-                        if matches:
-                            temp.append([x for x in matches.groups() if x][0])
-                    if not temp:
-                        # If the regex doesn't match, treat as no date
-                        oto[index] = None
-                        continue
-                    vals = temp
-
-                tries += 1
-                try:
-                    todates = []
-                    for i, v in enumerate(vals):
-                        if "%3Y" in inf[i]:
-                            datelen = get_date_length(inf[i])
-                            if datelen and not datelen == len(v):
-                                raise ValueError
-                            inf[i] = inf[i].replace("%3Y", "%Y")
-                            v = "0" + v
-                        if "%0m" in inf[i] or "%0d" in inf[i]:
-                            inf[i] = inf[i].replace("%0m", "%m").replace("%0d", "%d")
-                            datelen = get_date_length(inf[i])
-                            if datelen and not datelen == len(v):
-                                raise ValueError
-                        todates.append(datetime.datetime.strptime(v, inf[i]))
-                    smallest_unit = get_smallest_unit(inf[0])
-                    if smallest_unit == 1:
-                        add = relativedelta(years=1)
-                    elif smallest_unit == 2:
-                        add = relativedelta(months=1)
-                    elif smallest_unit == 3:
-                        add = relativedelta(days=1)
-                    elif smallest_unit == 4:
-                        add = relativedelta(hours=1)
-                    elif smallest_unit == 5:
-                        add = relativedelta(minutes=1)
-                    elif smallest_unit == 6:
-                        add = relativedelta(seconds=1)
-
-                    todates = [todate + add - relativedelta(seconds=1) for todate in todates]
-                    oto[index] = todates[-1].strftime(outformat[0] if len(outformat) == 1 else outformat[tries - 1])
-                    break
-                except ValueError:
-                    if tries == len(informat):
-                        log.error("Could not parse: %s", str(vals))
-                        raise
-                    continue
-
-        out_to.write(oto)
+                    formatted[val] = format_dates(*result)
+            out[index] = formatted[val]
+        return out
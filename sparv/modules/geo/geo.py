@@ -1,14 +1,23 @@
 """Annotate geographical features."""
 
 import logging
-import pickle
+import mmap
+import os
 from collections import defaultdict
+from typing import Optional, Set
 
 import sparv.util as util
 from sparv import Annotation, Config, Model, ModelOutput, Output, Wildcard, annotator, modelbuilder
 
 log = logging.getLogger(__name__)
 
+_INDEX_HEADER = b"# Sparv geo index 1\n"
+_FIELD_SEP = "\x1f"
+_MAIN_NAME = "*"  # Used instead of a language code for the main name of a location
+
+# Loaded indexes, kept for the lifetime of the worker process
+_index_cache = {}
+
 
 @annotator("Annotate {chunk} with location data, based on locations contained within the text", language=["swe"],
            config=[
@@ -68,7 +77,7 @@ def contextual(out: Output = Output("{chunk}:geo.geo_context", description="Geog
 
 @annotator("Annotate {chunk} with location data, based on metadata containing location names", config=[
     Config("geo.metadata_source", default="", description="Source attribute for location metadata"),
-    Config("geo.model", default="geo/geo.pickle", description="Path to model")
+    Config("geo.model", default="geo/geo.idx", description="Path to model")
 ], wildcards=[Wildcard("chunk", Wildcard.ANNOTATION)])
 def metadata(out: Output = Output("{chunk}:geo.geo_metadata", description="Geographical places with coordinates"),
              chunk: Annotation = Annotation("{chunk}"),
@@ -114,7 +123,7 @@ def metadata(out: Output = Output("{chunk}:geo.geo_metadata", description="Geogr
 
 
 @modelbuilder("Model for geo tagging")
-def build_model(out: ModelOutput = ModelOutput("geo/geo.pickle")):
+def build_model(out: ModelOutput = ModelOutput("geo/geo.idx")):
     """Download and build geo model."""
     # Download and extract cities1000.txt
     cities_zip = Model("geo/cities1000.zip")
@@ -126,7 +135,7 @@ def build_model(out: ModelOutput = ModelOutput("geo/geo.pickle")):
     names_zip.download("http://download.geonames.org/export/dump/alternateNames.zip")
     names_zip.unzip()
 
-    pickle_model(Model("geo/cities1000.txt"), Model("geo/alternateNames.txt"), out)
+    write_index(Model("geo/cities1000.txt"), Model("geo/alternateNames.txt"), out)
 
     # Clean up
     cities_zip.remove()
@@ -136,43 +145,43 @@ def build_model(out: ModelOutput = ModelOutput("geo/geo.pickle")):
     Model("geo/alternateNames.txt").remove()
 
 
-def pickle_model(geonames, alternative_names, out):
-    """Read list of cities from Geonames dump (http://download.geonames.org/export/dump/).
+def write_index(geonames: Model, alternative_names: Model, out: Model):
+    """Read list of cities from Geonames dump (http://download.geonames.org/export/dump/) and save a name index.
 
-    Add alternative names for each city.
+    Alternative names are added for each city, together with their language codes. The index is saved as a text file
+    with one line per lowercased name, sorted so that names can be looked up using binary search (see GeoIndex).
     """
     log.info("Reading geonames: %s", geonames.name)
-    result = {}
-
-    model_file = geonames.read()
-    for line in model_file.split("\n"):
-        if line.strip():
-            geonameid, name, _, _, latitude, longitude, _feature_class, _feature_code, \
-                country, _, _admin1, _admin2, _admin3, _admin4, population, _, _, _, _ = line.split("\t")
-
-            result[geonameid] = {
-                "name": name,
-                "alternative_names": {},
-                "latitude": latitude,
-                "longitude": longitude,
-                "country": country,
-                "population": population
-            }
+    locations = {}
+    index = defaultdict(set)
+
+    with open(geonames.path, encoding="UTF-8") as f:
+        for line in f:
+            if line.strip():
+                geonameid, name, _, _, latitude, longitude, _feature_class, _feature_code, country, _, _admin1, \
+                    _admin2, _admin3, _admin4, population, _, _, _, _ = line.rstrip("\n").split("\t")
+                locations[geonameid] = _FIELD_SEP.join((name, latitude, longitude, country, population))
+                index[name.lower()].add((locations[geonameid], _MAIN_NAME))
 
     # Parse file with alternative names of locations, paired with language codes
     log.info("Reading alternative names: %s", alternative_names.name)
-
-    model_file = alternative_names.read()
-    for line in model_file.split("\n"):
-        if line.strip():
-            _altid, geonameid, isolanguage, altname, _is_preferred_name, _is_short_name, \
-                _is_colloquial, _is_historic = line.split("\t")
-            if geonameid in result:
-                result[geonameid]["alternative_names"].setdefault(isolanguage, [])
-                result[geonameid]["alternative_names"][isolanguage].append(altname)
-
-    log.info("Saving geomodel in Pickle format")
-    out.write_pickle(result)
+    with open(alternative_names.path, encoding="UTF-8") as f:
+        for line in f:
+            if line.strip():
+                _altid, geonameid, isolanguage, altname, _is_preferred_name, _is_short_name, \
+                    _is_colloquial, _is_historic = line.rstrip("\n").split("\t")[:8]
+                if geonameid in locations:
+                    index[altname.lower()].add((locations[geonameid], isolanguage))
+
+    log.info("Saving geomodel index")
+    os.makedirs(out.path.parent, exist_ok=True)
+    with open(out.path, "wb") as f:
+        f.write(_INDEX_HEADER)
+        # Sort by encoded name, since lookups compare bytes
+        for key, name in sorted((name.encode("UTF-8"), name) for name in index if name):
+            entries = "\t".join(_FIELD_SEP.join(entry) for entry in sorted(index[name]))
+            f.write(key + b"\t" + entries.encode("UTF-8") + b"\n")
+    log.info("Wrote %d geographical names: %s", len(index), out.name)
 
 
 ########################################################################################################
@@ -180,24 +189,55 @@ def pickle_model(geonames, alternative_names, out):
 ########################################################################################################
 
 
-def load_model(model: Model, language=()):
-    """Load geo model and return as dict."""
-    log.info("Reading geomodel: %s", model)
-    with open(model.path, "rb") as infile:
-        m = pickle.load(infile)
-
-    result = defaultdict(set)
-    for _geonameid, l in list(m.items()):
-        result[l["name"].lower()].add((l["name"], l["latitude"], l["longitude"], l["country"], l["population"]))
-        for lang in l["alternative_names"]:
-            if lang in language or not language:
-                for altname in l["alternative_names"][lang]:
-                    result[altname.lower()].add(
-                        (l["name"], l["latitude"], l["longitude"], l["country"], l["population"]))
-
-    log.info("Read %d geographical names", len(result))
-
-    return result
+class GeoIndex:
+    """Read-only lookup of locations by lowercased name, using a memory mapped index file."""
+
+    def __init__(self, path, language=()):
+        self.language = set(language)
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(_INDEX_HEADER)] != _INDEX_HEADER:
+            raise util.SparvErrorMessage(f"The geo model '{path}' is not a valid index. Please rebuild the model.")
+
+    def _find(self, key: bytes) -> Optional[bytes]:
+        """Binary search for the line with the given key and return the data following the key."""
+        mm = self._mm
+        lo, hi = len(_INDEX_HEADER), len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = max(mm.rfind(b"\n", 0, mid) + 1, lo)
+            end = mm.find(b"\n", start)
+            tab = mm.find(b"\t", start, end)
+            line_key = mm[start:tab]
+            if line_key < key:
+                lo = end + 1
+            elif line_key > key:
+                hi = start
+            else:
+                return mm[tab + 1:end]
+        return None
+
+    def get(self, name: str) -> Set[tuple]:
+        """Get all locations (name, latitude, longitude, country, population) with the given lowercased name."""
+        data = self._find(name.encode("UTF-8"))
+        if not data:
+            return set()
+        locations = set()
+        for entry in data.decode("UTF-8").split("\t"):
+            *location, lang = entry.split(_FIELD_SEP)
+            if lang == _MAIN_NAME or not self.language or lang in self.language:
+                locations.add(tuple(location))
+        return locations
+
+
+def load_model(model: Model, language=()) -> GeoIndex:
+    """Load geo model index, reusing an already loaded index within the same process."""
+    key = (str(model.path), tuple(sorted(language)))
+    if key not in _index_cache:
+        log.info("Reading geomodel: %s", model)
+        with util.model_loading():
+            _index_cache[key] = GeoIndex(model.path, language)
+    return _index_cache[key]
 
 
 def most_populous(locations):
@@ -1,7 +1,6 @@
 """Create diapivot annotation."""
 
 import logging
-import pickle
 import xml.etree.ElementTree as etree
 
 import sparv.util as util
@@ -25,14 +24,17 @@ def diapivot_annotate(out: Output = Output("<token>:hist.diapivot", description=
         model (str, optional): Crosslink model. Defaults to Model("hist/diapivot.pickle").
     """
     lexicon = PivotLexicon(model)
-    lemgram_annotation = list(lemgram.read())
+    lemgram_annotation = [lemgrams.split(util.DELIM) for lemgrams in lemgram.read()]
+
+    # Look up every distinct lemgram only once
+    exact_matches = lexicon.get_exactMatches(lemgram for lemgrams in lemgram_annotation for lemgram in lemgrams)
 
     out_annotation = []
 
     for lemgrams in lemgram_annotation:
         saldo_ids = []
-        for lemgram in lemgrams.split(util.DELIM):
-            s_i = lexicon.get_exactMatch(lemgram)
+        for lemgram in lemgrams:
+            s_i = exact_matches[lemgram]
             if s_i:
                 saldo_ids += [s_i]
         out_annotation.append(util.AFFIX + util.DELIM.join(set(saldo_ids)) + util.AFFIX if saldo_ids else util.AFFIX)
@@ -76,12 +78,7 @@ class PivotLexicon:
 
     def __init__(self, crossfile, verbose=True):
         """Read pickled lexicon."""
-        if verbose:
-            log.info("Reading cross lexicon: %s", crossfile)
-        with open(crossfile, "rb") as F:
-            self.lexicon = pickle.load(F)
-        if verbose:
-            log.info("OK, read %d words", len(self.lexicon))
+        self.lexicon = util.PickledLexicon(crossfile, verbose=verbose, index=True).lexicon
 
     def lookup(self, lem):
         """Lookup a word in the lexicon."""
@@ -97,6 +94,10 @@ class PivotLexicon:
         if s and s[0] == "exactMatch":
             return s[1]
 
+    def get_exactMatches(self, words):
+        """Get only exact matches from lexicon for all distinct words in an iterable, as a dictionary."""
+        return {word: self.get_exactMatch(word) for word in set(words)}
+
 
 def _split_val(key_val):
     return key_val.rsplit(PART_DELIM1)[1]
@@ -262,8 +262,7 @@ def annotate_full(word, sentence, reference, out, annotations, models, msd="",
     OUT = {}
 
     for sent in sentences:
-        incomplete_multis = []  # [{annotation, words, [ref], is_particle, lastwordWasGap, numberofgaps}]
-        complete_multis = []    # ([ref], annotation)
+        multiword_matcher = saldo.MultiwordMatcher(max_gaps, skip_pos_check=True, lemgram_key="lemgram")
         sentence_tokens = {}
 
         for tokid in sent:
@@ -277,18 +276,20 @@ def annotate_full(word, sentence, reference, out, annotations, models, msd="",
             annotation_info = {}
             sentence_tokens[ref] = {"tokid": tokid, "word": thewords, "msd": msdtag, "annotations": annotation_info}
 
+            # First use MSD tags to find the most probable single word annotations
+            ann_tags_words = []
             for theword in thewords:
+                ann_tags_words += saldo.find_single_word([theword], lexicons, msdtag, precision, min_precision,
+                                                         precision_filter, annotation_info)
 
-                # First use MSD tags to find the most probable single word annotations
-                ann_tags_words = saldo.find_single_word([theword], lexicons, msdtag, precision, min_precision, precision_filter, annotation_info)
+            # Find multi-word expressions
+            if not skip_multiword:
+                multiword_matcher.add_token(thewords, ref, msdtag, ann_tags_words)
 
-                # Find multi-word expressions
-                if not skip_multiword:
-                    find_multiword_expressions(incomplete_multis, complete_multis, theword, ref, max_gaps, ann_tags_words)
-
-                # Loop to next token
+            # Loop to next token
 
         # Check that we don't have any unwanted overlaps
+        complete_multis = multiword_matcher.complete_multis
         remove_unwanted_overlaps(complete_multis)
 
         # Then save the rest of the multi word expressions in sentence_tokens
@@ -303,48 +304,6 @@ def annotate_full(word, sentence, reference, out, annotations, models, msd="",
         util.write_annotation(out_file, [(tok, OUT[tok].get(annotation, affix)) for tok in OUT], append=True)
 
 
-def find_multiword_expressions(incomplete_multis, complete_multis, theword, ref, max_gaps, ann_tags_words):
-    todelfromincomplete = []  # list to keep track of which expressions that have been completed
-
-    for i, x in enumerate(incomplete_multis):
-        seeking_word = x["words"][0]  # The next word we are looking for in this multi-word expression
-
-        # TODO "*" only in saldo
-        if seeking_word == "*":
-            if x["words"][1].lower() == theword.lower():
-                seeking_word = x["words"][1]
-                del x["words"][0]
-
-        if x["numberofgaps"] > max_gaps:
-            todelfromincomplete.append(i)
-
-        elif seeking_word.lower() == theword.lower():
-            x["lastwordwasgap"] = False
-            del x["words"][0]
-            x["ref"].append(ref)
-
-            # Is current word the last word we are looking for?
-            if len(x["words"]) == 0:
-                todelfromincomplete.append(i)
-                complete_multis.append((x["ref"], x["annotation"]))
-        else:
-            # Increment gap counter if previous word was not part of a gap
-            if not x["lastwordwasgap"]:
-                x["numberofgaps"] += 1
-            x["lastwordwasgap"] = True  # Marking that previous word was part of a gap
-
-    # Remove found word from incompletes-list
-    for x in todelfromincomplete[::-1]:
-        del incomplete_multis[x]
-
-    # Is this word a possible start for multi-word units?
-    looking_for = [{"annotation": annotation, "words": words, "ref": [ref],
-                    "is_particle": is_particle, "lastwordwasgap": False, "numberofgaps": 0}
-                   for (annotation, _, wordslist, _, is_particle, _) in ann_tags_words if wordslist for words in wordslist]
-    if len(looking_for) > 0:
-        incomplete_multis.extend(looking_for)
-
-
 def get_single_annotation(lexicons, word, key, msdtag):
     annotation = []
     # TODO the translation of tags is not fully working yet.
@@ -361,24 +320,19 @@ def get_single_annotation(lexicons, word, key, msdtag):
 
 def remove_unwanted_overlaps(complete_multis):
     remove = set()
+    if len(set(re.search(r"(.*)--.*", a[1]["lemgram"][0]).groups()[0] for a in complete_multis)) > 1:
+        # Expressions from different lexicons
+        remove.update(range(len(complete_multis)))
     for ai, a in enumerate(complete_multis):
-        for b in complete_multis:
-            if re.search(r"(.*)--.*", a[1]["lemgram"][0]).groups()[0] != re.search(r"(.*)--.*", b[1]["lemgram"][0]).groups()[0]:
-                # Both are from the same lexicon
-                remove.add(ai)
-            elif len(set(a[0])) != len(a[0]):
-                # Since we allow many words for one token (when using spelling variation)
-                # we must make sure that two words of a mwe are not made up by two variants of one token
-                # that is, that the same reference-id is not used twice in a mwe
-                remove.add(ai)
-            elif re.search(r"\.\.(\w+)\.", a[1]["lemgram"][0]).groups()[0] == re.search(r"\.\.(\w+)\.", b[1]["lemgram"][0]).groups()[0]:
-                # Both are of same POS
-                if b[0][0] < a[0][0] and b[0][-1] > a[0][0] and b[0][-1] < a[0][-1]:
-                    # A case of x1 y1 x2 y2. Remove y.
-                    remove.add(ai)
-                elif a[0][0] < b[0][0] and b[0][-1] == a[0][-1]:
-                    # A case of x1 y1 xy2. Remove x.
-                    remove.add(ai)
+        if len(set(a[0])) != len(a[0]):
+            # Since we allow many words for one token (when using spelling variation)
+            # we must make sure that two words of a mwe are not made up by two variants of one token
+            # that is, that the same reference-id is not used twice in a mwe
+            remove.add(ai)
+    # Overlapping expressions of the same POS
+    remove.update(saldo.find_unwanted_overlaps(
+        complete_multis, lambda annotation: re.search(r"\.\.(\w+)\.", annotation["lemgram"][0]).groups()[0],
+        check_subset=False))
 
     for a in sorted(remove, reverse=True):
         del complete_multis[a]
@@ -1,7 +1,8 @@
 """Part of Speech annotation using Hunpos."""
 
+import hashlib
 import re
-from typing import Optional
+from typing import Callable, Optional
 
 import sparv.util as util
 from sparv import Annotation, Binary, Config, Model, ModelOutput, Output, annotator, modelbuilder
@@ -11,6 +12,12 @@ TOK_SEP = "\n"
 TAG_SEP = "\t"
 TAG_COLUMN = 1
 
+# Numbered backreferences (\1, \g<1>) and conditionals ((?(1)...)) that aren't preceded by an escaping backslash
+_NUMBERED_GROUP_REFERENCE = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\\g<\d+>|\(\?\(\d+\))")
+
+# Compiled word replacement functions, keyed by SHA-1 hash of the patterns file contents
+_patterns_cache = {}
+
 
 @annotator("Part-of-speech annotation with morphological descriptions", language=["swe"], config=[
            Config("hunpos.binary", default="hunpos-tag", description="Hunpos executable"),
@@ -36,21 +43,7 @@ def msdtag(out: Output = Output("<token>:hunpos.msd", cls="token:msd",
     elif tag_mapping is None or tag_mapping == "":
         tag_mapping = {}
 
-    pattern_list = []
-
-    if patterns:
-        with open(patterns.path, encoding="utf-8") as pat:
-            for line in pat:
-                if line.strip() and not line.startswith("#"):
-                    name, pattern, tags = line.strip().split("\t", 2)
-                    pattern_list.append((name, re.compile("^%s$" % pattern), tags))
-
-    def replace_word(w):
-        """Replace word with alias if word matches a regex pattern."""
-        for p in pattern_list:
-            if re.match(p[1], w):
-                return "[[%s]]" % p[0]
-        return w
+    replace_word = _load_patterns(patterns.path) if patterns else _no_replacement
 
     sentences, _orphans = sentence.get_children(word)
     token_word = list(word.read())
@@ -71,6 +64,82 @@ def msdtag(out: Output = Output("<token>:hunpos.msd", cls="token:msd",
     out.write(out_annotation)
 
 
+def _no_replacement(w):
+    """Return word unchanged (used when no patterns file is available)."""
+    return w
+
+
+def _load_patterns(patterns_path) -> Callable[[str], str]:
+    """Return a function replacing a word with an alias if the word matches one of the patterns in patterns_path.
+
+    Patterns are combined into compiled alternations with one named group per pattern, so each word is matched only
+    once instead of once per pattern. Patterns referring to groups by number are matched separately. The first
+    matching pattern wins, just as when trying them in order.
+    Results are memoized per word since most tokens occur many times.
+    """
+    with open(patterns_path, "rb") as f:
+        contents = f.read()
+    key = hashlib.sha1(contents).hexdigest()
+    if key in _patterns_cache:
+        return _patterns_cache[key]
+
+    names = []
+    pattern_list = []
+    for line in contents.decode("utf-8").splitlines():
+        if line.strip() and not line.startswith("#"):
+            name, pattern, _tags = line.strip().split("\t", 2)
+            names.append(name)
+            pattern_list.append(pattern)
+
+    # Patterns referring to groups by number can't be combined, since combining renumbers their groups
+    matchers = []  # List of (compiled regex, pattern names, whether the regex is a combination of several patterns)
+    combinable = []
+    for name, pattern in zip(names, pattern_list):
+        if _NUMBERED_GROUP_REFERENCE.search(pattern):
+            matchers.extend(_combine_patterns(combinable))
+            combinable = []
+            matchers.append((re.compile("^%s$" % pattern), [name], False))
+        else:
+            combinable.append((name, pattern))
+    matchers.extend(_combine_patterns(combinable))
+
+    def match(w):
+        for regex, regex_names, combined in matchers:
+            m = regex.match(w)
+            if m:
+                return regex_names[int(m.lastgroup[1:])] if combined else regex_names[0]
+        return None
+
+    memo = {}
+
+    def replace_word(w):
+        """Replace word with alias if word matches a regex pattern."""
+        try:
+            return memo[w]
+        except KeyError:
+            name = match(w)
+            replacement = memo[w] = "[[%s]]" % name if name is not None else w
+            return replacement
+
+    _patterns_cache[key] = replace_word
+    return replace_word
+
+
+def _combine_patterns(patterns):
+    """Combine (name, pattern) pairs into a single regex with one named group per pattern, keeping their order.
+
+    Patterns with their own named groups may clash when combined, and are then compiled one by one instead.
+    """
+    if not patterns:
+        return []
+    names = [name for name, _ in patterns]
+    try:
+        combined = re.compile("|".join("(?P<p%d>^%s$)" % (i, p) for i, (_, p) in enumerate(patterns)))
+        return [(combined, names, True)]
+    except re.error:
+        return [(re.compile("^%s$" % pattern), [name], False) for name, pattern in patterns]
+
+
 @annotator("Extract POS from MSD", language=["swe"])
 def postag(out: Output = Output("<token>:hunpos.pos", cls="token:pos", description="Part-of-speech tags"),
            msd: Annotation = Annotation("<token>:hunpos.msd")):
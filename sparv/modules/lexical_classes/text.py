@@ -1,7 +1,8 @@
 """Annotate text chunks with lexical classes from Blingbring or SweFN."""
 
 import logging
-from collections import defaultdict
+from collections import Counter
+from itertools import chain
 from typing import Optional
 
 import sparv.util as util
@@ -74,8 +75,16 @@ def annotate_text(out: Output, lexical_classes_token: Annotation, text: Annotati
     """
     cutoff = int(cutoff)
     text_children, _orphans = text.get_children(token, preserve_parent_annotation_order=True)
-    classes = list(lexical_classes_token.read())
-    sense = list(saldoids.read()) if types else None
+
+    # Split every distinct class and sense value only once, since the same values recur throughout the document
+    class_lists = {}
+    classes = [class_lists[c] if c in class_lists else class_lists.setdefault(c, _split_classes(c))
+               for c in lexical_classes_token.read()]
+    if types:
+        sense_keys = {}
+        sense = [sense_keys[s] if s in sense_keys else sense_keys.setdefault(s, _sense_key(s)) for s in saldoids.read()]
+    else:
+        sense = None
 
     if freq_model:
         freq_model = util.PickledLexicon(freq_model.path)
@@ -83,21 +92,19 @@ def annotate_text(out: Output, lexical_classes_token: Annotation, text: Annotati
     out_annotation = text.create_empty_attribute()
 
     for text_index, words in enumerate(text_children):
-        seen_types = set()
-        class_freqs = defaultdict(int)
-
-        for token_index in words:
+        if types:
             # Count only sense types
-            if types:
-                senses = str(sorted([s.split(util.SCORESEP)[0] for s in sense[token_index].strip(util.AFFIX).split(util.DELIM)]))
-                if senses in seen_types:
-                    continue
-                else:
-                    seen_types.add(senses)
+            seen_types = set()
+            type_words = []
+            for token_index in words:
+                if sense[token_index] not in seen_types:
+                    seen_types.add(sense[token_index])
+                    type_words.append(token_index)
+        else:
+            type_words = words
 
-            rogwords = classes[token_index].strip(util.AFFIX).split(util.DELIM) if classes[token_index] != util.AFFIX else []
-            for w in rogwords:
-                class_freqs[w] += 1
+        # Counter keeps classes in order of first occurrence, which decides the order of classes with equal scores
+        class_freqs = Counter(chain.from_iterable(classes[token_index] for token_index in type_words))
 
         if freq_model:
             for c in class_freqs:
@@ -106,7 +113,7 @@ def annotate_text(out: Output, lexical_classes_token: Annotation, text: Annotati
                 # Calculate class dominance
                 ref_freq = freq_model.lookup(c.replace("_", " "), 0)
                 if not ref_freq:
-                    log.error("Class '%s' is missing" % ref_freq)
+                    log.error("Class '%s' is missing" % c)
                 class_freqs[c] = (rel / ref_freq)
 
         # Sort words according to frequency/dominance
@@ -127,3 +134,13 @@ def annotate_text(out: Output, lexical_classes_token: Annotation, text: Annotati
         out_annotation[text_index] = util.cwbset(ordered_words, delimiter, affix) if ordered_words else affix
 
     out.write(out_annotation)
+
+
+def _split_classes(value: str) -> tuple:
+    """Split a set of token level classes."""
+    return tuple(value.strip(util.AFFIX).split(util.DELIM)) if value != util.AFFIX else ()
+
+
+def _sense_key(value: str) -> tuple:
+    """Get the sense IDs of a token without scores, as a hashable key for counting sense types."""
+    return tuple(sorted(s.split(util.SCORESEP)[0] for s in value.strip(util.AFFIX).split(util.DELIM)))
@@ -106,7 +106,7 @@ def annotate_words(out: Output, model: Model, saldoids: Annotation, pos: Annotat
       but is used in the catapult. This argument must be last.
     """
     if not lexicon:
-        lexicon = util.PickledLexicon(model.path)
+        lexicon = util.PickledLexicon(model.path, index=True)
     # Otherwise use pre-loaded lexicon (from catapult)
 
     sense = saldoids.read()
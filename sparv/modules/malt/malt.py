@@ -27,7 +27,7 @@ UNDEF = "_"
     Config("malt.jar", default="maltparser-1.7.2/maltparser-1.7.2.jar",
            description="Path name of the executable .jar file"),
     Config("malt.model", default="malt/swemalt-1.7.2.mco", description="Path to MALT model")
-])
+], memory="1500M")
 def annotate(maltjar: Binary = Binary("[malt.jar]"),
              model: Model = Model("[malt.model]"),
              out_dephead: Output = Output("<token>:malt.dephead", cls="token:dephead",
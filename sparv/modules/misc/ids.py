@@ -60,10 +60,12 @@ def ids(doc: Document = Document(),
 
     ann = list(annotation.read())
     out_annotation = []
+    used_ids = set()
     # Use doc name and annotation name as seed for the IDs
     _reset_id("{}/{}".format(doc, annotation), len(ann))
     for _ in ann:
-        new_id = _make_id(prefix, out_annotation)
+        new_id = _make_id(prefix, used_ids)
+        used_ids.add(new_id)
         out_annotation.append(new_id)
     out.write(out_annotation)
 
@@ -77,8 +79,8 @@ def _reset_id(seed, max_ids=None):
     random.seed(seed)
 
 
-def _make_id(prefix, existing_ids=()):
-    """Create a unique identifier with a given prefix."""
+def _make_id(prefix, existing_ids=frozenset()):
+    """Create a unique identifier with a given prefix, not present in the set 'existing_ids'."""
     while True:
         n = random.getrandbits(_ID_LENGTH * 4)
         ident = prefix + hex(n)[2:].zfill(_ID_LENGTH)
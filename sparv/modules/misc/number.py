@@ -52,10 +52,7 @@ def number_by_attribute(out: Output = Output("{annotation}:misc.number_by_{attri
                         zfill: bool = False,
                         start: int = START_DEFAULT):
     """Number chunks, with the order determined by an attribute."""
-    def _order(_index, value):
-        return _natural_sorting(value)
-
-    _read_chunks_and_write_new_ordering(out, chunk, _order, prefix, zfill, start)
+    _read_chunks_and_write_new_ordering(out, chunk, _natural_sorting, prefix, zfill, start, by_value=True)
 
 
 @annotator("Renumber already numbered {annotation}:{attribute}, in new random order", wildcards=[
@@ -71,11 +68,11 @@ def renumber_by_shuffle(out: Output = Output("{annotation}:misc.renumber_by_shuf
 
     Retains the connection between parallelly numbered chunks by using the values as random seed.
     """
-    def _order(_index, value):
+    def _order(value):
         random.seed(int(hexlify(value.encode()), 16))
         return random.random(), _natural_sorting(value)
 
-    _read_chunks_and_write_new_ordering(out, chunk, _order, prefix, zfill, start)
+    _read_chunks_and_write_new_ordering(out, chunk, _order, prefix, zfill, start, by_value=True)
 
 
 @annotator("Number {annotation} by ({parent_annotation}:{parent_attribute} order, {annotation} order)", wildcards=[
@@ -112,40 +109,63 @@ def number_relative(out: Output = Output("{annotation}:misc.number_rel_{parent}"
                     prefix: str = "",
                     zfill: bool = False,
                     start: int = START_DEFAULT):
-    """Number chunks by their relative position within a parent."""
+    """Number chunks by their relative position within a parent.
+
+    Children without a parent are left without a number.
+    """
     parent_children, _orphans = parent.get_children(child)
+    out_annotation = child.create_empty_attribute()
+
+    # Format every number only once, and reuse it for all parents with the same zero-padding
+    numbers = defaultdict(list)
+    for children in parent_children:
+        length = len(str(len(children) - 1 + start)) if zfill else 0
+        formatted = numbers[length]
+        if len(formatted) < len(children):
+            formatted.extend(_format_numbers(len(children) - len(formatted), prefix, length, start + len(formatted)))
+        for index, nr in zip(children, formatted):
+            out_annotation[index] = nr
 
-    out.write(("{prefix}{nr:0{length}d}".format(prefix=prefix,
-                                                length=len(str(len(parent) - 1 + start))
-                                                if zfill else 0,
-                                                nr=cnr)
-               for parent in parent_children
-               for cnr, _index in enumerate(parent, start)))
+    out.write(out_annotation)
 
 
 def _read_chunks_and_write_new_ordering(out: Output, chunk: Annotation, order, prefix="", zfill=False,
-                                        start=START_DEFAULT):
-    """Common function called by other numbering functions."""
-    new_order = defaultdict(list)
+                                        start=START_DEFAULT, by_value=False):
+    """Common function called by other numbering functions.
 
+    The order function is called with the index and value of every chunk, and chunks are numbered by the sort order of
+    the returned keys. Chunks with the same key get the same number. If by_value is True, the order function is only
+    called with the value, and only once for every distinct value.
+    """
     in_annotation = list(chunk.read())
 
-    for i, val in enumerate(in_annotation):
-        val = order(i, val)
-        new_order[val].append(i)
+    if by_value:
+        value_indices = defaultdict(list)
+        for i, val in enumerate(in_annotation):
+            value_indices[val].append(i)
+        new_order = defaultdict(list)
+        for val, indices in value_indices.items():
+            new_order[order(val)].extend(indices)
+    else:
+        new_order = defaultdict(list)
+        for i, val in enumerate(in_annotation):
+            new_order[order(i, val)].append(i)
 
     out_annotation = chunk.create_empty_attribute()
 
-    nr_digits = len(str(len(new_order) - 1 + start))
-    for nr, key in enumerate(sorted(new_order), start):
+    nr_digits = len(str(len(new_order) - 1 + start)) if zfill else 0
+    for nr, key in zip(_format_numbers(len(new_order), prefix, nr_digits, start), sorted(new_order)):
         for index in new_order[key]:
-            out_annotation[index] = "{prefix}{nr:0{length}d}".format(prefix=prefix,
-                                                                     length=nr_digits if zfill else 0,
-                                                                     nr=nr)
+            out_annotation[index] = nr
 
     out.write(out_annotation)
 
 
+def _format_numbers(count, prefix="", length=0, start=START_DEFAULT):
+    """Get a list of 'count' numbers from 'start', as strings with a prefix, zero-padded to 'length' digits."""
+    return ["%s%0*d" % (prefix, length, nr) for nr in range(start, start + count)]
+
+
 def _natural_sorting(astr):
     """Convert a string into a naturally sortable tuple."""
     return tuple(int(s) if s.isdigit() else s for s in re.split(r"(\d+)", astr))
@@ -1,12 +1,120 @@
 """Calculate readability measures."""
 
 from math import log
-from typing import List
+from typing import Callable, Dict, List, Optional
 
 from sparv import Annotation, Output, annotator
 
+# Readability metrics, mapping metric name to a function computing the metric from the TextCounts of a text
+METRICS: Dict[str, Callable[["TextCounts"], float]] = {}
 
-@annotator("Annotate text chunks with LIX values")
+
+def metric(name: str):
+    """Register a function computing a readability metric from the TextCounts of a text."""
+    def decorator(f):
+        METRICS[name] = f
+        return f
+    return decorator
+
+
+class TextCounts:
+    """Counts collected for a text in a single pass over its tokens, used by the readability metrics."""
+
+    __slots__ = ("sentences", "sentence_words", "long_words", "words", "unique_words", "nouns", "verbs")
+
+    def __init__(self):
+        self.sentences = 0  # Number of sentences
+        self.sentence_words = 0  # Number of actual words within sentences
+        self.long_words = 0  # Number of actual words within sentences longer than six characters
+        self.words = 0  # Number of actual words
+        self.unique_words = 0  # Number of unique actual words, ignoring case
+        self.nouns = 0  # Number of tokens with a POS in noun_pos
+        self.verbs = 0  # Number of tokens with a POS in verb_pos
+
+
+@annotator("Annotate text chunks with LIX, OVIX and nominal ratios", order=1)
+def readability(text: Annotation = Annotation("<text>"),
+                sentence: Annotation = Annotation("<sentence>"),
+                word: Annotation = Annotation("<token:word>"),
+                pos: Annotation = Annotation("<token:pos>"),
+                out_lix: Output = Output("<text>:readability.lix", description="LIX values for text chunks"),
+                out_ovix: Output = Output("<text>:readability.ovix", description="OVIX values for text chunks"),
+                out_nk: Output = Output("<text>:readability.nk", description="Nominal ratios for text chunks"),
+                skip_pos: List[str] = ["MAD", "MID", "PAD"],
+                noun_pos: List[str] = ["NN", "PP", "PC"],
+                verb_pos: List[str] = ["PN", "AB", "VB"],
+                fmt: str = "%.2f"):
+    """Create LIX, OVIX and nominal ratio annotations for text, reading the token annotations only once."""
+    annotate_metrics(text, word, pos, {"lix": out_lix, "ovix": out_ovix, "nk": out_nk}, sentence=sentence,
+                     skip_pos=skip_pos, noun_pos=noun_pos, verb_pos=verb_pos, fmt=fmt)
+
+
+def annotate_metrics(text: Annotation, word: Optional[Annotation], pos: Annotation, outputs: Dict[str, Output],
+                     sentence: Optional[Annotation] = None, skip_pos: List[str] = ["MAD", "MID", "PAD"],
+                     noun_pos: List[str] = ["NN", "PP", "PC"], verb_pos: List[str] = ["PN", "AB", "VB"],
+                     fmt: str = "%.2f"):
+    """Compute the metrics in METRICS given as keys in 'outputs' for every text and write them to the outputs.
+
+    Words are only needed for metrics based on word counts, like OVIX, and sentences only for metrics based on
+    sentence counts, like LIX.
+    """
+    counts = count_texts(text, word, pos, sentence, skip_pos, noun_pos, verb_pos)
+    for name, out in outputs.items():
+        calc = METRICS[name]
+        out.write([fmt % calc(text_counts) for text_counts in counts])
+
+
+def count_texts(text: Annotation, word: Optional[Annotation], pos: Annotation, sentence: Optional[Annotation] = None,
+                skip_pos: List[str] = ["MAD", "MID", "PAD"], noun_pos: List[str] = ["NN", "PP", "PC"],
+                verb_pos: List[str] = ["PN", "AB", "VB"]) -> List[TextCounts]:
+    """Collect TextCounts for every text, reading words and POS tags once.
+
+    Actual words are tokens with a POS not in 'skip_pos'. Word based counts are only collected if 'word' is given,
+    and sentence based counts only if both 'word' and 'sentence' are given.
+    """
+    skip_pos = set(skip_pos)
+    noun_pos = set(noun_pos)
+    verb_pos = set(verb_pos)
+
+    if word:
+        word_pos = list(word.read_attributes((word, pos)))
+    else:
+        word_pos = [(None, p) for p in pos.read()]
+    text_children, _orphans = text.get_children(pos)
+
+    counts = []
+    for tokens in text_children:
+        text_counts = TextCounts()
+        seen = set()
+        for token_index in tokens:
+            w, p = word_pos[token_index]
+            if p in noun_pos:
+                text_counts.nouns += 1
+            if p in verb_pos:
+                text_counts.verbs += 1
+            if w is not None and p not in skip_pos:
+                text_counts.words += 1
+                seen.add(w.lower())
+        text_counts.unique_words = len(seen)
+        counts.append(text_counts)
+
+    if word and sentence:
+        text_sentences, _orphans = text.get_children(sentence)
+        sentence_children, _orphans = sentence.get_children(word)
+        sentence_children = list(sentence_children)
+        for text_counts, sentences in zip(counts, text_sentences):
+            text_counts.sentences = len(sentences)
+            for sentence_index in sentences:
+                for token_index in sentence_children[sentence_index]:
+                    w, p = word_pos[token_index]
+                    if p not in skip_pos:
+                        text_counts.sentence_words += 1
+                        text_counts.long_words += len(w) > 6
+
+    return counts
+
+
+@annotator("Annotate text chunks with LIX values", order=2)
 def lix(text: Annotation = Annotation("<text>"),
         sentence: Annotation = Annotation("<sentence>"),
         word: Annotation = Annotation("<token:word>"),
@@ -15,22 +123,13 @@ def lix(text: Annotation = Annotation("<text>"),
         skip_pos: List[str] = ["MAD", "MID", "PAD"],
         fmt: str = "%.2f"):
     """Create LIX annotation for text."""
-    # Read annotation files and get parent_children relations
-    text_children, _orphans = text.get_children(sentence)
-    word_pos = list(word.read_attributes((word, pos)))
-    sentence_children, _orphans = sentence.get_children(word)
-    sentence_children = list(sentence_children)
+    annotate_metrics(text, word, pos, {"lix": out}, sentence=sentence, skip_pos=skip_pos, fmt=fmt)
 
-    # Calculate LIX for every text element
-    lix_annotation = []
-    for text in text_children:
-        in_sentences = []
-        for sentence_index in text:
-            s = sentence_children[sentence_index]
-            in_sentences.append(list(actual_words([word_pos[token_index] for token_index in s], skip_pos)))
-        lix_annotation.append(fmt % lix_calc(in_sentences))
 
-    out.write(lix_annotation)
+@metric("lix")
+def _lix_metric(counts: TextCounts) -> float:
+    """Calculate LIX for a text."""
+    return lix_value(counts.sentences, counts.sentence_words, counts.long_words)
 
 
 def lix_calc(sentences):
@@ -40,23 +139,28 @@ def lix_calc(sentences):
     >>> print("%.2f" % lix_calc(4*["a bc def ghij klmno pqrstu vxyzåäö".split()]))
     21.29
     """
-    sentence_counter = 0.0
-    word_counter = 0.0
-    length_counter = 0.0
+    sentence_counter = 0
+    word_counter = 0
+    length_counter = 0
     for words in sentences:
         sentence_counter += 1
         for word in words:
             word_counter += 1
             length_counter += int(len(word) > 6)
-    if word_counter == 0 and sentence_counter == 0:
+    return lix_value(sentence_counter, word_counter, length_counter)
+
+
+def lix_value(sentences: int, words: int, long_words: int) -> float:
+    """Calculate LIX from the number of sentences, words and words longer than six characters."""
+    if words == 0 and sentences == 0:
         return float('NaN')
-    elif word_counter == 0 or sentence_counter == 0:
+    elif words == 0 or sentences == 0:
         return float('inf')
     else:
-        return word_counter / sentence_counter + 100 * length_counter / word_counter
+        return words / sentences + 100 * long_words / words
 
 
-@annotator("Annotate text chunks with OVIX values")
+@annotator("Annotate text chunks with OVIX values", order=2)
 def ovix(text: Annotation = Annotation("<text>"),
          word: Annotation = Annotation("<token:word>"),
          pos: Annotation = Annotation("<token:pos>"),
@@ -64,16 +168,13 @@ def ovix(text: Annotation = Annotation("<text>"),
          skip_pos: List[str] = ["MAD", "MID", "PAD"],
          fmt: str = "%.2f"):
     """Create OVIX annotation for text."""
-    text_children, _orphans = text.get_children(word)
-    word_pos = list(word.read_attributes((word, pos)))
+    annotate_metrics(text, word, pos, {"ovix": out}, skip_pos=skip_pos, fmt=fmt)
 
-    # Calculate OVIX for every text element
-    ovix_annotation = []
-    for text in text_children:
-        in_words = list(actual_words([word_pos[token_index] for token_index in text], skip_pos))
-        ovix_annotation.append(fmt % ovix_calc(in_words))
 
-    out.write(ovix_annotation)
+@metric("ovix")
+def _ovix_metric(counts: TextCounts) -> float:
+    """Calculate OVIX for a text."""
+    return ovix_value(counts.words, counts.unique_words)
 
 
 def ovix_calc(words):
@@ -91,23 +192,24 @@ def ovix_calc(words):
     9.58
     """
     seen = set()
-    w = 0.0
-    uw = 0.0
+    w = 0
     for word in words:
-        word = word.lower()
         w += 1
-        if word not in seen:
-            seen.add(word)
-            uw += 1
-    if w == 0:
+        seen.add(word.lower())
+    return ovix_value(w, len(seen))
+
+
+def ovix_value(words: int, unique_words: int) -> float:
+    """Calculate OVIX from the number of words and unique words."""
+    if words == 0:
         return float('NaN')
-    elif uw == w:
+    elif unique_words == words:
         return float('inf')
     else:
-        return log(w) / log(2 - log(uw) / log(w))
+        return log(words) / log(2 - log(unique_words) / log(words))
 
 
-@annotator("Annotate text chunks with nominal ratios")
+@annotator("Annotate text chunks with nominal ratios", order=2)
 def nominal_ratio(text: Annotation = Annotation("<text>"),
                   pos: Annotation = Annotation("<token:pos>"),
                   out: Output = Output("<text>:readability.nk", description="Nominal ratios for text chunks"),
@@ -115,15 +217,13 @@ def nominal_ratio(text: Annotation = Annotation("<text>"),
                   verb_pos: List[str] = ["PN", "AB", "VB"],
                   fmt: str = "%.2f"):
     """Create nominal ratio annotation for text."""
-    text_children, _orphans = text.get_children(pos)
-    pos_annotation = list(pos.read())
+    annotate_metrics(text, None, pos, {"nk": out}, noun_pos=noun_pos, verb_pos=verb_pos, fmt=fmt)
 
-    # Calculate OVIX for every text element
-    nk_annotation = []
-    for text in text_children:
-        in_pos = [pos_annotation[token_index] for token_index in text]
-        nk_annotation.append(fmt % nominal_ratio_calc(in_pos, noun_pos, verb_pos))
-    out.write(nk_annotation)
+
+@metric("nk")
+def _nominal_ratio_metric(counts: TextCounts) -> float:
+    """Calculate nominal ratio for a text."""
+    return nominal_ratio_value(counts.nouns, counts.verbs)
 
 
 def nominal_ratio_calc(pos: List[str], noun_pos: List[str], verb_pos: List[str]):
@@ -145,6 +245,11 @@ def nominal_ratio_calc(pos: List[str], noun_pos: List[str], verb_pos: List[str])
     nouns = sum(1 for p in pos if p in noun_pos)
     # pronouns adverbs verbs
     verbs = sum(1 for p in pos if p in verb_pos)
+    return nominal_ratio_value(nouns, verbs)
+
+
+def nominal_ratio_value(nouns: int, verbs: int) -> float:
+    """Calculate nominal ratio from the number of nouns and verbs."""
     try:
         nk = float(nouns) / float(verbs)
         return nk
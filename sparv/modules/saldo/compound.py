@@ -11,6 +11,7 @@ from functools import reduce
 
 import sparv.util as util
 from sparv import Annotation, Config, Model, ModelOutput, Output, annotator, modelbuilder
+from sparv.modules.saldo.saldo_model import MsdTags
 
 log = logging.getLogger(__name__)
 
@@ -148,6 +149,8 @@ class SaldoCompLexicon:
             log.info("Reading Saldo lexicon: %s", saldofile)
         with open(saldofile, "rb") as F:
             self.lexicon = pickle.load(F)
+        self._msds_cache = {}
+        self._tags_cache = {}
         if verbose:
             log.info("OK, read %d words", len(self.lexicon))
 
@@ -162,27 +165,30 @@ class SaldoCompLexicon:
     def get_prefixes(self, prefix):
         """Get all possible prefixes."""
         return [(prefix, p[0], tuple(p[3])) for p in self.lookup(prefix) if
-                set(p[1]).intersection({"c", "ci"})]
+                p[1].intersection({"c", "ci"})]
 
     def get_infixes(self, infix):
         """Get all possible infixes (= mid parts of a word)."""
         return [(infix, i[0], tuple(i[3])) for i in self.lookup(infix) if
-                set(i[1]).intersection({"c", "cm"})]
+                i[1].intersection({"c", "cm"})]
 
     def get_suffixes(self, suffix, msd=None):
         """Get all possible suffixes."""
         return [(suffix, s[0], tuple(s[3])) for s in self.lookup(suffix)
                 if (s[2] in ("nn", "vb", "av") or s[2][-1] == "h")
-                and set(s[1]).difference({"c", "ci", "cm", "sms"})
-                and (msd in s[3] or not msd or [partial for partial in s[3] if partial.startswith(msd[:msd.find(".")])])
+                and s[1].difference({"c", "ci", "cm", "sms"})
+                and (msd in s[3] or not msd or msd[:msd.find(".")] in s[3].prefixes)
                 ]
 
     def _split_triple(self, annotation_tag_words):
         lemgram, msds, pos, tags = annotation_tag_words.split(PART_DELIM1)
-        msds = msds.split(PART_DELIM2)
-        tags = tags.split(PART_DELIM2)
-        tags = list(set([t[:t.find(".")] if t.find(".") != -1 else t for t in tags]))
-        return lemgram, msds, pos, tags
+        # Sets of msds and part-of-speech classes are shared between all words with the same combination
+        if msds not in self._msds_cache:
+            self._msds_cache[msds] = frozenset(msds.split(PART_DELIM2))
+        if tags not in self._tags_cache:
+            self._tags_cache[tags] = MsdTags(t[:t.find(".")] if t.find(".") != -1 else t
+                                             for t in tags.split(PART_DELIM2))
+        return lemgram, self._msds_cache[msds], pos, self._tags_cache[tags]
 
 
 class StatsLexicon:
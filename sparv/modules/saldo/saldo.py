@@ -1,5 +1,6 @@
 """Create annotations from SALDO."""
 
+import bisect
 import itertools
 import logging
 import re
@@ -7,19 +8,22 @@ from typing import List, Optional
 
 import sparv.util as util
 from sparv import Annotation, Config, Model, Output, annotator
-from sparv.modules.saldo.saldo_model import SaldoLexicon
+from sparv.modules.saldo.saldo_model import MsdTags, SaldoLexicon
 
 log = logging.getLogger(__name__)
 
 # The minimum precision difference for two annotations to be considered equal
 PRECISION_DIFF = 0.01
 
+# Precision for combinations of MSD tag and MsdTags already seen
+_precision_cache = {}
+
 
 @annotator("SALDO annotations", language=["swe"], config=[
     Config("saldo.model", default="saldo/saldo.pickle", description="Path to SALDO model"),
     Config("saldo.precision", "",
            description="Format string for appending precision to each value")
-])
+], memory="2G")
 def annotate(token: Annotation = Annotation("<token>"),
              word: Annotation = Annotation("<token:word>"),
              sentence: Annotation = Annotation("<sentence>"),
@@ -105,8 +109,7 @@ def annotate(token: Annotation = Annotation("<token>"),
     out_annotation = word.create_empty_attribute()
 
     for sent in sentences:
-        incomplete_multis = []  # [{annotation, words, [ref], is_particle, lastwordWasGap, numberofgaps}]
-        complete_multis = []    # ([ref], annotation)
+        multiword_matcher = MultiwordMatcher(max_gaps, skip_pos_check)
         sentence_tokens = {}
 
         for token_index in sent:
@@ -129,11 +132,11 @@ def annotate(token: Annotation = Annotation("<token>"),
 
             # Find multi-word expressions
             if not skip_multiword:
-                find_multiword_expressions(incomplete_multis, complete_multis, thewords, ref, msdtag, max_gaps,
-                                           ann_tags_words, msd_annotation, sent, skip_pos_check)
+                multiword_matcher.add_token(thewords, ref, msdtag, ann_tags_words)
 
             # Loop to next token
 
+        complete_multis = multiword_matcher.complete_multis
         if not allow_multiword_overlap:
             # Check that we don't have any unwanted overlaps
             remove_unwanted_overlaps(complete_multis)
@@ -214,100 +217,221 @@ def find_single_word(thewords, lexicon_list, msdtag, precision, min_precision, p
     return ann_tags_words
 
 
-def find_multiword_expressions(incomplete_multis, complete_multis, thewords, ref, msdtag, max_gaps, ann_tags_words,
-                               msd_annotation, sent, skip_pos_check):
-    todelfromincomplete = []  # list to keep track of which expressions that have been completed
-
-    for i, x in enumerate(incomplete_multis):
-        # x = (annotations, following_words, [ref], gap_allowed, is_particle, [part-of-gap-boolean, gap_count])
-        seeking_word = x[1][0]  # The next word we are looking for in this multi-word expression
-
-        # Is a gap necessary in this position for this expression?
-        if seeking_word == "*":
-            if x[1][1].lower() in (w.lower() for w in thewords):
-                seeking_word = x[1][1]
-                del x[1][0]
-
-        # If current gap is greater than max_gaps, stop searching
-        if x[5][1] > max_gaps:
-            todelfromincomplete.append(i)
-        #                                                         |  Last word may not be PP if this is a particle-multi-word                      |
-        elif seeking_word.lower() in (w.lower() for w in thewords) and (skip_pos_check or not (len(x[1]) == 1 and x[4] and msdtag.startswith("PP"))):
-            x[5][0] = False     # last word was not a gap
-            del x[1][0]
-            x[2].append(ref)
-
-            # Is current word the last word we are looking for?
-            if len(x[1]) == 0:
-                todelfromincomplete.append(i)
-
-                # Create a list of msdtags of words belonging to the completed multi-word expr.
-                msdtag_list = [msd_annotation[sent[int(ref) - 1]] for ref in x[2]]
-
-                # For completed verb multis, check that at least one of the words is a verb:
-                if not skip_pos_check and "..vbm." in x[0]["lem"][0]:
-                    for tag in msdtag_list:
-                        if tag.startswith("VB"):
-                            complete_multis.append((x[2], x[0]))
-                            break
-
-                # For completed noun multis, check that at least one of the words is a noun:
-                elif not skip_pos_check and "..nnm." in x[0]["lem"][0]:
-                    for tag in msdtag_list:
-                        if tag[:2] in ("NN", "PM", "UO"):
-                            complete_multis.append((x[2], x[0]))
-                            break
+class _TrieNode:
+    """Node in a trie of the words following the first word of multi-word expressions.
 
-                else:
-                    complete_multis.append((x[2], x[0]))
-
-        else:
-            # We've reached a gap
-            # Are gaps allowed?
-            if x[3]:
-                # If previous word was NOT part of a gap, this is a new gap, so increment gap counter
-                if not x[5][0]:
-                    x[5][1] += 1
-                x[5][0] = True  # Mark that this word was part of a gap
-
-                # Avoid having another verb within a verb multi-word expression:
-                # delete current incomplete multi-word expr. if it starts with a verb and if current word has POS tag VB
-                if "..vbm." in x[0]["lem"][0] and msdtag.startswith("VB"):
-                    todelfromincomplete.append(i)
+    The trie is expanded one level at a time, when a node is first reached.
+    """
 
-            else:
-                # Gaps are not allowed for this multi-word expression
-                todelfromincomplete.append(i)
+    __slots__ = ("_entries", "_children", "_annotations")
 
-    # Delete seeking words from incomplete_multis
-    for x in todelfromincomplete[::-1]:
-        del incomplete_multis[x]
+    def __init__(self):
+        self._entries = []  # (following words, position, order, annotation) for expressions passing this node
+        self._children = None
+        self._annotations = None
 
-    # Collect possible multiword expressions:
-    # Is this word a possible beginning of a multi-word expression?
-    looking_for = [(annotation, words, [ref], gap_allowed, is_particle, [False, 0])
-                   for (annotation, _, wordslist, gap_allowed, is_particle, _) in ann_tags_words if wordslist for words in wordslist]
-    if len(looking_for) > 0:
-        incomplete_multis.extend(looking_for)
+    def add(self, words, position, order, annotation):
+        """Add an expression passing this node, with words[position:] remaining."""
+        self._entries.append((words, position, order, annotation))
 
+    def _expand(self):
+        self._children = {}
+        self._annotations = []
+        for words, position, order, annotation in self._entries:
+            if position == len(words):
+                self._annotations.append((order, annotation))
+            else:
+                self._children.setdefault(words[position].lower(), _TrieNode()).add(words, position + 1, order,
+                                                                                    annotation)
+        self._entries = None
+
+    @property
+    def children(self):
+        """Lowercased word -> _TrieNode. The word "*" marks a position where a gap is expected."""
+        if self._children is None:
+            self._expand()
+        return self._children
+
+    @property
+    def annotations(self):
+        """(order, annotation) for every expression ending in this node."""
+        if self._annotations is None:
+            self._expand()
+        return self._annotations
+
+
+class _MultiwordState:
+    """A partial match of one or more multi-word expressions, sharing the same matched tokens."""
+
+    __slots__ = ("tokens", "last_index", "gaps", "gap_allowed", "is_particle", "is_verb")
+
+    def __init__(self, tokens, last_index, gaps, gap_allowed, is_particle, is_verb):
+        self.tokens = tokens  # ((ref, msdtag), ...) for the matched tokens
+        self.last_index = last_index  # Index in the sentence of the last matched token
+        self.gaps = gaps  # Number of gaps before the last matched token
+        self.gap_allowed = gap_allowed
+        self.is_particle = is_particle
+        self.is_verb = is_verb
+
+
+class MultiwordMatcher:
+    """Find multi-word expressions in a sentence, one token at a time.
+
+    The following words of all expressions starting at a token are combined into a trie, and partial matches are
+    states pointing into these tries. Every state waits in a dictionary under the words that can continue it, so a token
+    only visits the states it actually continues. Gaps are not counted token by token, but derived from the distance to
+    the last matched token when a state is continued.
+    """
 
-def remove_unwanted_overlaps(complete_multis):
+    def __init__(self, max_gaps: int, skip_pos_check: bool = False, lemgram_key: str = "lem"):
+        """Initialize matcher for a new sentence.
+
+        Args:
+            max_gaps: Maximum number of gaps in a multi-word expression.
+            skip_pos_check: Set to True to skip checking the MSD tags of particle, verb and noun expressions.
+            lemgram_key: Key of the lemgram in the lexicon annotations, used for finding the part of speech.
+        """
+        self.max_gaps = max_gaps
+        self.skip_pos_check = skip_pos_check
+        self.lemgram_key = lemgram_key
+        self.complete_multis = []  # ([ref], annotation)
+        self._waiting = {}  # Lowercased word -> [(state, node, terminal_only)]
+        self._verb_count = [0]  # Number of verbs among the first n tokens of the sentence
+        self._order = 0
+
+    def _wait(self, state, node, terminal_only=False):
+        """Let a state wait for the words following a node."""
+        for word, child in node.children.items():
+            if word == "*":
+                # The gap is optional when the word after it is found directly
+                for next_word, next_child in child.children.items():
+                    self._waiting.setdefault(next_word, []).append((state, next_child, terminal_only))
+            else:
+                self._waiting.setdefault(word, []).append((state, child, terminal_only))
+
+    def _is_alive(self, state, index):
+        """Check that the tokens since the last match of a state are an allowed gap."""
+        if index - state.last_index == 1:
+            return True
+        if not state.gap_allowed or state.gaps + 1 > self.max_gaps:
+            return False
+        # Verb multi-word expressions may not span over other verbs
+        return not (state.is_verb and self._verb_count[index] - self._verb_count[state.last_index + 1] > 0)
+
+    def _pos_check(self, annotation, tokens):
+        """For verb and noun multi-word expressions, check that at least one of the words is a verb or a noun."""
+        if self.skip_pos_check:
+            return True
+        lemgram = annotation[self.lemgram_key][0]
+        if "..vbm." in lemgram:
+            return any(msdtag.startswith("VB") for _, msdtag in tokens)
+        elif "..nnm." in lemgram:
+            return any(msdtag[:2] in ("NN", "PM", "UO") for _, msdtag in tokens)
+        return True
+
+    def add_token(self, words: List[str], ref: str, msdtag: str, ann_tags_words: list):
+        """Continue partial matches with the next token, and start new matches from its lexicon entries.
+
+        Args:
+            words: Word variations of the token.
+            ref: Reference (position in the sentence) of the token.
+            msdtag: MSD tag of the token.
+            ann_tags_words: Lexicon entries found for the token, as returned by find_single_word().
+        """
+        index = len(self._verb_count) - 1
+        self._verb_count.append(self._verb_count[-1] + msdtag.startswith("VB"))
+        completed = []
+        continued = []
+        still_waiting = []
+
+        for word in set(w.lower() for w in words):
+            for state, node, terminal_only in self._waiting.pop(word, ()):
+                if not self._is_alive(state, index):
+                    continue
+                tokens = state.tokens + ((ref, msdtag),)
+                # The last word may not be PP if this is a particle multi-word expression
+                if node.annotations and not self.skip_pos_check and state.is_particle and msdtag.startswith("PP"):
+                    still_waiting.append((word, (state, node, True)))
+                else:
+                    completed.extend((order, tokens, annotation) for order, annotation in node.annotations
+                                     if self._pos_check(annotation, tokens))
+                if node.children and not terminal_only:
+                    gaps = state.gaps + (index - state.last_index > 1)
+                    continued.append((_MultiwordState(tokens, index, gaps, state.gap_allowed, state.is_particle,
+                                                      state.is_verb), node))
+
+        for order, tokens, annotation in sorted(completed, key=lambda x: x[0]):
+            self.complete_multis.append(([r for r, _ in tokens], annotation))
+        for word, entry in still_waiting:
+            self._waiting.setdefault(word, []).append(entry)
+        for state, node in continued:
+            self._wait(state, node)
+
+        # Is this word a possible beginning of a multi-word expression?
+        roots = {}
+        for annotation, _, wordslist, gap_allowed, is_particle, *_ in ann_tags_words:
+            for following_words in wordslist:
+                key = (gap_allowed, is_particle, "..vbm." in annotation[self.lemgram_key][0])
+                roots.setdefault(key, _TrieNode()).add(following_words, 0, self._order, annotation)
+                self._order += 1
+        for (gap_allowed, is_particle, is_verb), root in roots.items():
+            self._wait(_MultiwordState(((ref, msdtag),), index, 0, gap_allowed, is_particle, is_verb), root)
+
+
+def find_unwanted_overlaps(complete_multis, get_pos, check_subset=True):
+    """Get the indices of multi-word expressions overlapping another expression of the same part of speech.
+
+    An expression a is unwanted if there is an expression b of the same part of speech where either b1 a1 b2 a2, or
+    a1 b1 ab2 (and unless check_subset is False, b has a word that is not part of a).
+    """
     remove = set()
-    for ai, a in enumerate(complete_multis):
-        for b in complete_multis:
-            # Check if both are of same POS
-            if not a == b and re.search(r"\.(\w\w?)m?\.", a[1]["lem"][0]).groups()[0] == re.search(r"\.(\w\w?)m?\.", b[1]["lem"][0]).groups()[0]:
-                if b[0][0] < a[0][0] < b[0][-1] < a[0][-1]:
-                    # A case of b1 a1 b2 a2. Remove a.
-                    remove.add(ai)
-                elif a[0][0] < b[0][0] and a[0][-1] == b[0][-1] and not all((x in a[0]) for x in b[0]):
-                    # A case of a1 b1 ab2. Remove a.
-                    remove.add(ai)
+    by_pos = {}
+    for i, (refs, annotation) in enumerate(complete_multis):
+        by_pos.setdefault(get_pos(annotation), []).append((refs[0], refs[-1], i))
+
+    for multis in by_pos.values():
+        # b1 a1 b2 a2: look for an expression starting before a and ending within a
+        multis.sort()
+        ends = []
+        for _start, group in itertools.groupby(multis, key=lambda x: x[0]):
+            group = list(group)
+            for start, end, i in group:
+                pos = bisect.bisect_right(ends, start)
+                if pos < len(ends) and ends[pos] < end:
+                    remove.add(i)
+            for _, end, _ in group:
+                bisect.insort(ends, end)
+
+        # a1 b1 ab2: look for an expression with the same end, starting after a
+        by_end = {}
+        for start, end, i in multis:
+            by_end.setdefault(end, []).append((start, i))
+        for same_end in by_end.values():
+            later_refs = set()
+            later_exists = False
+            for _start, group in itertools.groupby(reversed(same_end), key=lambda x: x[0]):
+                group = list(group)
+                for _, i in group:
+                    if later_exists and (not check_subset or later_refs.difference(complete_multis[i][0])):
+                        remove.add(i)
+                for _, i in group:
+                    later_refs.update(complete_multis[i][0])
+                later_exists = True
+    return remove
+
 
+def remove_unwanted_overlaps(complete_multis):
+    """Remove multi-word expressions overlapping other expressions of the same part of speech."""
+    remove = find_unwanted_overlaps(complete_multis, _get_multiword_pos)
     for a in sorted(remove, reverse=True):
         del complete_multis[a]
 
 
+def _get_multiword_pos(annotation):
+    """Get part of speech from the lemgram of a multi-word expression."""
+    return re.search(r"\.(\w\w?)m?\.", annotation["lem"][0]).groups()[0]
+
+
 def save_multiwords(complete_multis, sentence_tokens):
     for c in complete_multis:
         first = True
@@ -335,10 +459,17 @@ def get_precision(msd, msdtags):
     we return a high value (0.75), a partial match returns 0.66, missing MSD returns 0.5,
     and otherwise a low value (0.25).
     """
-    return (0.5 if msd is None else
-            0.75 if msd in msdtags else
-            0.66 if "." in msd and [partial for partial in msdtags if partial.startswith(msd[:msd.find(".")])] else
-            0.25)
+    if msd is None:
+        return 0.5
+    if not isinstance(msdtags, MsdTags):
+        msdtags = MsdTags(msdtags)
+    key = (msd, msdtags)
+    precision = _precision_cache.get(key)
+    if precision is None:
+        precision = _precision_cache[key] = (0.75 if msd in msdtags else
+                                             0.66 if "." in msd and msd[:msd.find(".")] in msdtags.prefixes else
+                                             0.25)
+    return precision
 
 
 def normalize_precision(annotations):
@@ -1,13 +1,18 @@
 """SALDO Model builders."""
 
+import heapq
 import logging
+import os
 import pathlib
 import pickle
 import re
+import tempfile
 import xml.etree.ElementTree as etree
+from itertools import groupby
 
 import sparv.util as util
 from sparv import Model, ModelOutput, modelbuilder
+from sparv.core import stats
 
 log = logging.getLogger(__name__)
 
@@ -41,23 +46,24 @@ class SaldoLexicon:
         """Read lexicon."""
         if verbose:
             log.info("Reading Saldo lexicon: %s", saldofile)
-        if saldofile.suffix == ".pickle":
-            with open(saldofile, "rb") as F:
-                self.lexicon = pickle.load(F)
-        else:
-            lexicon = self.lexicon = {}
-            with open(saldofile, "rb") as F:
-                for line in F:
-                    row = line.decode(util.UTF8).split()
-                    word = row.pop(0)
-                    lexicon[word] = row
+        with util.model_loading():
+            if saldofile.suffix == ".pickle":
+                with open(saldofile, "rb") as F:
+                    self.lexicon = pickle.load(F)
+            else:
+                lexicon = self.lexicon = {}
+                with open(saldofile, "rb") as F:
+                    for line in F:
+                        row = line.decode(util.UTF8).split()
+                        word = row.pop(0)
+                        lexicon[word] = row
         if verbose:
             log.info("OK, read %d words", len(self.lexicon))
 
     def lookup(self, word):
         """Lookup a word in the lexicon.
 
-        Returns a list of (annotation-dictionary, list-of-pos-tags, list-of-lists-with-words).
+        Returns a list of (annotation-dictionary, MsdTags-with-pos-tags, list-of-lists-with-words).
         """
         if word.lower() == word:
             annotation_tag_pairs = self.lexicon.get(word, [])
@@ -79,13 +85,7 @@ class SaldoLexicon:
         for word in lexicon:
             annotations = []
             for annotation, extra in list(lexicon[word].items()):
-                # annotationlist = PART_DELIM3.join(annotation)
-                annotationlist = PART_DELIM2.join(k + PART_DELIM3 + PART_DELIM3.join(annotation[k]) for k in annotation)
-                taglist = PART_DELIM3.join(sorted(extra[0]))
-                wordlist = PART_DELIM2.join([PART_DELIM3.join(x) for x in sorted(extra[1])])
-                gap_allowed = "1" if extra[2] else "0"
-                particle = "1" if extra[3] else "0"
-                annotations.append(PART_DELIM1.join([annotationlist, taglist, wordlist, gap_allowed, particle]))
+                annotations.append(join_triple(join_annotation(annotation), *extra))
 
             picklex[word] = sorted(annotations)
 
@@ -113,6 +113,50 @@ class SaldoLexicon:
             log.info("OK, saved")
 
 
+class MsdTags(frozenset):
+    """A frozen set of MSD tags, together with all prefixes of their part-of-speech classes.
+
+    The part-of-speech class of a tag is the part before the first ".". Checking if any of the tags starts with a
+    string without a "." is then a set lookup in 'prefixes'.
+    """
+
+    __slots__ = ("prefixes",)
+
+    def __new__(cls, tags=()):
+        """Create set of tags and compute the prefixes of their part-of-speech classes."""
+        self = super().__new__(cls, tags)
+        pos_classes = set(tag.split(".", 1)[0] for tag in self)
+        self.prefixes = frozenset(pos[:i] for pos in pos_classes for i in range(len(pos) + 1))
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (tuple(self),)
+
+
+# The same combinations of tags are shared by many words, so only one MsdTags is created for each combination
+_msd_tags = {}
+
+
+def get_msd_tags(tags: str, delimiter: str = PART_DELIM3) -> MsdTags:
+    """Get MsdTags for a delimited string of tags, reusing an existing object for the same tags."""
+    msd_tags = _msd_tags.get(tags)
+    if msd_tags is None:
+        msd_tags = _msd_tags[tags] = MsdTags(x for x in tags.split(delimiter) if x)
+    return msd_tags
+
+
+def join_annotation(annotation: dict) -> str:
+    """Join a dictionary of annotations, {annotation-type: tuple(annotations)}, into a string."""
+    return PART_DELIM2.join(k + PART_DELIM3 + PART_DELIM3.join(annotation[k]) for k in annotation)
+
+
+def join_triple(annotation: str, tags, words, gap_allowed: bool, particle: bool) -> str:
+    """Join a joined annotation, its possible tags and its following words into the format read by split_triple."""
+    taglist = PART_DELIM3.join(sorted(tags))
+    wordlist = PART_DELIM2.join([PART_DELIM3.join(x) for x in sorted(words)])
+    return PART_DELIM1.join([annotation, taglist, wordlist, "1" if gap_allowed else "0", "1" if particle else "0"])
+
+
 def split_triple(annotation_tag_words):
     """Split annotation_tag_words."""
     annotation, tags, words, gap_allowed, particle = annotation_tag_words.split(PART_DELIM1)
@@ -122,7 +166,7 @@ def split_triple(annotation_tag_words):
         key, values = a.split(PART_DELIM3, 1)
         annotationdict[key] = values.split(PART_DELIM3)
 
-    taglist = [x for x in tags.split(PART_DELIM3) if x]
+    taglist = get_msd_tags(tags)
     wordlist = [x.split(PART_DELIM3) for x in words.split(PART_DELIM2) if x]
 
     return annotationdict, taglist, wordlist, gap_allowed == "1", particle == "1"
@@ -133,10 +177,109 @@ def split_triple(annotation_tag_words):
 ################################################################################
 
 
-def lmf_to_pickle(xml, filename, annotation_elements=("gf", "lem", "saldo")):
-    """Read an XML dictionary and save as a pickle file."""
-    xml_lexicon = read_lmf(xml, annotation_elements)
-    SaldoLexicon.save_to_picklefile(filename, xml_lexicon)
+def lmf_to_pickle(xml, filename, annotation_elements=("gf", "lem", "saldo"), tagset="SUC", chunk_size=2000000,
+                  verbose=True):
+    """Read an XML dictionary and save as a pickle file.
+
+    Instead of collecting the whole lexicon in memory, the entries are streamed from the XML into sorted chunk files on
+    disk, holding at most 'chunk_size' records in memory at a time. The chunks are then merged, and every word form is
+    compiled into its final form directly, before pickling. The result is the same as saving the lexicon returned by
+    read_lmf with SaldoLexicon.save_to_picklefile.
+    """
+    filename = pathlib.Path(filename)
+    with tempfile.TemporaryDirectory(prefix="saldo_model_", dir=filename.parent) as tmp_dir:
+        chunks = []
+        records = []
+        for n, (word, annotations, tags, multiword, gap_allowed, particle) in enumerate(
+                _read_lmf_entries(xml, annotation_elements, tagset, verbose)):
+            # Records are sorted by word and annotation, and the flags are taken from the first record of an annotation
+            prefix = _RECORD_SEP.join((word, join_annotation(annotations), str(n),
+                                       ("1" if gap_allowed else "0") + ("1" if particle else "0")))
+            if multiword is None:
+                records.extend(_RECORD_SEP.join((prefix, "t", tag)) + "\n" for tag in tags)
+            else:
+                records.append(_RECORD_SEP.join((prefix, "m", PART_DELIM3.join(multiword))) + "\n")
+            if len(records) >= chunk_size:
+                chunks.append(_write_sorted_chunk(records, tmp_dir, len(chunks)))
+                records = []
+        if records or not chunks:
+            chunks.append(_write_sorted_chunk(records, tmp_dir, len(chunks)))
+        del records
+
+        if verbose:
+            log.info("Merging %d sorted chunks", len(chunks))
+        # Keep the number of simultaneously open files down by merging chunks in several passes if needed
+        while len(chunks) > _MAX_MERGE_CHUNKS:
+            chunks = [_merge_chunks(chunks[i:i + _MAX_MERGE_CHUNKS], tmp_dir, f"merged{len(chunks)}_{i}")
+                      for i in range(0, len(chunks), _MAX_MERGE_CHUNKS)]
+        picklex = {}
+        files = [open(chunk, encoding="UTF-8") for chunk in chunks]
+        try:
+            lines = heapq.merge(*files)
+            for word, word_lines in groupby(lines, key=lambda line: line.split(_RECORD_SEP, 1)[0]):
+                annotations = []
+                for annotation, annotation_lines in groupby(word_lines, key=lambda line: line.split(_RECORD_SEP, 2)[1]):
+                    tags = set()
+                    multiwords = set()
+                    first = None
+                    for line in annotation_lines:
+                        _, _, n, flags, kind, value = line.rstrip("\n").split(_RECORD_SEP)
+                        n = int(n)
+                        if first is None or n < first[0]:
+                            first = (n, flags)
+                        if kind == "t":
+                            tags.add(value)
+                        else:
+                            multiwords.add(tuple(value.split(PART_DELIM3)) if value else ())
+                    flags = first[1]
+                    annotations.append(join_triple(annotation, tags, multiwords, flags[0] == "1", flags[1] == "1"))
+                picklex[word] = sorted(annotations)
+        finally:
+            for f in files:
+                f.close()
+
+    if verbose:
+        log.info("Saving LMF lexicon in Pickle format")
+    with open(filename, "wb") as f:
+        pickle.dump(picklex, f, protocol=-1)
+    if verbose:
+        max_rss = stats.get_max_rss()
+        if max_rss:
+            log.info("OK, saved %d words. Peak memory usage: %d MB", len(picklex), max_rss // 2 ** 20)
+        else:
+            log.info("OK, saved %d words", len(picklex))
+
+
+# Field separator for records in the temporary files of lmf_to_pickle, sorting before any character in a word form
+_RECORD_SEP = "\x00"
+
+
+# Maximum number of chunk files to merge at once
+_MAX_MERGE_CHUNKS = 64
+
+
+def _write_sorted_chunk(records, tmp_dir, number) -> pathlib.Path:
+    """Sort records and write them to a chunk file."""
+    path = pathlib.Path(tmp_dir) / f"chunk{number}.txt"
+    records.sort()
+    with open(path, "w", encoding="UTF-8") as f:
+        f.writelines(records)
+    return path
+
+
+def _merge_chunks(chunks, tmp_dir, name) -> pathlib.Path:
+    """Merge sorted chunk files into one sorted chunk file, and remove the merged files."""
+    path = pathlib.Path(tmp_dir) / f"{name}.txt"
+    files = [open(chunk, encoding="UTF-8") for chunk in chunks]
+    try:
+        with open(path, "w", encoding="UTF-8") as f:
+            f.writelines(heapq.merge(*files))
+    finally:
+        for chunk_file in files:
+            chunk_file.close()
+    for chunk in chunks:
+        os.remove(chunk)
+    return path
 
 
 def read_lmf(xml, annotation_elements=("gf", "lem", "saldo"), tagset="SUC", verbose=True):
@@ -146,77 +289,15 @@ def read_lmf(xml, annotation_elements=("gf", "lem", "saldo"), tagset="SUC", verb
      - annotation_element is the XML element for the annotation value (currently: 'gf' for baseform, 'lem' for lemgram or 'saldo' for SALDO id)
      - tagset is the tagset for the possible tags (currently: 'SUC', 'Parole', 'Saldo')
     """
-    # assert annotation_element in ("gf", "lem", "saldo"), "Invalid annotation element"
-    tagmap = util.tagsets.mappings["saldo_to_" + tagset.lower()]
-    if verbose:
-        log.info("Reading XML lexicon")
     lexicon = {}
 
-    context = etree.iterparse(xml, events=("start", "end"))  # "start" needed to save reference to root element
-    context = iter(context)
-    event, root = next(context)
-
-    for event, elem in context:
-        if event == "end":
-            if elem.tag == "LexicalEntry":
-                annotations = HashableDict()
-
-                for a in annotation_elements:
-                    annotations[a] = tuple(x.text for x in elem.findall(a))
-
-                pos = elem.findtext("pos")
-                inhs = elem.findtext("inhs")
-                if inhs == "-":
-                    inhs = ""
-                inhs = inhs.split()
-
-                # Check the paradigm for an "x", meaning a multi-word expression with a required gap
-                p = elem.findtext("p")
-                x_find = re.search(r"_x(\d*)_", p)
-                x_insert = x_find.groups()[0] if x_find else None
-                if x_insert == "":
-                    x_insert = "1"
-
-                # Only vbm and certain paradigms allow gaps
-                gap_allowed = (pos == "vbm" or p in (u"abm_x1_var_än", u"knm_x_ju_ju", u"pnm_x1_inte_ett_dugg", u"pnm_x1_vad_än", u"ppm_x1_för_skull"))
-
-                table = elem.find("table")
-                multiwords = []
-
-                for form in list(table):
-                    word = form.findtext("wf")
-                    param = form.findtext("param")
-
-                    if param in ("frag", "c", "ci", "cm"):
-                        # We don't use these wordforms, so skip
-                        continue
-                    elif param[-1].isdigit() and param[-2:] != "-1":
-                        # Handle multi-word expressions
-                        multiwords.append(word)
-                        multipart, multitotal = param.split(":")[-1].split("-")
-                        particle = bool(re.search(r"vbm_.+?p.*?\d+_", p))  # Multi-word with particle
-
-                        # Add a "*" where the gap should be
-                        if x_insert and multipart == x_insert:
-                            multiwords.append("*")
-
-                        if multipart == multitotal:
-                            lexicon.setdefault(multiwords[0], {}).setdefault(annotations, (set(), set(), gap_allowed, particle))[1].add(tuple(multiwords[1:]))
-                            multiwords = []
-                    else:
-                        # Single word expressions
-                        if param[-2:] == "-1":
-                            param = param.rsplit(" ", 1)[0]
-                            if pos == "vbm":
-                                pos = "vb"
-                        saldotag = " ".join([pos] + inhs + [param])
-                        tags = tagmap.get(saldotag)
-                        if tags:
-                            lexicon.setdefault(word, {}).setdefault(annotations, (set(), set(), False, False))[0].update(tags)
-
-            # Done parsing section. Clear tree to save memory
-            if elem.tag in ["LexicalEntry", "frame", "resFrame"]:
-                root.clear()
+    for word, annotations, tags, multiword, gap_allowed, particle in _read_lmf_entries(xml, annotation_elements,
+                                                                                       tagset, verbose):
+        if multiword is None:
+            lexicon.setdefault(word, {}).setdefault(annotations, (set(), set(), False, False))[0].update(tags)
+        else:
+            word_annotations = lexicon.setdefault(word, {})
+            word_annotations.setdefault(annotations, (set(), set(), gap_allowed, particle))[1].add(multiword)
 
     testwords = ["äggtoddyarna",
                  "Linköpingsbors",
@@ -232,6 +313,95 @@ def read_lmf(xml, annotation_elements=("gf", "lem", "saldo"), tagset="SUC", verb
     return lexicon
 
 
+def _read_lmf_entries(xml, annotation_elements=("gf", "lem", "saldo"), tagset="SUC", verbose=True):
+    """Read saldom.xml and yield the word forms one by one.
+
+    Yields tuples (word, annotations, tags, multiword, gap_allowed, particle), where annotations is a HashableDict with
+    the annotation elements of the entry. For single words, tags is a set of possible tags and multiword is None. For
+    multi-word expressions, tags is None and multiword is a tuple with the following words.
+    """
+    # assert annotation_element in ("gf", "lem", "saldo"), "Invalid annotation element"
+    tagmap = util.tagsets.mappings["saldo_to_" + tagset.lower()]
+    if verbose:
+        log.info("Reading XML lexicon")
+
+    with open(xml, "rb") as xml_file:
+        # Report progress for every 10 percent of the file
+        file_size = os.fstat(xml_file.fileno()).st_size
+        next_progress = 10
+
+        context = etree.iterparse(xml_file, events=("start", "end"))  # "start" needed to save reference to root element
+        context = iter(context)
+        event, root = next(context)
+
+        for event, elem in context:
+            if event == "end":
+                if elem.tag == "LexicalEntry":
+                    annotations = HashableDict()
+
+                    for a in annotation_elements:
+                        annotations[a] = tuple(x.text for x in elem.findall(a))
+
+                    pos = elem.findtext("pos")
+                    inhs = elem.findtext("inhs")
+                    if inhs == "-":
+                        inhs = ""
+                    inhs = inhs.split()
+
+                    # Check the paradigm for an "x", meaning a multi-word expression with a required gap
+                    p = elem.findtext("p")
+                    x_find = re.search(r"_x(\d*)_", p)
+                    x_insert = x_find.groups()[0] if x_find else None
+                    if x_insert == "":
+                        x_insert = "1"
+
+                    # Only vbm and certain paradigms allow gaps
+                    gap_allowed = (pos == "vbm" or p in (u"abm_x1_var_än", u"knm_x_ju_ju", u"pnm_x1_inte_ett_dugg",
+                                                         u"pnm_x1_vad_än", u"ppm_x1_för_skull"))
+
+                    table = elem.find("table")
+                    multiwords = []
+
+                    for form in list(table):
+                        word = form.findtext("wf")
+                        param = form.findtext("param")
+
+                        if param in ("frag", "c", "ci", "cm"):
+                            # We don't use these wordforms, so skip
+                            continue
+                        elif param[-1].isdigit() and param[-2:] != "-1":
+                            # Handle multi-word expressions
+                            multiwords.append(word)
+                            multipart, multitotal = param.split(":")[-1].split("-")
+                            particle = bool(re.search(r"vbm_.+?p.*?\d+_", p))  # Multi-word with particle
+
+                            # Add a "*" where the gap should be
+                            if x_insert and multipart == x_insert:
+                                multiwords.append("*")
+
+                            if multipart == multitotal:
+                                yield multiwords[0], annotations, None, tuple(multiwords[1:]), gap_allowed, particle
+                                multiwords = []
+                        else:
+                            # Single word expressions
+                            if param[-2:] == "-1":
+                                param = param.rsplit(" ", 1)[0]
+                                if pos == "vbm":
+                                    pos = "vb"
+                            saldotag = " ".join([pos] + inhs + [param])
+                            tags = tagmap.get(saldotag)
+                            if tags:
+                                yield word, annotations, tags, None, False, False
+
+                # Done parsing section. Clear tree to save memory
+                if elem.tag in ["LexicalEntry", "frame", "resFrame"]:
+                    root.clear()
+
+                    if verbose and file_size and xml_file.tell() * 100 >= next_progress * file_size:
+                        log.info("Reading XML lexicon: %d%%", xml_file.tell() * 100 // file_size)
+                        next_progress = xml_file.tell() * 100 // file_size // 10 * 10 + 10
+
+
 class HashableDict(dict):
     """A dict that's hashable."""
 
@@ -32,25 +32,25 @@ def annotate(sense: Annotation = Annotation("<token>:saldo.sense"),
       but is used in the catapult. This argument must be last.
     """
     if not lexicon:
-        lexicon = util.PickledLexicon(model.path)
+        lexicon = util.PickledLexicon(model.path, index=True)
     # Otherwise use pre-loaded lexicon (from catapult)
 
-    sense = sense.read()
-    result_scores = []
-    result_labels = []
-
-    for token in sense:
+    best_senses = []
+    for token in sense.read():
         # Get set of senses for each token and sort them according to their probabilities
         token_senses = [tuple(s.rsplit(util.SCORESEP, 1)) if util.SCORESEP in s else (s, -1.0)
                         for s in token.split(util.DELIM) if s]
         token_senses.sort(key=lambda x: float(x[1]), reverse=True)
+        best_senses.append(token_senses[0][0] if token_senses else None)
 
-        # Lookup the sentiment score for the most probable sense and assign a sentiment label
-        if token_senses:
-            best_sense = token_senses[0][0]
-            score = lexicon.lookup(best_sense, None)
-        else:
-            score = None
+    # Lookup the sentiment scores for the most probable senses
+    scores = lexicon.lookup_many((s for s in best_senses if s is not None), None)
+    result_scores = []
+    result_labels = []
+
+    for best_sense in best_senses:
+        # Assign a sentiment label
+        score = scores[best_sense] if best_sense is not None else None
 
         if score:
             result_scores.append(score)
@@ -6,14 +6,35 @@ Please download, unzip and place contents inside sparv-pipeline/bin/stanford_par
 License for Stanford CoreNLP: GPL2 https://www.gnu.org/licenses/old-licenses/gpl-2.0.html
 """
 
+import concurrent.futures
+import json
+import logging
 import re
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
 
 import sparv.util as util
 from sparv import Annotation, BinaryDir, Config, Language, Output, Text, annotator
 
+log = logging.getLogger(__name__)
+
+ANNOTATORS = "tokenize,ssplit,pos,lemma,depparse,ner"
+# Seconds to wait for the server to load its models
+STARTUP_TIMEOUT = 300
+# Milliseconds the server may spend on a single text
+REQUEST_TIMEOUT = 3600000
+# Number of times to try starting the server, each time on a new port
+STARTUP_ATTEMPTS = 3
+
 
 @annotator("Parse and annotate with Stanford Parser", language=["eng"], config=[
-    Config("stanford.bin", default="stanford_parser", description="Path to directory containing Stanford executables")
+    Config("stanford.bin", default="stanford_parser", description="Path to directory containing Stanford executables"),
+    Config("stanford.threads", default=4,
+           description="Number of texts sent to the Stanford CoreNLP server concurrently")
 ])
 def annotate(corpus_text: Text = Text(),
              lang: Language = Language(),
@@ -32,25 +53,38 @@ def annotate(corpus_text: Text = Text(),
                                          description="Dependency relations to the head"),
              out_dephead_ref: Output = Output("<token>:stanford.dephead_ref", cls="token:dephead_ref",
                                               description="Sentence-relative positions of the dependency heads"),
-             binary: BinaryDir = BinaryDir("[stanford.bin]")):
-    """Use Stanford Parser to parse and annotate text."""
-    args = ["-cp", binary + "/*", "edu.stanford.nlp.pipeline.StanfordCoreNLP",
-            "-annotators", "tokenize,ssplit,pos,lemma,depparse,ner",
-            "-outputFormat", "conll"]
-    process = util.system.call_binary("java", arguments=args, return_command=True)
+             binary: BinaryDir = BinaryDir("[stanford.bin]"),
+             threads: int = Config("stanford.threads")):
+    """Use Stanford Parser to parse and annotate text.
+
+    The texts are parsed by a local Stanford CoreNLP server, which is started once per Sparv run and shared by all
+    jobs (see start_server()). If there is no such server (e.g. when the job is run on its own), a server is started
+    for this document only.
+    """
+    server = None
+    url = util.get_service_address()
+    if url is None:
+        server = CoreNLPServer(binary, threads)
+        url = server.url
 
     # Read corpus_text and text_spans
     text_data = corpus_text.read()
-    text_spans = text.read_spans()
+    text_spans = list(text.read_spans())
 
     sentence_segments = []
     all_tokens = []
 
-    # Go through text elements and parse them with Stanford Parser
-    for text_span in text_spans:
-        inputtext = text_data[text_span[0]:text_span[1]]
-        stdout, _ = process.communicate(inputtext.encode(util.UTF8))
-        processed_sentences = _parse_output(stdout.decode(util.UTF8), lang)
+    # Send all text elements to the server, keeping a number of requests in flight at the same time
+    inputtexts = [text_data[text_span[0]:text_span[1]] for text_span in text_spans]
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            outputs = list(executor.map(lambda inputtext: _parse_text(url, inputtext), inputtexts))
+    finally:
+        if server is not None:
+            server.close()
+
+    for text_span, inputtext, output in zip(text_spans, inputtexts, outputs):
+        processed_sentences = _parse_output(output, lang)
 
         # Go through output and try to match tokens with input text to get correct spans
         index_counter = text_span[0]
@@ -81,6 +115,29 @@ def annotate(corpus_text: Text = Text(),
     out_deprel.write([t.deprel for t in all_tokens])
 
 
+@util.service(annotate)
+def start_server(binary, threads):
+    """Start a CoreNLP server shared by all jobs of a Sparv run, returning its URL and a function stopping it."""
+    server = CoreNLPServer(binary, threads)
+    return server.url, server.close
+
+
+def _parse_text(url, text):
+    """Parse text using the CoreNLP server at url and return the output in CoNLL format."""
+    properties = {"annotators": ANNOTATORS, "outputFormat": "conll"}
+    url = url + "?" + urllib.parse.urlencode({"properties": json.dumps(properties)})
+    request = urllib.request.Request(url, data=text.encode(util.UTF8), method="POST",
+                                     headers={"Content-Type": "text/plain; charset=utf-8"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.read().decode(util.UTF8)
+    except urllib.error.HTTPError as e:
+        message = e.read().decode(util.UTF8, errors="replace").strip()
+        raise util.SparvErrorMessage(f"The Stanford CoreNLP server failed to parse a text: {message or e}")
+    except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+        raise util.SparvErrorMessage(f"Could not get a response from the Stanford CoreNLP server: {e}")
+
+
 def _parse_output(stdout, lang):
     """Parse the conll format output from the Standford Parser."""
     sentences = []
@@ -123,3 +180,67 @@ class Token:
         self.deprel = deprel
         self.start = start
         self.end = end
+
+
+class CoreNLPServer:
+    """A Stanford CoreNLP server running locally in a single JVM."""
+
+    def __init__(self, binary, threads):
+        """Start the server on a free port on localhost and wait until it is ready.
+
+        The port is found by binding to port 0 and releasing it again, so another process may take it before the
+        server does. The server then exits, and is started again on a new port.
+        """
+        java = util.system.find_binary("java", raise_error=True)
+        for _attempt in range(STARTUP_ATTEMPTS):
+            with socket.socket() as s:
+                s.bind(("localhost", 0))
+                self.port = s.getsockname()[1]
+            args = ["-cp", binary + "/*", "edu.stanford.nlp.pipeline.StanfordCoreNLPServer",
+                    "-port", str(self.port),
+                    "-threads", str(max(1, threads)),
+                    "-timeout", str(REQUEST_TIMEOUT),
+                    "-maxCharLength", "-1",
+                    "-annotators", ANNOTATORS,
+                    "-preload", ANNOTATORS,
+                    "-quiet"]
+            log.info("CALL: %s", " ".join([java] + args))
+            # Server log output is not used, so discard it instead of letting it fill up pipes
+            self.process = subprocess.Popen([java] + args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL)
+            self.url = f"http://localhost:{self.port}/"
+            if self._wait_until_ready():
+                return
+            log.info("Stanford CoreNLP server exited during startup, retrying on a new port")
+        raise util.SparvErrorMessage("The Stanford CoreNLP server could not be started.")
+
+    def _wait_until_ready(self):
+        """Wait for the server to start answering requests.
+
+        Return False if the server process exits before it is ready.
+        """
+        log.info("Waiting for Stanford CoreNLP server on port %s", self.port)
+        start_time = time.time()
+        while time.time() - start_time < STARTUP_TIMEOUT:
+            if not self.alive():
+                return False
+            try:
+                urllib.request.urlopen(self.url + "ready", timeout=10)
+                return True
+            except urllib.error.HTTPError:
+                # Server is up but not ready yet
+                pass
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(0.5)
+        self.close()
+        raise util.SparvErrorMessage(f"The Stanford CoreNLP server did not start within {STARTUP_TIMEOUT} seconds.")
+
+    def alive(self):
+        """Return True if the server process is still running."""
+        return self.process.poll() is None
+
+    def close(self):
+        """Stop the server."""
+        util.system.kill_process(self.process)
+        self.process.wait()
@@ -1,7 +1,12 @@
 """Named entity tagging with SweNER."""
 
 import logging
+import queue
 import re
+import socket
+import socketserver
+import struct
+import threading
 import xml.etree.ElementTree as etree
 import xml.sax.saxutils
 
@@ -10,13 +15,23 @@ from sparv import Annotation, Binary, Config, Output, annotator
 
 log = logging.getLogger(__name__)
 
-RESTART_THRESHOLD_LENGTH = 64000
 SENT_SEP = "\n"
 TOK_SEP = " "
 
+# Sentence appended after each document sent to a kept SweNER process. SweNER echoes it back untagged, which tells us
+# that the whole document has been processed.
+SENTINEL = "sparvswenersentinel"
 
-@annotator("Named entity tagging with SweNER", language=["swe"],
-           config=[Config("swener.binary", default="hfst-swener", description="SweNER executable")])
+# Header of messages sent to and from the SweNER service: a status byte (only used in replies) and the data length
+_HEADER = struct.Struct(">?Q")
+
+
+@annotator("Named entity tagging with SweNER", language=["swe"], config=[
+    Config("swener.binary", default="hfst-swener", description="SweNER executable"),
+    Config("swener.timeout", default=30,
+           description="Seconds to wait for output from the SweNER process shared by all documents before falling "
+                       "back to starting one process per document")
+])
 def annotate(out_ne: Output = Output("swener.ne", cls="named_entity", description="Named entity segments from SweNER"),
              out_ne_ex: Output = Output("swener.ne:swener.ex", description="Named entity expressions from SweNER"),
              out_ne_type: Output = Output("swener.ne:swener.type", cls="named_entity:type",
@@ -29,25 +44,14 @@ def annotate(out_ne: Output = Output("swener.ne", cls="named_entity", descriptio
              sentence: Annotation = Annotation("<sentence>"),
              token: Annotation = Annotation("<token>"),
              binary: Binary = Binary("[swener.binary]"),
-             process_dict=None):
+             timeout: int = Config("swener.timeout")):
     """Tag named entities using HFST-SweNER.
 
-    SweNER is either run in an already started process defined in
-    process_dict, or a new process is started(default)
+    Documents are tagged by SweNER processes that are kept running during the whole Sparv run (see start_service()).
+    If the service isn't running or the kept processes stop answering, a new SweNER process is started for the document.
     - doc, word, sentence, token: existing annotations
     - out_ne_ex, out_ne_type, out_ne_subtype: resulting annotation files for the named entities
-    - process_dict is used in the catapult and should never be set from the command line
     """
-    if process_dict is None:
-        process = swenerstart(binary, "", util.UTF8, verbose=False)
-    # else:
-    #     process = process_dict["process"]
-    #     # If process seems dead, spawn a new one
-    #     if process.stdin.closed or process.stdout.closed or process.poll():
-    #         util.system.kill_process(process)
-    #         process = swenerstart("", encoding, verbose=False)
-    #         process_dict["process"] = process
-
     # Get sentence annotation
     sentences, _orphans = sentence.get_children(token, orphan_alert=True)
 
@@ -58,28 +62,18 @@ def annotate(out_ne: Output = Output("swener.ne", cls="named_entity", descriptio
     # Escape <, > and &
     stdin = xml.sax.saxutils.escape(stdin)
 
-    # keep_process = len(stdin) < RESTART_THRESHOLD_LENGTH and process_dict is not None
-    # log.info("Stdin length: %s, keep process: %s", len(stdin), keep_process)
-
-    # if process_dict is not None:
-    #     process_dict["restart"] = not keep_process
+    stdout = None
+    address = util.get_service_address()
+    if address is not None:
+        stdout = _tag_with_service(address, stdin)
 
-    # # Does not work as of now since swener does not have an interactive mode
-    # if keep_process:
-    #     # Chatting with swener: send a SENT_SEP and read correct number of lines
-    #     stdin_fd, stdout_fd = process.stdin, process.stdout
-    #     stdin_fd.write(stdin.encode(encoding) + SENT_SEP)
-    #     stdin_fd.flush()
-    #     stout = stdout_fd.readlines()
-
-    # else:
-    # Otherwise use communicate which buffers properly
-    # log.info("STDIN %s %s", type(stdin.encode(encoding)), stdin.encode(encoding))
-    stdout, _ = process.communicate(stdin.encode(util.UTF8))
-    # log.info("STDOUT %s %s", type(stdout.decode(encoding)), stdout.decode(encoding))
+    if stdout is None:
+        # Use communicate which buffers properly
+        process = swenerstart(binary, "", util.UTF8, verbose=False)
+        stdout, _ = process.communicate(stdin.encode(util.UTF8))
+        stdout = stdout.decode(util.UTF8)
 
-    parse_swener_output(sentences, token, stdout.decode(util.UTF8), out_ne, out_ne_ex, out_ne_type, out_ne_subtype,
-                        out_ne_name)
+    parse_swener_output(sentences, token, stdout, out_ne, out_ne_ex, out_ne_type, out_ne_subtype, out_ne_name)
 
 
 def parse_swener_output(sentences: list, token: Annotation, output, out_ne: Output, out_ne_ex: Output,
@@ -165,3 +159,163 @@ def parse_swener_output(sentences: list, token: Annotation, output, out_ne: Outp
 def swenerstart(binary, stdin, encoding, verbose):
     """Start a SweNER process and return it."""
     return util.system.call_binary(binary, [], stdin, encoding=encoding, verbose=verbose, return_command=True)
+
+
+@util.service(annotate)
+def start_service(binary, timeout):
+    """Start a SweNER service shared by all jobs of a Sparv run, returning its address and a function stopping it."""
+    server = SweNERServer(binary, timeout)
+    return "%s:%d" % server.server_address, server.close
+
+
+def _tag_with_service(address, text):
+    """Tag text using the SweNER service at address, or return None if the service failed."""
+    host, _, port = address.rpartition(":")
+    data = text.encode(util.UTF8)
+    try:
+        with socket.create_connection((host, int(port))) as sock:
+            sock.sendall(_HEADER.pack(True, len(data)) + data)
+            with sock.makefile("rb") as f:
+                ok, length = _HEADER.unpack(f.read(_HEADER.size))
+                output = f.read(length).decode(util.UTF8)
+    except (OSError, struct.error) as e:
+        log.warning("Could not use the SweNER service (%s). Starting a new SweNER process.", e)
+        return None
+    if not ok:
+        log.info("The SweNER service failed (%s). Starting a new SweNER process.", output)
+        return None
+    return output
+
+
+class SweNERServer(socketserver.ThreadingTCPServer):
+    """Server on localhost tagging documents with SweNER processes that are kept running between documents.
+
+    One process is started for every document being tagged at the same time, and idle processes are reused. If a
+    process stops answering, the service gives up and every request is answered with a failure, telling the jobs to
+    start their own SweNER processes instead.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, binary, timeout):
+        """Start serving on a port chosen by the OS."""
+        super().__init__(("localhost", 0), _SweNERRequestHandler)
+        self.binary = binary
+        self.timeout = timeout
+        self.idle = queue.Queue()
+        self.processes = []
+        self.error = None
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def tag(self, text):
+        """Tag text with an idle SweNER process, starting a new one if all are busy."""
+        if self.error:
+            raise SentinelError(self.error)
+        process = None
+        while process is None and not self.idle.empty():
+            process = self.idle.get()
+            if not process.alive():
+                process.close()
+                process = None
+        if process is None:
+            process = SweNERProcess(self.binary, self.timeout)
+            with self.lock:
+                self.processes.append(process)
+        try:
+            output = process.tag(text)
+        except SentinelError as e:
+            log.warning("%s Falling back to one SweNER process per document.", e)
+            self.error = str(e)
+            process.close()
+            raise
+        self.idle.put(process)
+        return output
+
+    def close(self):
+        """Stop the server and all SweNER processes."""
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            for process in self.processes:
+                process.close()
+
+
+class _SweNERRequestHandler(socketserver.StreamRequestHandler):
+    """Handle a request to the SweNER service: a document to tag, answered by the SweNER output."""
+
+    def handle(self):
+        """Read a document, tag it and send back the output, or an error message if tagging failed."""
+        _, length = _HEADER.unpack(self.rfile.read(_HEADER.size))
+        text = self.rfile.read(length).decode(util.UTF8)
+        try:
+            output, ok = self.server.tag(text), True
+        except SentinelError as e:
+            output, ok = str(e), False
+        data = output.encode(util.UTF8)
+        self.wfile.write(_HEADER.pack(ok, len(data)) + data)
+
+
+class SentinelError(Exception):
+    """Raised when a kept SweNER process does not answer with the sentinel sentence."""
+
+
+class SweNERProcess:
+    """A SweNER process kept alive between documents, used by the SweNER service.
+
+    Each document is written to the process followed by the sentinel sentence, and output is read line by line until
+    the sentinel comes back. Input is written by a separate thread so that large documents can't deadlock on full
+    pipes, and output is read by another thread so that we can give up if SweNER stops answering.
+    """
+
+    def __init__(self, binary, timeout):
+        """Start the SweNER process."""
+        self.timeout = timeout
+        self.process = swenerstart(binary, "", util.UTF8, verbose=False)
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        """Move output lines from the process to the queue; put None when output ends."""
+        for line in self.process.stdout:
+            self.lines.put(line.decode(util.UTF8))
+        self.lines.put(None)
+
+    def _write(self, data):
+        """Write data to the process."""
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    def alive(self):
+        """Return True if the process is still running."""
+        return self.process.poll() is None and not self.process.stdin.closed
+
+    def tag(self, text):
+        """Tag text and return the SweNER output, one line per sentence."""
+        data = (text + SENT_SEP + SENTINEL + SENT_SEP).encode(util.UTF8)
+        threading.Thread(target=self._write, args=(data,), daemon=True).start()
+        output = []
+        while True:
+            try:
+                line = self.lines.get(timeout=self.timeout)
+            except queue.Empty:
+                raise SentinelError(f"SweNER gave no output for {self.timeout} seconds.")
+            if line is None:
+                raise SentinelError("SweNER process ended unexpectedly.")
+            if re.sub(r"<[^>]*>", "", line).strip() == SENTINEL:
+                return "".join(output)
+            output.append(line)
+
+    def close(self):
+        """Stop the process."""
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        util.system.kill_process(self.process)
+        self.process.wait()
+
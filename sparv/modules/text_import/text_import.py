@@ -2,11 +2,37 @@
 
 import unicodedata
 from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional
 
 from sparv import importer, util
 from sparv.util.classes import Config, Document, Output, Source, SourceStructure, Text
 
 
+def split(source_file: Path, split_size: int, _split_on: Optional[str], _encoding: str,
+          new_chunk: Callable[[List[str]], BinaryIO]) -> None:
+    """Split a large text file into chunks of roughly split_size bytes.
+
+    The file is split at the first empty line following split_size bytes, or at the first line break following twice
+    that size if there are no empty lines.
+    """
+    out = None
+    size = 0
+    try:
+        with open(source_file, "rb") as f:
+            for line in f:
+                if out is None:
+                    out = new_chunk([])
+                    size = 0
+                out.write(line)
+                size += len(line)
+                if size >= split_size and (not line.strip() or size >= 2 * split_size):
+                    out.close()
+                    out = None
+    finally:
+        if out is not None:
+            out.close()
+
+
 @importer("TXT import", file_extension="txt", outputs=["text"], document_annotation="text", config=[
     Config("text_import.prefix", "", description="Optional prefix to add to annotation names."),
     Config("text_import.encoding", util.UTF8, description="Encoding of source document. Defaults to UTF-8."),
@@ -14,7 +40,7 @@ from sparv.util.classes import Config, Document, Output, Source, SourceStructure
                                                                 "removed from the text."),
     Config("text_import.normalize", "NFC", description="Normalize input using any of the following forms: "
                                                        "'NFC', 'NFKC', 'NFD', and 'NFKD'.")
-], )
+], splitter=split)
 def parse(doc: Document = Document(),
           source_dir: Source = Source(),
           prefix: str = Config("text_import.prefix"),
@@ -31,13 +57,7 @@ def parse(doc: Document = Document(),
         normalize: Normalize input text using any of the following forms: 'NFC', 'NFKC', 'NFD', and 'NFKD'.
             'NFC' is used by default.
     """
-    # Source path
-    if ":" in doc:
-        doc, _, doc_chunk = doc.partition(":")
-        source_file = Path(source_dir, doc, doc_chunk + ".txt")
-    else:
-        source_file = Path(source_dir, doc + ".txt")
-
+    source_file = source_dir.get_path(doc, "txt")
     text = source_file.read_text(encoding=encoding)
 
     if not keep_control_chars:
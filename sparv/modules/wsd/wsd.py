@@ -17,7 +17,7 @@ SENT_SEP = "$SENT$"
     Config("wsd.jar", default="wsd/saldowsd.jar", description="Path name of the executable .jar file"),
     Config("wsd.prob_format", util.SCORESEP + "%.3f", description="Format string for how to print the "
                                                                   "sense probability")
-])
+], memory="7G")
 def annotate(wsdjar: Binary = Binary("[wsd.jar]"),
              sense_model: Model = Model("[wsd.sense_model]"),
              context_model: Model = Model("[wsd.context_model]"),
@@ -4,8 +4,8 @@ import logging
 import os
 
 import sparv.util as util
-from sparv import (AllDocuments, Annotation, AnnotationData, Config, Corpus, Document, Export, ExportAnnotations,
-                   ExportInput, OutputCommonData, SourceAnnotations, exporter, installer)
+from sparv import (AllDocuments, Annotation, AnnotationData, Config, Corpus, Document, DocumentChunks, Export,
+                   ExportAnnotations, ExportInput, OutputCommonData, SourceAnnotations, exporter, installer)
 from . import xml_utils
 
 log = logging.getLogger(__name__)
@@ -94,6 +94,17 @@ def combined(corpus: Corpus = Corpus(),
     xml_utils.combine(corpus, out, docs, xml_input)
 
 
+@exporter("XML export with one file per source file, joining source files split into chunks", config=[
+    Config("xml_export.filename_merged", default="{doc}_export.xml",
+           description="Filename pattern for resulting XML files, with '{doc}' representing the source name.")
+])
+def merged(out: Export = Export("xml_pretty_merged/[xml_export.filename_merged]"),
+           chunks: DocumentChunks = DocumentChunks(),
+           xml_input: ExportInput = ExportInput("xml_pretty/[xml_export.filename]", all_chunks=True)):
+    """Merge the XML export files of all chunks of a source file into a single XML file."""
+    xml_utils.merge_chunks(out, chunks, xml_input)
+
+
 @exporter("Compressed combined XML export", config=[
     Config("xml_export.filename_compressed", default="[metadata.id].xml.bz2",
            description="Filename of resulting compressed combined XML.")
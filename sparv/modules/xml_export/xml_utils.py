@@ -160,6 +160,50 @@ def combine(corpus, out, docs, xml_input):
         log.info("Exported: %s" % out)
 
 
+def merge_chunks(out, chunks, xml_input):
+    """Merge the XML files of the chunks of a split source file into one file.
+
+    When the source was split, the elements enclosing the point of the split were closed at the end of one chunk and
+    opened again at the start of the next. These elements are found as the last lines of the previous file and the
+    first lines of the next, and are removed to join the two. Elements which have been renamed in the export will not
+    be joined.
+    """
+    def is_repeated(name, source_name):
+        return name == source_name or name.endswith("." + source_name)
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as outf:
+        previous = []
+        for chunk, repeated in zip(chunks, chunks.repeated_elements()):
+            infile = xml_input.replace("{doc}", chunk)
+            log.info("Read: %s", infile)
+            with open(infile) as inf:
+                lines = inf.read().rstrip("\n").split("\n")
+            if previous:
+                if lines and lines[0].startswith("<?xml"):
+                    lines.pop(0)
+                # Closing tags at the end of the previous file, outermost first
+                closing = []
+                for line in reversed(previous):
+                    m = re.fullmatch(r"\s*</([^\s>]+)>", line)
+                    if not m:
+                        break
+                    closing.append(m.group(1))
+                # Find the repeated elements, skipping those not included in the export
+                joined = 0
+                for name in repeated:
+                    if joined == len(closing) or joined == len(lines):
+                        break
+                    m = re.fullmatch(r"\s*<([^\s/>]+)[^>]*(?<!/)>", lines[joined])
+                    if m and m.group(1) == closing[joined] and is_repeated(m.group(1), name):
+                        joined += 1
+                print("\n".join(previous[:len(previous) - joined]), file=outf)
+                lines = lines[joined:]
+            previous = lines
+        print("\n".join(previous), file=outf)
+    log.info("Exported: %s", out)
+
+
 def compress(xmlfile, out):
     """Compress xmlfile to out."""
     with open(xmlfile) as f:
@@ -1,12 +1,15 @@
 """Parse XML source file."""
 
 import copy
+import heapq
 import logging
 import unicodedata
 import xml.etree.ElementTree as etree
+import xml.parsers.expat
 from itertools import chain
 from pathlib import Path
-from typing import List
+from typing import BinaryIO, Callable, List, Optional
+from xml.sax.saxutils import quoteattr
 
 from sparv import Config, Document, Headers, Output, OutputData, Source, SourceStructureParser, SourceStructure, Text, importer, util
 
@@ -45,6 +48,91 @@ class XMLStructure(SourceStructureParser):
         return self.annotations
 
 
+# Control characters not allowed in XML, replaced by spaces (keeping byte positions intact) when splitting source files
+_CONTROL_BYTES = bytes.maketrans(bytes(c for c in range(0x20) if c not in b"\t\n\r"), b" " * 29)
+
+
+def split(source_file: Path, split_size: int, split_on: Optional[str], encoding: str,
+          new_chunk: Callable[[List[str]], BinaryIO]) -> None:
+    """Split a large XML file into chunks of roughly split_size bytes.
+
+    The file is split right before the start of the first 'split_on' element (or child of the root element if
+    split_on is not set) following split_size bytes. Everything before the root element (e.g. the XML declaration) and
+    the start tags of all elements open at a split are repeated at the start of the next chunk, and the same elements
+    are closed at the end of the previous chunk. The repeated tags are separated by line breaks, to make sure that the
+    repeated elements don't get identical spans in the chunk.
+    """
+    parser = xml.parsers.expat.ParserCreate(encoding)
+    parser.ordered_attributes = True
+    stack = []  # Names and start tags of open elements
+    splits = []  # Byte positions to split at, and the elements open there
+    prolog_end = None
+    last_split = 0
+    split_depth = 0  # Number of open split_on elements
+
+    def start_element(name, attrs):
+        nonlocal prolog_end, last_split, split_depth
+        pos = parser.CurrentByteIndex
+        if prolog_end is None:
+            prolog_end = pos
+        if stack and (name == split_on if split_on else len(stack) == 1) and not split_depth and \
+                pos - last_split >= split_size:
+            splits.append((pos, list(stack)))
+            last_split = pos
+        if name == split_on:
+            split_depth += 1
+        stack.append((name, "<%s%s>" % (name, "".join(" %s=%s" % (attrs[i], quoteattr(attrs[i + 1]))
+                                                       for i in range(0, len(attrs), 2)))))
+
+    def end_element(name):
+        nonlocal split_depth
+        stack.pop()
+        if name == split_on:
+            split_depth -= 1
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+
+    head = bytearray()  # Data read before the root element is found
+    prolog = b""
+    buffer = bytearray()  # Data read but not yet written
+    buffer_pos = 0  # Position of buffer in source file
+    out = new_chunk([])
+    try:
+        with open(source_file, "rb") as f:
+            while True:
+                data = f.read(1024 * 1024)
+                try:
+                    parser.Parse(data.translate(_CONTROL_BYTES), not data)
+                except xml.parsers.expat.ExpatError as e:
+                    raise util.SparvErrorMessage(f"Could not split source file {source_file}: {e}")
+                if prolog_end is None:
+                    head += data
+                elif head is not None:
+                    head += data
+                    prolog = bytes(head[:prolog_end])
+                    head = None
+                buffer += data
+                for pos, open_elements in splits:
+                    out.write(buffer[:pos - buffer_pos])
+                    out.write("".join("\n</%s>" % name for name, _ in reversed(open_elements)).encode(
+                        encoding, "xmlcharrefreplace"))
+                    out.close()
+                    del buffer[:pos - buffer_pos]
+                    buffer_pos = pos
+                    out = new_chunk([name for name, _ in open_elements])
+                    out.write(prolog)
+                    out.write("".join(tag + "\n" for _, tag in open_elements).encode(encoding, "xmlcharrefreplace"))
+                splits.clear()
+                out.write(buffer)
+                buffer_pos += len(buffer)
+                buffer.clear()
+                if not data:
+                    break
+    finally:
+        out.close()
+
+
 @importer("XML import", file_extension="xml", outputs=Config("xml_import.elements", []), config=[
     Config("xml_import.elements", [], description="List of elements and attributes in source document. Only needed for "
                                                   "renaming or when used as input to other annotations, as everything "
@@ -61,7 +149,7 @@ class XMLStructure(SourceStructureParser):
                                                                "removed from the text."),
     Config("xml_import.normalize", "NFC", description="Normalize input using any of the following forms: "
                                                       "'NFC', 'NFKC', 'NFD', and 'NFKD'.")
-], structure=XMLStructure)
+], structure=XMLStructure, splitter=split)
 def parse(doc: Document = Document(),
           source_dir: Source = Source(),
           elements: list = Config("xml_import.elements"),
@@ -94,8 +182,53 @@ def parse(doc: Document = Document(),
     parser.save()
 
 
+class ControlCharacterFilter:
+    """Read-only file wrapper removing control characters from the text read through it."""
+
+    def __init__(self, f, keep=("\n", "\t", "\r")):
+        """Wrap the text file object f."""
+        self.f = f
+        self.table = {c: None for c in chain(range(0x00, 0x20), range(0x7f, 0xa0))
+                      if chr(c) not in keep and unicodedata.category(chr(c)) == "Cc"}
+
+    def read(self, size=-1):
+        """Read from the wrapped file and return the data without control characters."""
+        return self.f.read(size).translate(self.table)
+
+    def close(self):
+        """Close the wrapped file."""
+        self.f.close()
+
+
+class _ElementState:
+    """Position tracking for an open element during parsing."""
+
+    __slots__ = ["element", "start_pos", "start_subpos", "child_subpos", "length", "text_done", "last_tail",
+                 "last_end_subpos", "name", "end_subpos"]
+
+    def __init__(self, element: etree.Element, start_pos: int, start_subpos: int):
+        self.element = element
+        self.start_pos = start_pos
+        self.start_subpos = start_subpos
+        self.child_subpos = start_subpos  # Sub-position of the latest child, also used as the final start sub-position
+        self.length = 0  # Length of the text seen so far inside the element
+        self.text_done = False  # Whether the element's own text has been handled
+        self.last_tail = None  # Length of the latest child's tail, or None if there are no children
+        self.last_end_subpos = 0  # End sub-position of the latest child
+        self.name = None  # Target name of the element, or None if the element is skipped
+        self.end_subpos = 0  # End sub-position of the element, set when the element ends
+
+
 class SparvXMLParser:
-    """XML parser class for parsing XML."""
+    """XML parser class for parsing XML.
+
+    The source is parsed incrementally with iterparse, keeping track of text positions with an explicit stack of
+    open elements instead of recursion. Completed elements are released from memory, and annotation files are written
+    in batches as soon as no open or future element with the same name can come before them in span order.
+    """
+
+    # Number of elements to collect before appending them to the annotation files
+    batch_size = 10000
 
     def __init__(self, elements: list, skip: list, header_elements: list, headers: list, encoding: str = util.UTF8,
                  source_dir: str = "src", prefix: str = "", keep_control_chars: bool = True, normalize: str = "NFC"):
@@ -109,12 +242,12 @@ class SparvXMLParser:
         self.header_elements = header_elements
         self.headers = {}
 
-        self.pos = 0  # Current position in the text data
-        self.subpos = 0  # Sub-position for tags with same position
-        self.tagstack = []
         self.targets = {}  # Index of elements and attributes that will be renamed during import
-        self.data = {}  # Metadata collected during parsing
+        self.data = {}  # Metadata and output state for every element, collected during parsing
+        self.header_data = {}  # Header metadata waiting to be bound to a target element
         self.text = []  # Text data of the document collected during parsing
+        self.pos = 0  # Current position in the text data
+        self.completed = 0  # Number of completed elements, used to keep elements with identical spans in order
 
         # Parse elements argument
 
@@ -144,12 +277,12 @@ class SparvXMLParser:
                     target_attr = target
                 self.targets.setdefault(element, {"attrs": {}})
                 self.targets[element]["target"] = target_element
-                self.data.setdefault(target_element, {"attrs": set(), "elements": []})
+                self._get_data(target_element)
                 if target_attr:
                     self.targets[element]["attrs"][attr] = target_attr
                     self.data[target_element]["attrs"].add(target_attr)
             else:
-                self.data.setdefault(element, {"attrs": set(), "elements": []})
+                self._get_data(element)
                 if attr:
                     self.data[element]["attrs"].add(attr)
 
@@ -166,28 +299,64 @@ class SparvXMLParser:
                 "target": elsplit(header_target)
             })
 
+        # All element names, in the order they were first completed (dict used as ordered set)
+        self.element_order = dict.fromkeys(self.data)
+
         self.skipped_elems = set(elsplit(elem) for elem in skip)
         assert self.skipped_elems.isdisjoint(all_elems), "skip and elements must be disjoint"
 
+    def _get_data(self, name):
+        """Return metadata and output state for element name, creating it if needed."""
+        if name not in self.data:
+            self.data[name] = {
+                "attrs": set(),  # All attributes seen for this element
+                "open": [],  # Start positions of open elements, outermost first
+                "completed": [],  # Heap of completed elements not yet ready to be written
+                "buffer": [],  # Elements ready to be written, in order
+                "written": 0,  # Number of elements written to disk
+                "written_attrs": set()  # Attributes with existing annotation files
+            }
+        return self.data[name]
+
+    def _append_text(self, text):
+        """Add text data to the document."""
+        self.text.append(text)
+        self.pos += len(text)
+
+    def _open(self, name, start_pos):
+        """Register an element that has just started."""
+        self._get_data(name)["open"].append(start_pos)
+
+    def _complete(self, name, start, end, attrs):
+        """Add a completed element and move all elements that are now in span order to the write buffer.
+
+        Elements are ordered by span (and by order of completion for identical spans). An element can't be preceded
+        by any element not yet completed if it starts before all open elements with the same name and before the
+        current position.
+        """
+        self.element_order[name] = None
+        data = self.data[name]
+        data["open"].pop()
+        heapq.heappush(data["completed"], (start, end, self.completed, attrs))
+        self.completed += 1
+        threshold = min(data["open"][0], self.pos) if data["open"] else self.pos
+        while data["completed"] and data["completed"][0][0][0] < threshold:
+            data["buffer"].append(heapq.heappop(data["completed"]))
+        if len(data["buffer"]) >= self.batch_size:
+            self._write(name)
+
     def parse(self, doc):
-        """Parse XML and build data structure."""
+        """Parse XML and write annotation files for everything but the text."""
         self.doc = doc
-        header_data = {}
 
-        # Source path
-        if ":" in doc:
-            doc, _, doc_chunk = doc.partition(":")
-            source_file = Path(self.source_dir, doc, doc_chunk + ".xml")
-        else:
-            source_file = Path(self.source_dir, doc + ".xml")
+        source_file = Source(self.source_dir).get_path(doc, "xml")
 
-        def handle_element(element):
+        def handle_element(state: _ElementState, end_pos: int, end_subpos: int):
             """Handle element renaming, skipping and collection of data."""
-            start, start_subpos, end, end_subpos, name_orig, attrs = element
+            element = state.element
+            name_orig = element.tag
+            attrs = dict(element.attrib)
 
-            # Handle possible skipping of element and attributes
-            if (name_orig, "") in self.skipped_elems:
-                return
             if (name_orig, "*") in self.skipped_elems:
                 attrs = {}
             for attr in attrs.copy():
@@ -195,38 +364,32 @@ class SparvXMLParser:
                     attrs.pop(attr)
 
             if name_orig in self.targets:
-                # Rename element and/or attributes
-                name = self.targets[name_orig]["target"]
+                # Rename attributes
                 attrs_tmp = {}
                 for attr in attrs:
                     attrs_tmp[self.targets[name_orig]["attrs"].get(attr, attr)] = attrs[attr]
                 attrs = attrs_tmp
-            else:
-                name = name_orig
 
-            self.data.setdefault(name, {"attrs": set(), "elements": []})
+            name = state.name
             self.data[name]["attrs"].update(set(attrs.keys()))
 
             # Add attribute data collected from header
-            if name in header_data:
-                attrs.update(header_data[name])
-                self.data[name]["attrs"].update(set(header_data[name].keys()))
-                del header_data[name]
+            if name in self.header_data:
+                attrs.update(self.header_data[name])
+                self.data[name]["attrs"].update(set(self.header_data[name].keys()))
+                del self.header_data[name]
 
-            self.data[name]["elements"].append(
-                (start, start_subpos, end, end_subpos, name_orig, attrs)
-            )
+            self._complete(name, (state.start_pos, state.child_subpos), (end_pos, end_subpos), attrs)
 
-        def handle_raw_header(element: etree.Element, start_pos: int, start_subpos: int):
+        def handle_raw_header(state: _ElementState):
             """Save full header XML as string."""
+            element = state.element
             # Save header as XML
             tmp_element = copy.deepcopy(element)
             tmp_element.tail = ""
-            self.data.setdefault(element.tag, {"attrs": {util.HEADER_CONTENTS}, "elements": []})
-            self.data[element.tag]["elements"].append(
-                (start_pos, start_subpos, start_pos, start_subpos, element.tag,
-                 {util.HEADER_CONTENTS: etree.tostring(tmp_element, method="xml", encoding="UTF-8").decode()})
-            )
+            self.data[element.tag]["attrs"].add(util.HEADER_CONTENTS)
+            self._complete(element.tag, (state.start_pos, state.start_subpos), (state.start_pos, state.start_subpos),
+                           {util.HEADER_CONTENTS: etree.tostring(tmp_element, method="xml", encoding="UTF-8").decode()})
 
             handle_header_data(element)
 
@@ -246,100 +409,157 @@ class SparvXMLParser:
                             header_value = header_element.text.strip()
 
                         if header_value:
-                            header_data.setdefault(header_source["target"][0], {})
-                            header_data[header_source["target"][0]][header_source["target"][1]] = header_value
-
-        def iter_tree(element: etree.Element, start_pos: int = 0, start_subpos: int = 0):
-            """Walk though whole XML and handle elements and text data."""
-            if (element.tag, "@contents") in self.skipped_elems:
-                # Skip whole element and all its contents
-                if element.tail:
-                    self.text.append(element.tail)
-                return 0, len(element.tail or ""), 0
-            elif element.tag in self.header_elements:
-                if element.tail:
-                    self.text.append(element.tail)
-                handle_raw_header(element, start_pos, start_subpos)
-                return 0, len(element.tail or ""), 0
-            elif element.tag in self.headers:
-                handle_header_data(element)
-            element_length = 0
-            if element.text:
-                element_length = len(element.text)
-                self.text.append(element.text)
-            child_tail = None
-            for child in element:
-                if not element_length:
-                    start_subpos += 1
-                else:
-                    start_subpos = 0
-                child_length, child_tail, end_subpos = iter_tree(child, start_pos + element_length, start_subpos)
-                element_length += child_length + child_tail
-            end_pos = start_pos + element_length
-            if child_tail == 0:
-                end_subpos += 1
-            else:
-                end_subpos = 0
-            handle_element([start_pos, start_subpos, end_pos, end_subpos, element.tag, element.attrib])
-            if element.tail:
-                self.text.append(element.tail)
-            return element_length, len(element.tail or ""), end_subpos
+                            self.header_data.setdefault(header_source["target"][0], {})
+                            self.header_data[header_source["target"][0]][header_source["target"][1]] = header_value
+
+        stack = []  # States of all open elements
+        ended = None  # State of the latest ended element, whose tail has not been handled yet
+        skip_depth = 0  # Depth inside an element whose contents are skipped
+        keep_subtree = 0  # Number of open elements whose subtree is needed for header data
+
+        def handle_text(state: _ElementState):
+            """Handle the text directly inside an element, before its first child."""
+            if not state.text_done:
+                state.text_done = True
+                if state.element.text:
+                    self._append_text(state.element.text)
+                    state.length += len(state.element.text)
+
+        def handle_tail(parent: _ElementState):
+            """Handle the tail of the latest ended child of parent, and release the child from memory."""
+            nonlocal ended
+            if ended is not None:
+                tail = ended.element.tail or ""
+                if tail:
+                    self._append_text(tail)
+                parent.length += ended.length + len(tail)
+                parent.last_tail = len(tail)
+                parent.last_end_subpos = ended.end_subpos
+                if not keep_subtree:
+                    parent.element.remove(ended.element)
+                ended = None
 
         if self.keep_control_chars:
-            tree = etree.parse(source_file)
-            root = tree.getroot()
+            source = open(source_file, "rb")
         else:
-            with open(source_file) as f:
-                text = f.read()
-            text = util.remove_control_characters(text)
-            root = etree.fromstring(text)
+            source = ControlCharacterFilter(open(source_file, encoding=self.encoding))
+
+        try:
+            for event, element in etree.iterparse(source, events=("start", "end")):
+                if skip_depth:
+                    # Inside skipped contents or header; the subtree is handled when the outermost element ends
+                    skip_depth += 1 if event == "start" else -1
+                    if skip_depth:
+                        continue
+
+                if event == "start":
+                    if stack:
+                        parent = stack[-1]
+                        handle_text(parent)
+                        handle_tail(parent)
+                        if not parent.length:
+                            parent.child_subpos += 1
+                        else:
+                            parent.child_subpos = 0
+                        state = _ElementState(element, parent.start_pos + parent.length, parent.child_subpos)
+                    else:
+                        state = _ElementState(element, 0, 0)
+                    stack.append(state)
+
+                    if (element.tag, "@contents") in self.skipped_elems:
+                        # Skip whole element and all its contents
+                        skip_depth = 1
+                    elif element.tag in self.header_elements:
+                        skip_depth = 1
+                        state.name = element.tag
+                        self._open(state.name, state.start_pos)
+                    else:
+                        if element.tag in self.headers:
+                            keep_subtree += 1
+                        if (element.tag, "") not in self.skipped_elems:
+                            state.name = self.targets[element.tag]["target"] if element.tag in self.targets \
+                                else element.tag
+                            self._open(state.name, state.start_pos)
+                else:
+                    state = stack.pop()
+                    if (element.tag, "@contents") in self.skipped_elems:
+                        state.length = 0
+                    elif element.tag in self.header_elements:
+                        state.length = 0
+                        handle_raw_header(state)
+                    else:
+                        handle_text(state)
+                        handle_tail(state)
+                        end_pos = state.start_pos + state.length
+                        if state.last_tail == 0:
+                            state.end_subpos = state.last_end_subpos + 1
+                        if element.tag in self.headers:
+                            handle_header_data(element)
+                            keep_subtree -= 1
+                        if state.name is not None:
+                            handle_element(state, end_pos, state.end_subpos)
+                    ended = state
+        finally:
+            source.close()
+
+        # Handle the tail of the root element
+        if ended is not None and ended.element.tail:
+            self._append_text(ended.element.tail)
+
+        if self.header_data:
+            log.warning("Some header data could not be bound to target elements.")
 
-        iter_tree(root)
+    def _full_name(self, element):
+        """Return element name with prefix."""
+        return "{}.{}".format(self.prefix, element) if self.prefix else element
+
+    def _write(self, element):
+        """Append buffered elements to the annotation files for the element."""
+        data = self.data[element]
+        is_header = element in self.header_elements
+        full_element = self._full_name(element)
+        buffer = [(start, end, attrs) for start, end, _, attrs in data["buffer"]]
+        append = data["written"] > 0
+
+        Output(full_element, doc=self.doc).write([(start, end) for start, end, _attrs in buffer], append=append)
+
+        for attr in data["attrs"]:
+            full_attr = self._full_name(attr)
+            values = [attrs.get(attr, "") for _start, _end, attrs in buffer]
+            if attr not in data["written_attrs"]:
+                # Attribute not seen before; add empty values for the elements already written
+                values = [""] * data["written"] + values
+                data["written_attrs"].add(attr)
+                attr_append = False
+            else:
+                attr_append = append
+            Output("{}:{}".format(full_element, full_attr), doc=self.doc).write(values, append=attr_append,
+                                                                                allow_newlines=is_header)
 
-        if header_data:
-            log.warning("Some header data could not be bound to target elements.")
+        data["written"] += len(buffer)
+        data["buffer"] = []
 
     def save(self):
-        """Save text data and annotation files to disk."""
+        """Write remaining annotations and save text data, structure and headers to disk."""
         text = unicodedata.normalize("NFC", "".join(self.text))
         Text(self.doc).write(text)
         structure = []
         header_elements = []
 
-        for element in self.data:
-            is_header = False
-            spans = []
-            attributes = {attr: [] for attr in self.data[element]["attrs"]}
-            for instance in self.data[element]["elements"]:
-                start, start_subpos, end, end_subpos, _original_element, attrs = instance
-                spans.append(((start, start_subpos), (end, end_subpos)))
-                for attr in attributes:
-                    attributes[attr].append(attrs.get(attr, ""))
+        for element in self.element_order:
+            data = self.data[element]
+            data["buffer"].extend(heapq.heappop(data["completed"]) for _ in range(len(data["completed"])))
+            if data["buffer"] or not data["written"]:
+                self._write(element)
 
-            full_element = "{}.{}".format(self.prefix, element) if self.prefix else element
+            full_element = self._full_name(element)
 
             if element in self.header_elements:
-                is_header = True
                 header_elements.append(full_element)
             else:
                 structure.append(full_element)
-
-            # Sort spans and annotations by span position (required by Sparv)
-            if attributes:
-                attr_names, attr_values = list(zip(*attributes.items()))
-                spans, *attr_values = list(zip(*sorted(zip(spans, *attr_values), key=lambda x: x[0])))
-                attributes = dict(zip(attr_names, attr_values))
-            else:
-                spans.sort()
-
-            Output(full_element, doc=self.doc).write(spans)
-
-            for attr in attributes:
-                full_attr = "{}.{}".format(self.prefix, attr) if self.prefix else attr
-                Output("{}:{}".format(full_element, full_attr), doc=self.doc).write(attributes[attr],
-                                                                                    allow_newlines=is_header)
-                if element not in self.header_elements:
-                    structure.append("{}:{}".format(full_element, full_attr))
+                for attr in self.data[element]["attrs"]:
+                    structure.append("{}:{}".format(full_element, self._full_name(attr)))
 
         # Save list of all elements and attributes to a file (needed for export)
         SourceStructure(self.doc).write(structure)
@@ -1,3 +1,5 @@
+from sparv.core.services import get_service_address, service
+from sparv.core.stats import model_loading
 from . import system, tagsets
 from .constants import *
 from .export import gather_annotations, get_annotation_names, get_header_names, scramble_spans
@@ -11,7 +11,7 @@ from abc import ABC, abstractmethod
 from typing import Any, List, Optional, Tuple, Union
 
 import sparv.core
-from sparv.core import io
+from sparv.core import io, stats
 from sparv.core.paths import models_dir
 
 log = logging.getLogger(__name__)
@@ -442,23 +442,14 @@ class Text:
 
     def read(self) -> str:
         """Get corpus text."""
-        text_file = io.get_annotation_path(self.doc, io.TEXT_FILE, data=True)
-        with open(text_file) as f:
-            text = f.read()
-        log.debug("Read %d chars: %s", len(text), text_file)
-        return text
+        return io.read_data(self.doc, io.TEXT_FILE)
 
     def write(self, text):
         """Write text to the designated file of a corpus.
 
         text is a unicode string.
         """
-        doc, _, _chunk = self.doc.partition(io.DOC_CHUNK_DELIM)
-        text_file = io.get_annotation_path(doc, io.TEXT_FILE, data=True)
-        os.makedirs(os.path.dirname(text_file), exist_ok=True)
-        with open(text_file, "w") as f:
-            f.write(text)
-        log.info("Wrote %d chars: %s", len(text), text_file)
+        io.write_data(self.doc, io.TEXT_FILE, text)
 
     def __repr__(self):
         return "<Text>"
@@ -476,12 +467,8 @@ class SourceStructure:
 
     def write(self, structure):
         """Sort the document's structural elements and write structure file."""
-        file_path = io.get_annotation_path(self.doc, io.STRUCTURE_FILE, data=True)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         structure.sort()
-        with open(file_path, "w") as f:
-            f.write("\n".join(structure))
-        log.info("Wrote: %s", file_path)
+        io.write_data(self.doc, io.STRUCTURE_FILE, "\n".join(structure))
 
 
 class Headers:
@@ -515,6 +502,21 @@ class AllDocuments(List[str]):
     """List with names of all source documents."""
 
 
+class DocumentChunks(List[str]):
+    """List with names of the documents that a source document was split into, in order."""
+
+    def __init__(self, items=(), doc: Optional[str] = None):
+        list.__init__(self, items)
+        self.doc = doc
+
+    def repeated_elements(self) -> List[List[str]]:
+        """Get the names of the elements that were repeated at the start of every chunk when splitting the source."""
+        manifest = io.read_chunk_manifest(self.doc) if self.doc else None
+        if not manifest or not manifest["chunks"]:
+            return [[] for _ in self]
+        return [chunk["repeated"] for chunk in manifest["chunks"]]
+
+
 class Config(str):
     """Class holding configuration key names."""
 
@@ -573,7 +575,7 @@ class Model(Base):
     def read(self):
         """Read arbitrary string data from file in models directory."""
         file_path = self.path
-        with open(file_path) as f:
+        with stats.model_loading(), open(file_path) as f:
             data = f.read()
         log.debug("Read %d bytes: %s", len(data), self.name)
         return data
@@ -591,7 +593,7 @@ class Model(Base):
     def read_pickle(self):
         """Read pickled data from file in models directory."""
         file_path = self.path
-        with open(file_path, "rb") as f:
+        with stats.model_loading(), open(file_path, "rb") as f:
             data = pickle.load(f)
         log.debug("Read %d bytes: %s", len(data), self.name)
         return data
@@ -649,6 +651,10 @@ class BinaryDir(str):
 class Source(str):
     """Path to directory containing input files."""
 
+    def get_path(self, doc: str, extension: str) -> pathlib.Path:
+        """Get path to the source file (or source chunk) of a document."""
+        return io.get_source_file(self, doc, extension)
+
 
 class Export(str):
     """Export directory and filename pattern."""
@@ -666,8 +672,9 @@ class ExportInput(str):
     def __new__(_cls, val: str, *args, **kwargs):
         return super().__new__(_cls, val)
 
-    def __init__(self, val: str, all_docs: bool = False, absolute_path: bool = False):
+    def __init__(self, val: str, all_docs: bool = False, all_chunks: bool = False, absolute_path: bool = False):
         self.all_docs = all_docs
+        self.all_chunks = all_chunks
         self.absolute_path = absolute_path
 
 
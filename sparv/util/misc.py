@@ -1,12 +1,19 @@
 """Misc util functions."""
 
 import logging
+import mmap
+import os
 import pathlib
+import pickle
 import re
+import struct
 import unicodedata
+import zlib
 from collections import defaultdict, OrderedDict
+from collections.abc import Mapping
 from typing import List, Optional, Union, Tuple
 
+from sparv.core import stats
 from .classes import Annotation, Model
 
 _log = logging.getLogger(__name__)
@@ -203,20 +210,162 @@ def test_lexicon(lexicon: dict, testwords):
         _log.info("  %s = %s", key, lexicon.get(key))
 
 
+# Loaded lexicons, kept for the lifetime of the worker process, keyed by path, modification time and index flag
+_lexicon_cache = {}
+
+
 class PickledLexicon:
-    """Read basic pickled lexicon and look up keys."""
+    """Read basic pickled lexicon and look up keys.
+
+    A lexicon is only read once per process, as long as the pickle file is unchanged. With index=True the lexicon is
+    converted to a memory mapped LexiconIndex the first time it is used, saved next to the pickle file. Later jobs
+    then only read the entries they look up, instead of unpickling the whole lexicon.
+    """
 
-    def __init__(self, picklefile: Union[pathlib.Path, Model], verbose=True):
+    def __init__(self, picklefile: Union[pathlib.Path, Model], verbose=True, index=False):
         """Read lexicon from picklefile."""
-        import pickle
-        picklefile_path: pathlib.Path = picklefile.path if isinstance(picklefile, Model) else picklefile
+        picklefile_path = pathlib.Path(picklefile.path if isinstance(picklefile, Model) else picklefile)
+        cache_key = (str(picklefile_path.resolve()), os.stat(picklefile_path).st_mtime_ns, index)
+        if cache_key in _lexicon_cache:
+            self.lexicon = _lexicon_cache[cache_key]
+            return
+
         if verbose:
             _log.info("Reading lexicon: %s", picklefile)
-        with open(picklefile_path, "rb") as F:
-            self.lexicon = pickle.load(F)
+        with stats.model_loading():
+            self.lexicon = LexiconIndex.load(picklefile_path) if index else _read_pickle(picklefile_path)
         if verbose:
             _log.info("OK, read %d words", len(self.lexicon))
+        _lexicon_cache[cache_key] = self.lexicon
 
     def lookup(self, key, default=set()):
         """Lookup a key in the lexicon."""
         return self.lexicon.get(key, default)
+
+    def lookup_many(self, keys, default=set()) -> dict:
+        """Look up all distinct keys in an iterable, and return a dictionary with the keys and their values."""
+        get = self.lexicon.get
+        return {key: get(key, default) for key in set(keys)}
+
+
+def _read_pickle(path: pathlib.Path):
+    """Unpickle the contents of a file."""
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class LexiconIndex(Mapping):
+    """Read-only lexicon with string keys, stored as a hash table in a memory mapped file.
+
+    The file consists of a header, a table of slots and the entries. Every slot holds the CRC32 of a key and the
+    offset of its entry, or zero if the slot is empty. Collisions are resolved by linear probing. Every entry holds
+    the key and its pickled value. Values are unpickled when first looked up.
+    """
+
+    _HEADER = struct.Struct("<16sQQQQ")  # Magic, source size, source modification time, number of slots, entries
+    _SLOT = struct.Struct("<IQ")  # Key hash, entry offset
+    _ENTRY = struct.Struct("<II")  # Key length, value length
+    _MAGIC = b"sparv-lexicon-1\n"
+
+    def __init__(self, path: pathlib.Path):
+        """Open index file."""
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.source_size, self.source_mtime, self._slots, self._len = self._HEADER.unpack_from(self._mm)
+        if magic != self._MAGIC:
+            raise ValueError(f"{path} is not a lexicon index")
+        self._mask = self._slots - 1
+        self._values = {}
+
+    @classmethod
+    def load(cls, picklefile: pathlib.Path) -> Union["LexiconIndex", dict]:
+        """Open the index of a pickled lexicon, building it first if it is missing or older than the pickle.
+
+        Falls back to the unpickled lexicon if it can't be indexed, or if the index file can't be written.
+        """
+        index_path = picklefile.with_name(picklefile.name + ".idx")
+        source = os.stat(picklefile)
+        try:
+            index = cls(index_path)
+            if (index.source_size, index.source_mtime) == (source.st_size, source.st_mtime_ns):
+                return index
+        except (OSError, ValueError, struct.error):
+            pass
+
+        lexicon = _read_pickle(picklefile)
+        if not all(isinstance(key, str) for key in lexicon):
+            return lexicon
+        # Write to a temporary file first, since other processes may be building the same index
+        tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        try:
+            cls.write(lexicon, tmp_path, source.st_size, source.st_mtime_ns)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            _log.warning("Could not save lexicon index %s: %s", index_path, e)
+            return lexicon
+        return cls(index_path)
+
+    @classmethod
+    def write(cls, lexicon: dict, path: pathlib.Path, source_size: int = 0, source_mtime: int = 0):
+        """Save a lexicon with string keys as an index file."""
+        slots = 1
+        while slots < 2 * len(lexicon):
+            slots *= 2
+        table = bytearray(cls._SLOT.size * slots)
+        offset = cls._HEADER.size + len(table)
+        with open(path, "wb") as f:
+            f.seek(offset)
+            for key, value in lexicon.items():
+                key = key.encode("UTF-8")
+                value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                key_hash = zlib.crc32(key)
+                slot = key_hash & (slots - 1)
+                while cls._SLOT.unpack_from(table, slot * cls._SLOT.size)[1]:
+                    slot = (slot + 1) & (slots - 1)
+                cls._SLOT.pack_into(table, slot * cls._SLOT.size, key_hash, offset)
+                f.write(cls._ENTRY.pack(len(key), len(value)) + key + value)
+                offset += cls._ENTRY.size + len(key) + len(value)
+            f.seek(0)
+            f.write(cls._HEADER.pack(cls._MAGIC, source_size, source_mtime, slots, len(lexicon)))
+            f.write(table)
+
+    def _find(self, key: str) -> Optional[int]:
+        """Get the offset of the value of a key, or None if the key is missing."""
+        key = key.encode("UTF-8")
+        key_hash = zlib.crc32(key)
+        slot = key_hash & self._mask
+        while True:
+            slot_hash, offset = self._SLOT.unpack_from(self._mm, self._HEADER.size + slot * self._SLOT.size)
+            if not offset:
+                return None
+            if slot_hash == key_hash:
+                key_length, _ = self._ENTRY.unpack_from(self._mm, offset)
+                start = offset + self._ENTRY.size
+                if self._mm[start:start + key_length] == key:
+                    return offset
+            slot = (slot + 1) & self._mask
+
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+        offset = self._find(key) if isinstance(key, str) else None
+        if offset is None:
+            raise KeyError(key)
+        key_length, value_length = self._ENTRY.unpack_from(self._mm, offset)
+        start = offset + self._ENTRY.size + key_length
+        value = self._values[key] = pickle.loads(self._mm[start:start + value_length])
+        return value
+
+    def __contains__(self, key):
+        return key in self._values or (isinstance(key, str) and self._find(key) is not None)
+
+    def __iter__(self):
+        for slot in range(self._slots):
+            _, offset = self._SLOT.unpack_from(self._mm, self._HEADER.size + slot * self._SLOT.size)
+            if offset:
+                key_length, _ = self._ENTRY.unpack_from(self._mm, offset)
+                start = offset + self._ENTRY.size
+                yield self._mm[start:start + key_length].decode("UTF-8")
+
+    def __len__(self):
+        return self._len
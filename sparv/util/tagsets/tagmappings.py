@@ -40,8 +40,14 @@ saldo_to_suc: 1-many mapping between Saldo and SUC
 saldo_to_granska: 1-many mapping between Saldo and Granska-ish
 saldo_to_parole: 1-many mapping between Saldo and Parole
 saldo_to_saldo: 1-many identity mapping of Saldo tags
+
+The saldo_to_* mappings (except saldo_to_saldo) are precomputed and loaded on first use.
 """
 
+import json
+from collections.abc import Mapping
+from pathlib import Path
+
 TAGSEP = "."
 
 
@@ -1344,34 +1350,85 @@ def _make_saldo_to_suc(compound=False):
     return tagmap
 
 
-saldo_to_suc = _make_saldo_to_suc()
-saldo_to_suc_compound = _make_saldo_to_suc(compound=True)  # For use with the compound module
+def _make_saldo_mappings():
+    """Derive the mappings from SALDO tags to SUC, Parole and Granska-ish tags."""
+    saldo_to_suc = _make_saldo_to_suc()
+    return {
+        "saldo_to_suc": saldo_to_suc,
+        "saldo_to_suc_compound": _make_saldo_to_suc(compound=True),  # For use with the compound module
+        "saldo_to_parole": dict((saldotag, set(suc_to_parole[suctag] for suctag in suctags))
+                                for saldotag, suctags in list(saldo_to_suc.items())),
+        "saldo_to_granska": dict((saldotag, set().union(*(suc_to_granska[suctag] for suctag in suctags)))
+                                 for saldotag, suctags in list(saldo_to_suc.items()))
+    }
+
+
+# Deriving the SALDO mappings takes a while, so they are generated once and shipped with Sparv in this file, and only
+# loaded when needed. Regenerate the file with utils/build_saldo_mappings.py after changing any of the tables above.
+SALDO_MAPPINGS_FILE = Path(__file__).with_name("saldo_mappings.json")
+SALDO_MAPPINGS = ("saldo_to_suc", "saldo_to_suc_compound", "saldo_to_parole", "saldo_to_granska")
+
+
+def write_saldo_mappings(path=SALDO_MAPPINGS_FILE):
+    """Derive the SALDO mappings and save them to a JSON file."""
+    saldo_mappings = dict((name, dict((saldotag, sorted(tags)) for saldotag, tags in tagmap.items()))
+                          for name, tagmap in _make_saldo_mappings().items())
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(saldo_mappings, f, sort_keys=True, separators=(",", ":"))
+        f.write("\n")
+
+
+def read_saldo_mappings(path=SALDO_MAPPINGS_FILE):
+    """Read the precomputed SALDO mappings from a JSON file."""
+    with open(path, encoding="utf-8") as f:
+        saldo_mappings = json.load(f)
+    return dict((name, dict((saldotag, set(tags)) for saldotag, tags in tagmap.items()))
+                for name, tagmap in saldo_mappings.items())
+
 
-saldo_to_parole = dict((saldotag, set(suc_to_parole[suctag] for suctag in suctags))
-                       for saldotag, suctags in list(saldo_to_suc.items()))
+class _LazyMappings(Mapping):
+    """Dictionary of tag mappings, where the SALDO mappings are read from file on first access."""
+
+    def __init__(self, data):
+        self._data = data
+
+    def _load(self):
+        self._data.update(read_saldo_mappings())
+
+    def __getitem__(self, key):
+        if key in SALDO_MAPPINGS and key not in self._data:
+            self._load()
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(list(self._data) + [name for name in SALDO_MAPPINGS if name not in self._data])
+
+    def __len__(self):
+        return len(set(self._data).union(SALDO_MAPPINGS))
+
+
+def __getattr__(name):
+    """Get the SALDO mappings as module attributes, loading them on first access."""
+    if name in SALDO_MAPPINGS:
+        return mappings[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-saldo_to_granska = dict((saldotag, set().union(*(suc_to_granska[suctag] for suctag in suctags)))
-                        for saldotag, suctags in list(saldo_to_suc.items()))
 
 saldo_to_saldo = dict((saldotag, {saldotag}) for saldotag in saldo_tags)
 
 
-mappings = {
+mappings = _LazyMappings({
     "granska_to_parole": granska_to_parole,
     "granska_to_suc": granska_to_suc,
     "parole_to_granska": parole_to_granska,
     "parole_to_suc": parole_to_suc,
-    "saldo_to_granska": saldo_to_granska,
-    "saldo_to_parole": saldo_to_parole,
     "saldo_to_saldo": saldo_to_saldo,
-    "saldo_to_suc_compound": saldo_to_suc_compound,
-    "saldo_to_suc": saldo_to_suc,
     "suc_descriptions": suc_descriptions,
     "suc_to_granska": suc_to_granska,
     "suc_to_parole": suc_to_parole,
     "suc_to_simple": suc_to_simple,
     "saldo_params_to_suc": saldo_params_to_suc,
-}
+})
 
 tags = {
     "granska_tags": granska_tags,
@@ -0,0 +1,112 @@
+"""Tests for multi-word expression matching in the SALDO annotator."""
+
+from sparv.modules.saldo import saldo
+
+
+def entry(lemgram, *following_words, gap_allowed=False, is_particle=False):
+    """Create a lexicon entry in the format returned by saldo.find_single_word()."""
+    return {"lem": [lemgram]}, [], [list(following_words)], gap_allowed, is_particle, ""
+
+
+def match(sentence, lexicon, max_gaps=1, skip_pos_check=False):
+    """Find multi-word expressions in a sentence of (word, msdtag) tuples, returning their refs and lemgrams."""
+    matcher = saldo.MultiwordMatcher(max_gaps, skip_pos_check)
+    for i, (word, msdtag) in enumerate(sentence):
+        matcher.add_token([word], str(i + 1), msdtag, lexicon.get(word.lower(), []))
+    return [(refs, annotation["lem"][0]) for refs, annotation in matcher.complete_multis]
+
+
+def multi(refs, lemgram):
+    """Create a completed multi-word expression."""
+    return [str(r) for r in refs], {"lem": [lemgram]}
+
+
+def test_contiguous_expression():
+    """Check that the words of an expression are found next to each other, ignoring case."""
+    lexicon = {"ta": [entry("ta_upp..vbm.1", "upp")]}
+    assert match([("Ta", "VB.PRS.AKT"), ("UPP", "PL")], lexicon) == [(["1", "2"], "ta_upp..vbm.1")]
+    assert match([("ta", "VB.PRS.AKT"), ("av", "PL")], lexicon) == []
+
+
+def test_gaps():
+    """Check that gaps are only allowed for expressions allowing them, and not more gaps than max_gaps."""
+    sentence = [("ta", "VB.PRS.AKT"), ("den", "PN.UTR.SIN.DEF.SUB"), ("inte", "AB"), ("upp", "PL")]
+    assert match(sentence, {"ta": [entry("ta_upp..vbm.1", "upp")]}) == []
+    assert match(sentence, {"ta": [entry("ta_upp..vbm.1", "upp", gap_allowed=True)]}) == [
+        (["1", "4"], "ta_upp..vbm.1")]
+
+    sentence = [("ta", "VB.PRS.AKT"), ("den", "PN.UTR.SIN.DEF.SUB"), ("på", "PL"), ("inte", "AB"), ("upp", "PL")]
+    lexicon = {"ta": [entry("ta_på_upp..vbm.1", "på", "upp", gap_allowed=True)]}
+    assert match(sentence, lexicon, max_gaps=1) == []
+    assert match(sentence, lexicon, max_gaps=2) == [(["1", "3", "5"], "ta_på_upp..vbm.1")]
+
+
+def test_optional_gap():
+    """Check that a '*' in an expression matches both with and without a gap."""
+    lexicon = {"ta": [entry("ta_upp..vbm.1", "*", "upp", gap_allowed=True)]}
+    assert match([("ta", "VB.PRS.AKT"), ("upp", "PL")], lexicon) == [(["1", "2"], "ta_upp..vbm.1")]
+    assert match([("ta", "VB.PRS.AKT"), ("den", "PN.UTR.SIN.DEF.SUB"), ("upp", "PL")], lexicon) == [
+        (["1", "3"], "ta_upp..vbm.1")]
+
+
+def test_pos_checks():
+    """Check the MSD tag requirements of particle, verb and noun expressions."""
+    lexicon = {"ta": [entry("ta_på..vbm.1", "på", is_particle=True)]}
+    assert match([("ta", "VB.PRS.AKT"), ("på", "PP")], lexicon) == []
+    assert match([("ta", "VB.PRS.AKT"), ("på", "PP")], lexicon, skip_pos_check=True) == [
+        (["1", "2"], "ta_på..vbm.1")]
+    assert match([("ta", "VB.PRS.AKT"), ("på", "PL")], lexicon) == [(["1", "2"], "ta_på..vbm.1")]
+
+    # Verb expressions need a verb, noun expressions a noun
+    assert match([("ta", "NN.UTR.SIN.IND.NOM"), ("på", "PL")], lexicon) == []
+    lexicon = {"ta": [entry("ta_på..nnm.1", "på")]}
+    assert match([("ta", "NN.UTR.SIN.IND.NOM"), ("på", "PL")], lexicon) == [(["1", "2"], "ta_på..nnm.1")]
+    assert match([("ta", "VB.PRS.AKT"), ("på", "PL")], lexicon) == []
+
+
+def test_no_verbs_in_gap_of_verb_expression():
+    """Check that verb expressions may not span over other verbs."""
+    sentence = [("ta", "VB.PRS.AKT"), ("gå", "VB.PRS.AKT"), ("upp", "PL")]
+    assert match(sentence, {"ta": [entry("ta_upp..vbm.1", "upp", gap_allowed=True)]}) == []
+    assert match(sentence, {"ta": [entry("ta_upp..nnm.1", "upp", gap_allowed=True)]}, skip_pos_check=True) == [
+        (["1", "3"], "ta_upp..nnm.1")]
+
+
+def test_expressions_sharing_words():
+    """Check that all expressions sharing the first words are found, in lexicon order."""
+    lexicon = {"ta": [entry("ta_upp..vbm.1", "upp"), entry("ta_upp_sig..vbm.1", "upp", "sig"),
+                      entry("ta_upp..vbm.2", "upp")]}
+    assert match([("ta", "VB.PRS.AKT"), ("upp", "PL"), ("sig", "PN.UTR.SIN.DEF.SUB")], lexicon) == [
+        (["1", "2"], "ta_upp..vbm.1"), (["1", "2"], "ta_upp..vbm.2"), (["1", "2", "3"], "ta_upp_sig..vbm.1")]
+
+
+def test_crossing_overlap():
+    """Check that of two crossing expressions (b1 a1 b2 a2) of the same part of speech, the later one is removed."""
+    multis = [multi([1, 3], "b..vbm.1"), multi([2, 4], "a..vbm.1")]
+    saldo.remove_unwanted_overlaps(multis)
+    assert multis == [multi([1, 3], "b..vbm.1")]
+
+    # Expressions of different parts of speech may overlap
+    multis = [multi([1, 3], "b..vbm.1"), multi([2, 4], "a..nnm.1")]
+    saldo.remove_unwanted_overlaps(multis)
+    assert multis == [multi([1, 3], "b..vbm.1"), multi([2, 4], "a..nnm.1")]
+
+
+def test_same_end_overlap():
+    """Check that of two expressions with the same last word (a1 b1 ab2), the one starting first is removed."""
+    multis = [multi([1, 3], "a..vbm.1"), multi([2, 3], "b..vbm.1")]
+    saldo.remove_unwanted_overlaps(multis)
+    assert multis == [multi([2, 3], "b..vbm.1")]
+
+    # Unless all words of the later expression are part of the earlier one
+    multis = [multi([1, 2, 3], "a..vbm.1"), multi([2, 3], "b..vbm.1")]
+    saldo.remove_unwanted_overlaps(multis)
+    assert multis == [multi([1, 2, 3], "a..vbm.1"), multi([2, 3], "b..vbm.1")]
+    assert saldo.find_unwanted_overlaps(multis, saldo._get_multiword_pos, check_subset=False) == {0}
+
+
+def test_nested_expressions_are_kept():
+    """Check that an expression enclosing another, or starting at the same word, is not removed."""
+    multis = [multi([1, 4], "a..vbm.1"), multi([2, 3], "b..vbm.1"), multi([1, 2], "c..vbm.1")]
+    saldo.remove_unwanted_overlaps(multis)
+    assert multis == [multi([1, 4], "a..vbm.1"), multi([2, 3], "b..vbm.1"), multi([1, 2], "c..vbm.1")]
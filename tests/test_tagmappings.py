@@ -0,0 +1,20 @@
+"""Tests for the precomputed tag mappings."""
+
+from sparv.util.tagsets import tagmappings
+
+
+def test_saldo_mappings_up_to_date(tmp_path):
+    """Check that the shipped SALDO mappings are identical to the ones derived from the tag tables."""
+    tmp_file = tmp_path / "saldo_mappings.json"
+    tagmappings.write_saldo_mappings(tmp_file)
+    assert tmp_file.read_text(encoding="utf-8") == tagmappings.SALDO_MAPPINGS_FILE.read_text(encoding="utf-8"), \
+        "SALDO mappings are outdated. Run utils/build_saldo_mappings.py to update them."
+
+
+def test_saldo_mappings_lazy_loading():
+    """Check that the SALDO mappings are available through the mappings dictionary and as module attributes."""
+    derived = tagmappings._make_saldo_mappings()
+    for name in tagmappings.SALDO_MAPPINGS:
+        assert name in tagmappings.mappings
+        assert tagmappings.mappings[name] == derived[name]
+        assert getattr(tagmappings, name) is tagmappings.mappings[name]
@@ -47,7 +47,7 @@ def cmp_workdir(gold_corpus_dir: pathlib.Path,
     """Recursively compare the workdir directories of gold_corpus and test_corpus."""
     if ignore is None:
         ignore = []
-    ignore.append(".log")
+    ignore.extend([".log", "@hashes", "@plan.json"])
     assert _cmp_dirs(gold_corpus_dir / pathlib.Path(GOLD_PREFIX + str(paths.work_dir)),
                      test_corpus_dir / paths.work_dir,
                      ignore=ignore
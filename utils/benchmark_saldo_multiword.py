@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+"""Benchmark multi-word expression matching in the SALDO annotator against the previous implementation.
+
+Sentences are generated from a synthetic lexicon with many particle verbs, where every token starts a number of
+multi-word expressions. The results of both implementations are compared before timing them.
+"""
+
+import argparse
+import random
+import re
+import time
+
+from sparv.modules.saldo import saldo
+
+parser = argparse.ArgumentParser(description="Benchmark multi-word expression matching in the SALDO annotator.")
+parser.add_argument("-s", "--sentences", type=int, default=200, help="number of sentences (default: 200)")
+parser.add_argument("-l", "--length", type=int, default=40, help="number of tokens per sentence (default: 40)")
+parser.add_argument("-e", "--expressions", type=int, default=20,
+                    help="number of expressions starting with each word (default: 20)")
+parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+
+VOCABULARY = ["ge", "ta", "gå", "slå", "stå", "upp", "av", "på", "in", "ut", "sig", "till", "efter", "om", "med"]
+MSD_TAGS = ["VB.PRS.AKT", "PL", "PP", "NN.UTR.SIN.IND.NOM", "AB", "PN.UTR.SIN.DEF.SUB"]
+
+
+################################################################################
+# Previous implementation
+################################################################################
+
+
+def old_find_multiword_expressions(incomplete_multis, complete_multis, thewords, ref, msdtag, max_gaps, ann_tags_words,
+                               msd_annotation, sent, skip_pos_check):
+    todelfromincomplete = []  # list to keep track of which expressions that have been completed
+
+    for i, x in enumerate(incomplete_multis):
+        # x = (annotations, following_words, [ref], gap_allowed, is_particle, [part-of-gap-boolean, gap_count])
+        seeking_word = x[1][0]  # The next word we are looking for in this multi-word expression
+
+        # Is a gap necessary in this position for this expression?
+        if seeking_word == "*":
+            if x[1][1].lower() in (w.lower() for w in thewords):
+                seeking_word = x[1][1]
+                del x[1][0]
+
+        # If current gap is greater than max_gaps, stop searching
+        if x[5][1] > max_gaps:
+            todelfromincomplete.append(i)
+        # Last word may not be PP if this is a particle-multi-word
+        elif seeking_word.lower() in (w.lower() for w in thewords) and (
+                skip_pos_check or not (len(x[1]) == 1 and x[4] and msdtag.startswith("PP"))):
+            x[5][0] = False     # last word was not a gap
+            del x[1][0]
+            x[2].append(ref)
+
+            # Is current word the last word we are looking for?
+            if len(x[1]) == 0:
+                todelfromincomplete.append(i)
+
+                # Create a list of msdtags of words belonging to the completed multi-word expr.
+                msdtag_list = [msd_annotation[sent[int(ref) - 1]] for ref in x[2]]
+
+                # For completed verb multis, check that at least one of the words is a verb:
+                if not skip_pos_check and "..vbm." in x[0]["lem"][0]:
+                    for tag in msdtag_list:
+                        if tag.startswith("VB"):
+                            complete_multis.append((x[2], x[0]))
+                            break
+
+                # For completed noun multis, check that at least one of the words is a noun:
+                elif not skip_pos_check and "..nnm." in x[0]["lem"][0]:
+                    for tag in msdtag_list:
+                        if tag[:2] in ("NN", "PM", "UO"):
+                            complete_multis.append((x[2], x[0]))
+                            break
+
+                else:
+                    complete_multis.append((x[2], x[0]))
+
+        else:
+            # We've reached a gap
+            # Are gaps allowed?
+            if x[3]:
+                # If previous word was NOT part of a gap, this is a new gap, so increment gap counter
+                if not x[5][0]:
+                    x[5][1] += 1
+                x[5][0] = True  # Mark that this word was part of a gap
+
+                # Avoid having another verb within a verb multi-word expression:
+                # delete current incomplete multi-word expr. if it starts with a verb and if current word has POS tag VB
+                if "..vbm." in x[0]["lem"][0] and msdtag.startswith("VB"):
+                    todelfromincomplete.append(i)
+
+            else:
+                # Gaps are not allowed for this multi-word expression
+                todelfromincomplete.append(i)
+
+    # Delete seeking words from incomplete_multis
+    for x in todelfromincomplete[::-1]:
+        del incomplete_multis[x]
+
+    # Collect possible multiword expressions:
+    # Is this word a possible beginning of a multi-word expression?
+    looking_for = [(annotation, words, [ref], gap_allowed, is_particle, [False, 0])
+                   for (annotation, _, wordslist, gap_allowed, is_particle, _) in ann_tags_words if wordslist
+                   for words in wordslist]
+    if len(looking_for) > 0:
+        incomplete_multis.extend(looking_for)
+
+
+def old_remove_unwanted_overlaps(complete_multis):
+    remove = set()
+    for ai, a in enumerate(complete_multis):
+        for b in complete_multis:
+            # Check if both are of same POS
+            a_pos = re.search(r"\.(\w\w?)m?\.", a[1]["lem"][0]).groups()[0]
+            b_pos = re.search(r"\.(\w\w?)m?\.", b[1]["lem"][0]).groups()[0]
+            if not a == b and a_pos == b_pos:
+                if b[0][0] < a[0][0] < b[0][-1] < a[0][-1]:
+                    # A case of b1 a1 b2 a2. Remove a.
+                    remove.add(ai)
+                elif a[0][0] < b[0][0] and a[0][-1] == b[0][-1] and not all((x in a[0]) for x in b[0]):
+                    # A case of a1 b1 ab2. Remove a.
+                    remove.add(ai)
+
+    for a in sorted(remove, reverse=True):
+        del complete_multis[a]
+
+
+################################################################################
+# Benchmark
+################################################################################
+
+
+def make_lexicon(rng, expressions):
+    """Create lexicon entries in the format returned by saldo.find_single_word()."""
+    lexicon = {}
+    for word in VOCABULARY:
+        entries = []
+        for n in range(expressions):
+            following_words = [rng.choice(VOCABULARY) for _ in range(rng.randint(1, 3))]
+            if rng.random() < 0.2:
+                following_words.insert(0, "*")
+            entries.append(({"lem": ["%s_%d..vbm.1" % (word, n)]}, [], [following_words], True, True, ""))
+        lexicon[word] = entries
+    return lexicon
+
+
+def lookup_sentences(lexicon, sentences):
+    """Get fresh copies of the lexicon entries for every token, since the previous implementation modifies them."""
+    return [(words, msd_tags, [[(annotation, tags, [list(w) for w in wordslist], gap_allowed, is_particle, prefix)
+                                for annotation, tags, wordslist, gap_allowed, is_particle, prefix in lexicon[word]]
+                               for word in words])
+            for words, msd_tags in sentences]
+
+
+def run_old(sentences):
+    """Find multi-word expressions with the previous implementation."""
+    results = []
+    for words, msd_tags, ann_tags_words in sentences:
+        incomplete_multis, complete_multis = [], []
+        sent = list(range(len(words)))
+        for i, word in enumerate(words):
+            old_find_multiword_expressions(incomplete_multis, complete_multis, [word], str(i + 1), msd_tags[i], 1,
+                                           ann_tags_words[i], msd_tags, sent, False)
+        old_remove_unwanted_overlaps(complete_multis)
+        results.append(complete_multis)
+    return results
+
+
+def run_new(sentences):
+    """Find multi-word expressions with saldo.MultiwordMatcher."""
+    results = []
+    for words, msd_tags, ann_tags_words in sentences:
+        matcher = saldo.MultiwordMatcher(1)
+        for i, word in enumerate(words):
+            matcher.add_token([word], str(i + 1), msd_tags[i], ann_tags_words[i])
+        saldo.remove_unwanted_overlaps(matcher.complete_multis)
+        results.append(matcher.complete_multis)
+    return results
+
+
+def benchmark(function, lexicon, sentences):
+    """Run function and return the results and the elapsed time."""
+    sentences = lookup_sentences(lexicon, sentences)
+    start = time.perf_counter()
+    results = function(sentences)
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    lexicon = make_lexicon(rng, args.expressions)
+    sentences = [([rng.choice(VOCABULARY) for _ in range(args.length)],
+                  [rng.choice(MSD_TAGS) for _ in range(args.length)]) for _ in range(args.sentences)]
+
+    old_results, old_time = benchmark(run_old, lexicon, sentences)
+    new_results, new_time = benchmark(run_new, lexicon, sentences)
+    assert old_results == new_results, "The implementations found different multi-word expressions"
+
+    print("Found %d multi-word expressions in %d sentences" % (sum(map(len, new_results)), len(sentences)))
+    print("Previous implementation: %.2f s" % old_time)
+    print("MultiwordMatcher:        %.2f s (%.1fx)" % (new_time, old_time / new_time))
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+
+"""Derive the mappings from SALDO tags to other tagsets and save them to the file shipped with Sparv."""
+
+from sparv.util.tagsets import tagmappings
+
+if __name__ == "__main__":
+    tagmappings.write_saldo_mappings()
+    print("Saved SALDO mappings to %s" % tagmappings.SALDO_MAPPINGS_FILE)